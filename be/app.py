@@ -1,202 +1,243 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, stream_with_context, send_file
 from flask_cors import CORS
 import requests
-from bs4 import BeautifulSoup
 import os
 import json
 from dotenv import load_dotenv
-from cerebras.cloud.sdk import Cerebras
 import hashlib
 from datetime import datetime
 import unicodedata
-from PIL import Image, ImageDraw, ImageFont
-from io import BytesIO
-import math
+import re
 import threading
 import time
 from fal import generate_image, generate_from_product
+from image_store import get_image_store
+from imaging import nearest_rendition
+from imaging_pool import ImagingPool
+from collage import render_collage, overlay_collages
+from canvas_store import CanvasStore, file_sha256, render_key
+from store import ProductStore, ExtractionStore
+from singleflight import SingleFlight
+import http_client
+from extraction import parse_page, read_capped
+from context_builder import build_context
+from structured_data import extract_structured_products, missing_fields, LLM_FILL_FIELDS
+from colors import ColorAllocator, MIN_COLOR_DISTANCE
+from llm_stream import ProductStreamParser, MalformedStreamError
+from llm_gateway import LLMGateway
+from templates import TemplateRegistry
+from jobs import JobStore, JobQueue
+from urls import canonicalize_url
 import base64
-import uuid
+import copy
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 
 load_dotenv()
 
 app = Flask(__name__)
-# Enable CORS for all routes and origins
-CORS(app, resources={r"/*": {"origins": "*"}})
+# Enable CORS for all routes and origins; the sidebar reads /cache ETags
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["ETag"])
 
 DATA_FOLDER = 'product_data'
-CACHE_FILE = os.path.join(DATA_FOLDER, 'db.json')
+CACHE_FILE = os.path.join(DATA_FOLDER, 'db.json')  # Legacy whole-file cache, migrated on startup
+PRODUCT_DB_FILE = os.path.join(DATA_FOLDER, 'products.db')
 
 # Create data folder if it doesn't exist
 if not os.path.exists(DATA_FOLDER):
     os.makedirs(DATA_FOLDER)
 
-def color_distance(color1, color2):
-    """
-    Calculate perceptual color distance between two hex colors.
-    Returns a value between 0 (identical) and ~765 (maximum difference).
-    """
-    # Convert hex to RGB
-    r1 = int(color1[0:2], 16)
-    g1 = int(color1[2:4], 16)
-    b1 = int(color1[4:6], 16)
-
-    r2 = int(color2[0:2], 16)
-    g2 = int(color2[2:4], 16)
-    b2 = int(color2[4:6], 16)
-
-    # Calculate weighted Euclidean distance (human eye is more sensitive to green)
-    # Using weights that account for human perception
-    r_weight = 2 if (r1 + r2) / 2 > 128 else 3
-    g_weight = 4
-    b_weight = 2 if (r1 + r2) / 2 <= 128 else 3
-
-    distance = math.sqrt(
-        r_weight * (r1 - r2) ** 2 +
-        g_weight * (g1 - g2) ** 2 +
-        b_weight * (b1 - b2) ** 2
-    )
-
-    return distance
+product_store = ProductStore(PRODUCT_DB_FILE, legacy_json_path=CACHE_FILE)
+
+# LLM results keyed by a hash of the normalized extraction request
+extraction_cache = ExtractionStore(PRODUCT_DB_FILE)
+extraction_cache_stats = {'hits': 0, 'misses': 0}
+_extraction_stats_lock = threading.Lock()
+
+# Per-retailer selectors learned from LLM extractions, tried before the LLM
+extraction_templates = TemplateRegistry(PRODUCT_DB_FILE)
+
+# Batch scraping: max URLs per request and pages scraped at once across batches
+BATCH_MAX_URLS = 500
+batch_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('BATCH_SCRAPE_WORKERS', 16)))
+
+# Collage image downloads run concurrently on a shared pool; images that
+# aren't in by the deadline get a placeholder tile
+COLLAGE_DOWNLOAD_WORKERS = int(os.environ.get('COLLAGE_DOWNLOAD_WORKERS', 16))
+COLLAGE_DOWNLOAD_DEADLINE = float(os.environ.get('COLLAGE_DOWNLOAD_DEADLINE', 8))
+collage_download_executor = ThreadPoolExecutor(max_workers=COLLAGE_DOWNLOAD_WORKERS)
+
+# In-flight scrapes keyed by URL hash, so duplicate requests wait for the first
+scrape_flights = SingleFlight()
+
+# How long /scrape/stream waits for a collage before giving up on it. The
+# stream holds a request thread meanwhile, so this is kept just above the
+# image download deadline; a collage that finishes later is still saved to
+# the cache entry and served by /collages/<url_hash>.
+COLLAGE_WAIT_TIMEOUT = float(os.environ.get('COLLAGE_WAIT_TIMEOUT', 20))
+
+# Smaller copies written next to each 1080p collage (longest side in px), so
+# canvas overlays and previews decode the nearest size instead of the original.
+# COLLAGE_WEBP=1 adds WebP copies alongside the JPEGs.
+COLLAGE_RENDITION_SIZES = [300, 600]
+COLLAGE_RENDITION_FORMATS = ('JPEG', 'WEBP') if os.environ.get('COLLAGE_WEBP', '').lower() in ('1', 'true') else ('JPEG',)
+
+# Shared Cerebras client with the global in-flight limit (LLM_MAX_CONCURRENCY),
+# retries and per-call token/latency accounting
+llm_gateway = LLMGateway()
+
+# Collage rendering and canvas compositing run in worker processes
+# (IMAGING_WORKERS, default one per core), started with the other background
+# workers in the serving process
+imaging_pool = ImagingPool()
+
+# Saved canvas images, deduplicated by content hash and reference counted;
+# unreferenced ones are removed by `python canvas_store.py gc`
+canvas_store = CanvasStore(os.path.join(DATA_FOLDER, 'canvas'), PRODUCT_DB_FILE)
+
+# Scaled collage overlays are cached per imaging worker, each with its share
+# of THUMBNAIL_CACHE_BYTES; save_canvas pins each room image to one worker so
+# its overlays stay cached between saves. Hits and misses are summed here for
+# /stats.
+overlay_cache_stats = {'hits': 0, 'misses': 0}
+_overlay_stats_lock = threading.Lock()
+
+# In-process read-through cache of the parsed catalog, serving the full
+# /cache listing and the color allocator's seed. It is keyed by the on-disk
+# signature of the database (so writes from other processes are noticed)
+# and by a generation counter bumped on every local write.
+_catalog_cache = {'data': None, 'signature': None, 'generation': -1}
+_catalog_generation = 0
+_catalog_lock = threading.Lock()
+catalog_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
 
 def get_existing_colors():
     """
-    Get all existing color IDs from the cache
+    Get the color IDs of all cached products, once per product (so each is
+    released once when its entry is replaced)
     """
-    cache = load_cache()
-    existing_colors = set()
+    # Read-only, so the shared catalog needs no copy
+    try:
+        cache = _get_catalog()
+    except Exception as e:
+        print(f"Error loading cache: {e}")
+        cache = {}
+    existing_colors = []
 
     for item in cache.values():
         products = item.get('products', [])
         for product in products:
             color_id = product.get('id')
             if color_id and len(color_id) == 6:
-                existing_colors.add(color_id)
+                existing_colors.append(color_id)
 
     return existing_colors
 
+# Long-lived allocator, seeded from the catalog on first use
+color_allocator = ColorAllocator(MIN_COLOR_DISTANCE, seed_loader=get_existing_colors)
+
 def generate_bright_color_id(product_unique):
     """
     Generate a 6-character hex color code that's bright, vibrant, and unique
     """
-    # Get existing colors to avoid collisions
-    existing_colors = get_existing_colors()
-
-    # Minimum distance threshold to consider colors different enough
-    MIN_COLOR_DISTANCE = 100  # Adjust this for more/less distinction
-
-    # Try up to 50 variations to find a unique color
-    for attempt in range(50):
-        # Generate initial hash with attempt number for variation
-        hash_input = f"{product_unique}_{attempt}" if attempt > 0 else product_unique
-        base_hash = hashlib.md5(hash_input.encode()).hexdigest()
-
-        # Extract RGB components from hash
-        r = int(base_hash[:2], 16)
-        g = int(base_hash[2:4], 16)
-        b = int(base_hash[4:6], 16)
-
-        # Ensure brightness: at least one channel > 200, and total > 400
-        max_val = max(r, g, b)
-        if max_val < 200:
-            # Scale up the brightest channel
-            scale = 220 / max_val
-            r = min(255, int(r * scale))
-            g = min(255, int(g * scale))
-            b = min(255, int(b * scale))
-
-        # Ensure vibrancy (avoid grays)
-        if abs(r - g) < 30 and abs(g - b) < 30 and abs(r - b) < 30:
-            # Boost the dominant color from hash
-            hash_val = int(base_hash[6:8], 16)
-            boost_index = (hash_val + attempt) % 3
-            if boost_index == 0:
-                r = min(255, r + 80)
-                g = max(0, g - 30)
-                b = max(0, b - 30)
-            elif boost_index == 1:
-                g = min(255, g + 80)
-                r = max(0, r - 30)
-                b = max(0, b - 30)
-            else:
-                b = min(255, b + 80)
-                r = max(0, r - 30)
-                g = max(0, g - 30)
-
-        # Add variation based on attempt number for more diversity
-        if attempt > 0:
-            # Rotate hue slightly with each attempt
-            rotation = (attempt * 30) % 360
-            # Simple hue rotation approximation
-            if rotation < 120:
-                r = min(255, r + rotation // 3)
-                g = max(0, g - rotation // 6)
-            elif rotation < 240:
-                g = min(255, g + (rotation - 120) // 3)
-                b = max(0, b - (rotation - 120) // 6)
-            else:
-                b = min(255, b + (rotation - 240) // 3)
-                r = max(0, r - (rotation - 240) // 6)
-
-        # Ensure total brightness
-        total = r + g + b
-        if total < 400:
-            # Boost all channels proportionally
-            boost = (450 - total) / 3
-            r = min(255, int(r + boost))
-            g = min(255, int(g + boost))
-            b = min(255, int(b + boost))
-
-        # Generate the color ID
-        color_id = f"{r:02x}{g:02x}{b:02x}"
-
-        # Check if this color is sufficiently different from existing colors
-        is_unique = True
-        for existing_color in existing_colors:
-            if color_distance(color_id, existing_color) < MIN_COLOR_DISTANCE:
-                is_unique = False
-                break
+    return color_allocator.allocate(product_unique)
 
-        if is_unique:
-            return color_id
+def _catalog_signature():
+    """mtime/size of the database and its WAL, used to detect outside writes"""
+    signature = []
+    for path in (PRODUCT_DB_FILE, PRODUCT_DB_FILE + '-wal'):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+def invalidate_catalog_cache():
+    """Drop the in-memory catalog after a write from this process"""
+    global _catalog_generation
+    with _catalog_lock:
+        _catalog_generation += 1
+        if _catalog_cache['data'] is not None:
+            catalog_cache_stats['invalidations'] += 1
+        _catalog_cache['data'] = None
+
+def _get_catalog():
+    """Return the parsed catalog, reloading it only if the store changed"""
+    signature = _catalog_signature()
+    with _catalog_lock:
+        generation = _catalog_generation
+        if (_catalog_cache['data'] is not None
+                and _catalog_cache['signature'] == signature
+                and _catalog_cache['generation'] == generation):
+            catalog_cache_stats['hits'] += 1
+            return _catalog_cache['data']
+        catalog_cache_stats['misses'] += 1
+
+    # Load outside the lock; the signature was taken first, so a concurrent
+    # write makes this snapshot look stale rather than fresh
+    data = product_store.all()
+    with _catalog_lock:
+        if generation == _catalog_generation:
+            _catalog_cache.update(data=data, signature=signature, generation=generation)
+    return data
+
+def get_cached_entry(url_hash):
+    """Load a single cached entry, or None if the URL hasn't been scraped"""
+    # A primary-key read; the catalog cache is only worth it for listings,
+    # and is dropped on every write anyway
+    return product_store.get(url_hash)
+
+def put_cached_entry(url_hash, entry):
+    """Insert or replace a single cached entry"""
+    previous = product_store.get(url_hash)
+    product_store.put(url_hash, entry)
+    invalidate_catalog_cache()
+    # A refresh allocates new colors for its products, so the replaced
+    # products' colors are free again
+    for product in (previous or {}).get('products', []):
+        if product.get('id'):
+            color_allocator.release(product['id'])
+
+def update_cached_entry(url_hash, **fields):
+    """Merge fields into a single cached entry without touching the others"""
+    entry = product_store.update(url_hash, **fields)
+    invalidate_catalog_cache()
+    return entry
 
-    # If we couldn't find a unique color after 50 attempts,
-    # return the last generated one (better than nothing)
-    return color_id
+def get_url_hash(url):
+    """Generate a hash for the canonical URL to use as cache key"""
+    return hashlib.md5(canonicalize_url(url).encode()).hexdigest()
 
-def get_contrast_color(hex_color):
-    """
-    Determine whether to use black or white text based on background color
+def find_cached_entry(url):
     """
-    # Convert hex to RGB
-    r = int(hex_color[0:2], 16)
-    g = int(hex_color[2:4], 16)
-    b = int(hex_color[4:6], 16)
-    
-    # Calculate luminance using W3C formula
-    luminance = (0.299 * r + 0.587 * g + 0.114 * b) / 255
-    
-    # Return black for light backgrounds, white for dark
-    return 'black' if luminance > 0.5 else 'white'
+    Look up url's cache entry, falling back to the raw-URL key used before
+    URLs were canonicalized
 
-def load_cache():
-    """Load cache from db.json file"""
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
-
-def save_cache(cache):
-    """Save cache to db.json file"""
-    with open(CACHE_FILE, 'w') as f:
-        json.dump(cache, f, indent=2)
+    Returns:
+        tuple: (url_hash, entry) where entry is None on a miss and url_hash
+            is the key the entry lives under (the canonical key on a miss)
+    """
+    url_hash = get_url_hash(url)
+    entry = get_cached_entry(url_hash)
+    if entry is None:
+        legacy_hash = hashlib.md5(url.encode()).hexdigest()
+        if legacy_hash != url_hash:
+            entry = get_cached_entry(legacy_hash)
+            if entry is not None:
+                return legacy_hash, entry
+    return url_hash, entry
+
+def fetch_collage_tile(img_url):
+    """
+    Download an image through the image store, checked out so it isn't
+    evicted before the collage is rendered
+    """
+    return get_image_store().checkout(img_url, timeout=5)
 
-def get_url_hash(url):
-    """Generate a hash for the URL to use as cache key"""
-    return hashlib.md5(url.encode()).hexdigest()
+def release_collage_tile(future):
+    if not future.cancelled() and future.exception() is None:
+        get_image_store().release(future.result())
 
 def create_product_collage_sync(products, url_hash):
     """Create a 1080p collage of product images with title (synchronous version)"""
@@ -209,99 +250,112 @@ def create_product_collage_sync(products, url_hash):
     if not image_urls:
         return None
     
+    futures = {}
     try:
-        # Get product color ID
-        product_id = product.get('id', 'cccccc')  # Default to light gray if no ID
-        
-        # Create 1920x1080 canvas with product color as background
-        bg_color = f"#{product_id}"
-        collage = Image.new('RGB', (1920, 1080), color=bg_color)
-        draw = ImageDraw.Draw(collage)
-        
-        # Determine text color based on background
-        text_color = get_contrast_color(product_id)
-        
-        # Add product ID and title at the top
-        title = product.get('title', 'Product')
-        # Show color ID prominently with title as subtitle
-        display_text = f"#{product_id.upper()} - {title[:50]}" if len(title) > 50 else f"#{product_id.upper()} - {title}"
+        # Download all images at once; tiles are placed by index, so the
+        # grid keeps the original order whatever finishes first
+        futures = {
+            collage_download_executor.submit(fetch_collage_tile, img_url): idx
+            for idx, img_url in enumerate(image_urls)
+        }
+        tile_paths = [None] * len(image_urls)
         try:
-            # Try to use a larger font, fallback to default if not available
-            font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 48)
-        except:
-            font = ImageFont.load_default()
-
-        # Use the same color for title area - no overlay, just the product color
-        # Add text directly on the colored background
-        draw.text((50, 25), display_text, fill=text_color, font=font)
-        
-        # Calculate grid layout
-        num_images = len(image_urls)
-        cols = math.ceil(math.sqrt(num_images))
-        rows = math.ceil(num_images / cols)
-        
-        # Available space (leaving space for title)
-        available_width = 1920
-        available_height = 980  # 1080 - 100 for title
-        
-        img_width = available_width // cols
-        img_height = available_height // rows
-        
-        # Download and place images
-        for idx, img_url in enumerate(image_urls):
-            try:
-                # Download image
-                response = requests.get(img_url, timeout=5)
-                img = Image.open(BytesIO(response.content))
-                
-                # Calculate position
-                row = idx // cols
-                col = idx % cols
-                x = col * img_width
-                y = 100 + (row * img_height)  # 100px offset for title
-                
-                # Resize image to fit cell while maintaining aspect ratio
-                img.thumbnail((img_width - 10, img_height - 10), Image.Resampling.LANCZOS)
-                
-                # Center image in cell
-                img_x = x + (img_width - img.width) // 2
-                img_y = y + (img_height - img.height) // 2
-                
-                # Paste image
-                collage.paste(img, (img_x, img_y))
-                
-                # Draw border
-                draw.rectangle([x, y, x + img_width, y + img_height], outline='gray', width=1)
-                
-            except Exception as e:
-                print(f"Error loading image {img_url}: {e}")
-                continue
+            for future in as_completed(futures, timeout=COLLAGE_DOWNLOAD_DEADLINE):
+                idx = futures[future]
+                try:
+                    tile_paths[idx] = future.result()['path']
+                except Exception as e:
+                    print(f"Error loading image {image_urls[idx]}: {e}")
+        except FuturesTimeoutError:
+            missed = sum(not future.done() for future in futures)
+            print(f"Collage {url_hash}: {missed} images missed the {COLLAGE_DOWNLOAD_DEADLINE}s deadline")
+            for future in futures:
+                future.cancel()
         
-        # Save collage with optimized JPEG compression
-        image_filename = f"{url_hash}.jpg"
-        image_path = os.path.join(DATA_FOLDER, image_filename)
-        # Use JPEG with optimized quality for smaller file size
-        collage.save(image_path, 'JPEG', quality=85, optimize=True)
+        # Decoding, compositing and encoding run on the imaging pool; images
+        # that failed or missed the deadline get a placeholder tile
+        image_path = os.path.abspath(os.path.join(DATA_FOLDER, f"{url_hash}.jpg"))
+        renditions = imaging_pool.run(
+            render_collage, product, tile_paths, image_path,
+            COLLAGE_RENDITION_SIZES, COLLAGE_RENDITION_FORMATS
+        )
         
         # Update cache with collage path
-        cache = load_cache()
-        if url_hash in cache:
-            cache[url_hash]['collage_path'] = os.path.abspath(image_path)
-            save_cache(cache)
+        update_cached_entry(url_hash, collage_path=image_path, collage_renditions=renditions)
         
         print(f"Collage created successfully: {image_path}")
-        return os.path.abspath(image_path)
+        return image_path
     
     except Exception as e:
         print(f"Error creating collage: {e}")
         return None
+    finally:
+        # Tiles still downloading past the deadline are released once done
+        for future in futures:
+            future.add_done_callback(release_collage_tile)
+
+# Collage generation runs on a fixed worker pool fed by a durable job table
+collage_jobs = JobQueue(
+    JobStore(PRODUCT_DB_FILE),
+    create_product_collage_sync,
+    workers=int(os.environ.get('COLLAGE_WORKERS', 2)),
+    max_pending=int(os.environ.get('COLLAGE_QUEUE_MAX', 200))
+)
+
+_background_started = False
+_background_lock = threading.Lock()
+
+def start_background_workers():
+    """
+    Start the imaging pool and collage workers, once, in the process that
+    serves requests
+
+    Not done at import: under the debug reloader the watching parent
+    process imports this module too, and scripts importing it shouldn't
+    start workers. The imaging pool warms up on a background thread, so
+    no request waits for it; imaging tasks run inline until it's ready.
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+        threading.Thread(target=start_imaging_pool, name='imaging-pool-start', daemon=True).start()
+        collage_jobs.start()
+
+def start_imaging_pool():
+    try:
+        imaging_pool.start()
+    except Exception as e:
+        print(f"Imaging pool failed to start, imaging will run inline: {e}")
+
+@app.before_request
+def ensure_background_workers():
+    # Covers servers that import the app instead of running __main__
+    start_background_workers()
 
 def create_product_collage_async(products, url_hash):
-    """Create product collage asynchronously in background thread"""
-    thread = threading.Thread(target=create_product_collage_sync, args=(products, url_hash))
-    thread.daemon = True  # Daemon thread will not prevent app from shutting down
-    thread.start()
-    print(f"Started async collage generation for {url_hash}")
+    """
+    Queue collage generation for url_hash on the collage worker pool
+
+    Returns:
+        bool: False if the queue is full and no collage will be generated
+    """
+    queued = collage_jobs.submit(url_hash, products)
+    if queued:
+        print(f"Queued collage generation for {url_hash}")
+    return queued
+
+def wait_for_collage(url_hash, timeout=None):
+    """
+    Block until url_hash's queued collage generation (if any) finishes
+
+    Returns:
+        str: Absolute collage path, or None if it wasn't created in time
+    """
+    collage_jobs.wait(url_hash, timeout)
+    expected_path = os.path.abspath(os.path.join(DATA_FOLDER, f"{url_hash}.jpg"))
+    return expected_path if os.path.exists(expected_path) else None
 
 @app.route('/')
 def root():
@@ -310,109 +364,148 @@ def root():
         "status": "active"
     })
 
-@app.route('/scrape', methods=['GET'])
-def scrape():
-    url = request.args.get('url')
-    if not url:
-        return jsonify({
-            "error": "URL parameter is required"
-        }), 400
+def serve_cached_entry(cached_data, url_hash):
+    """Mark a cached entry for the response, kicking off its collage if missing"""
+    cached_data['from_cache'] = True
+    # Check if collage exists, create async if not
+    if 'collage_path' not in cached_data and cached_data.get('products'):
+        # Generate expected path
+        expected_path = os.path.abspath(os.path.join(DATA_FOLDER, f"{url_hash}.jpg"))
+        if os.path.exists(expected_path):
+            # Collage exists, add path
+            cached_data['collage_path'] = expected_path
+            update_cached_entry(url_hash, collage_path=expected_path)
+        else:
+            # Start async generation
+            cached_data['collage_generating'] = create_product_collage_async(cached_data.get('products', []), url_hash)
+    return cached_data
 
+def scrape_url(url, refresh=False, on_event=None):
+    """
+    Scrape a product page, or serve it from cache, and extract its products
+
+    Args:
+        url (str): Product page URL
+        refresh (bool): Re-check a cached page with a conditional request
+        on_event (callable): Optional on_event(name, data) progress callback,
+            see fetch_and_extract(). Coalesced scrapes only get the result.
+
+    Returns:
+        tuple: (response payload dict, HTTP status code)
+    """
     # Check cache first
-    cache = load_cache()
-    url_hash = get_url_hash(url)
+    url_hash, cached_data = find_cached_entry(url)
     
-    if url_hash in cache:
-        cached_data = cache[url_hash]
-        cached_data['from_cache'] = True
-        # Check if collage exists, create async if not
-        if 'collage_path' not in cached_data and cached_data.get('products'):
-            # Generate expected path
-            expected_path = os.path.abspath(os.path.join(DATA_FOLDER, f"{url_hash}.jpg"))
-            if os.path.exists(expected_path):
-                # Collage exists, add path
-                cached_data['collage_path'] = expected_path
-                cache[url_hash]['collage_path'] = expected_path
-                save_cache(cache)
-            else:
-                # Start async generation
-                create_product_collage_async(cached_data.get('products', []), url_hash)
-                cached_data['collage_generating'] = True
-        return jsonify(cached_data)
-    
-    headers = {
-        'accept-encoding': 'gzip, deflate, zstd',
-        'accept-language': 'en-US,en;q=0.9,en-GB;q=0.8',
-        'cache-control': 'max-age=0',
-        'priority': 'u=0, i',
-        'sec-ch-ua': '"Not;A=Brand";v="99", "Microsoft Edge";v="139", "Chromium";v="139"',
-        'sec-ch-ua-mobile': '?0',
-        'sec-ch-ua-platform': '"macOS"',
-        'sec-fetch-dest': 'document',
-        'sec-fetch-mode': 'navigate',
-        'sec-fetch-site': 'none',
-        'sec-fetch-user': '?1',
-        'upgrade-insecure-requests': '1',
-        'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36 Edg/139.0.0.0'
-    }
+    if cached_data is not None and not refresh:
+        return serve_cached_entry(cached_data, url_hash), 200
     
+    # Concurrent scrapes of the same page share one fetch + extraction
+    (result, status_code), shared = scrape_flights.do(
+        url_hash, fetch_and_extract, url, url_hash, cached_data, on_event=on_event
+    )
+    if shared:
+        result['coalesced'] = True
+    return result, status_code
+
+def fetch_and_extract(url, url_hash, cached_data=None, on_event=None):
+    """
+    Fetch a page, extract its products and store them under url_hash
+
+    Args:
+        url (str): Product page URL
+        url_hash (str): Cache key for url
+        cached_data (dict): Existing entry, if any; its validators are sent
+            so an unchanged page is answered from cache
+        on_event (callable): Optional on_event(name, data) called as each
+            stage finishes: "fetched", "parsed", "product" (once per
+            product, as soon as it is extracted), "products" and "colors"
+
+    Returns:
+        tuple: (response payload dict, HTTP status code)
+    """
+    emit = on_event or (lambda name, data: None)
+    start_time = time.time()
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        title = soup.find('title').text if soup.find('title') else 'No title found'
-        
-        # Remove only scripts and styles, keep all other content
-        for element in soup(['script', 'style', 'noscript']):
-            element.decompose()
-        
-        # Get ALL text content from the entire page
-        text_content = soup.get_text(separator=' ', strip=True)
+        # Stay within the per-host concurrency/rate limits while on the network
+        with http_client.host_slot(url):
+            if cached_data is not None:
+                # Refresh: only re-parse and re-extract if the page actually changed
+                response = http_client.conditional_get(
+                    url,
+                    etag=cached_data.get('http_etag'),
+                    last_modified=cached_data.get('http_last_modified'),
+                    headers=http_client.BROWSER_HEADERS,
+                    timeout=10,
+                    stream=True
+                )
+                if response.status_code == 304:
+                    response.close()
+                    emit('fetched', {"status_code": 304, "not_modified": True})
+                    cached_data = serve_cached_entry(cached_data, url_hash)
+                    cached_data['not_modified'] = True
+                    return cached_data, 200
+            else:
+                response = http_client.get(url, headers=http_client.BROWSER_HEADERS, timeout=10, stream=True)
+            response.raise_for_status()
+            
+            # Cap the body size and parse with the fastest available backend
+            html, truncated = read_capped(response)
+        emit('fetched', {
+            "status_code": response.status_code,
+            "bytes": len(html),
+            "truncated": truncated,
+            "elapsed": round(time.time() - start_time, 3)
+        })
         
-        # Extract ALL images from the page
-        images_with_context = []
-        for img in soup.find_all('img'):
-            img_src = img.get('src', '')
-            # Skip very small images (likely icons)
-            if img_src and not any(skip in img_src.lower() for skip in ['icon', 'logo', 'svg', 'data:image']):
-                img_data = {
-                    'src': img_src,
-                    'alt': img.get('alt', ''),
-                    'title': img.get('title', ''),
-                    'context': ''
-                }
-                
-                # Get surrounding text context
-                parent = img.parent
-                if parent:
-                    img_data['context'] = parent.get_text(strip=True)[:300]
-                
-                images_with_context.append(img_data)
+        page = parse_page(html)
+        title = page['title']
+        text_content = page['content']
+        emit('parsed', {
+            "title": title,
+            "parser": page['parser'],
+            "text_blocks": len(page['text_blocks']),
+            "images": len(page['product_images']),
+            "has_structured_data": bool(page['structured_data'].get('json_ld') or page['structured_data'].get('meta')),
+            "elapsed": round(time.time() - start_time, 3)
+        })
         
         scraped_data = {
             "url": url,
             "status_code": response.status_code,
             "title": title,
             "content": text_content,
+            "text_blocks": page['text_blocks'],
             "content_length": len(text_content),
-            "product_images": images_with_context[:50]
+            "content_truncated": truncated,
+            "product_images": page['product_images'],
+            "structured_data": page['structured_data']
         }
         
-        # Always analyze with Cerebras AI
+        # Analyze with structured data first, Cerebras AI for the rest
         try:
-            products = analyze_products(scraped_data, url)
-            
-            # Get URL hash
-            url_hash = get_url_hash(url)
+            products, extraction_path = extract_products(
+                scraped_data, url, tree=page['tree'],
+                on_product=lambda product: emit('product', {
+                    "product": product,
+                    "elapsed": round(time.time() - start_time, 3)
+                })
+            )
+            emit('products', {
+                "products": products,
+                "extraction_path": extraction_path,
+                "elapsed": round(time.time() - start_time, 3)
+            })
+            emit('colors', {"ids": [product['id'] for product in products]})
             
             result = {
                 "url": url,
                 "status_code": response.status_code,
                 "title": title,
                 "products": products,
-                "timestamp": datetime.now().isoformat()
+                "extraction_path": extraction_path,
+                "content_truncated": truncated,
+                "timestamp": datetime.now().isoformat(),
+                **http_client.get_validators(response)
             }
             
             # Generate expected collage path
@@ -421,63 +514,229 @@ def scrape():
             result['collage_generating'] = True
             
             # Save to cache first
-            cache = load_cache()
-            cache[url_hash] = result.copy()
-            save_cache(cache)
+            put_cached_entry(url_hash, result)
             
             # Start async collage generation AFTER returning response
-            create_product_collage_async(products, url_hash)
+            if not create_product_collage_async(products, url_hash):
+                result['collage_generating'] = False
             
             result['from_cache'] = False
-            return jsonify(result)
+            return result, 200
         except Exception as e:
-            return jsonify({
+            return {
                 "url": url,
                 "status_code": response.status_code,
                 "title": title,
                 "error": str(e),
                 "products": [],
                 "from_cache": False
-            })
+            }, 200
         
     except requests.exceptions.RequestException as e:
-        return jsonify({
+        return {
             "error": f"Failed to fetch URL: {str(e)}",
             "url": url
-        }), 500
+        }, 500
     except Exception as e:
-        return jsonify({
+        return {
             "error": f"Error processing content: {str(e)}",
             "url": url
-        }), 500
+        }, 500
 
-def analyze_products(scraped_data, url):
+@app.route('/scrape', methods=['GET'])
+def scrape():
     """
-    Analyzes scraped content and images to extract furniture product information
+    Scrape a product page and extract products with Cerebras AI
+
+    Query parameters:
+        url: Product page URL (required)
+        refresh: "1" to re-check a cached page with a conditional request;
+                 a 304 from the retailer returns the cached entry unchanged
+
+    The result's content_truncated is true when the page was cut off at
+    the download size cap, so products further down may be missing.
+    """
+    url = request.args.get('url')
+    if not url:
+        return jsonify({
+            "error": "URL parameter is required"
+        }), 400
+
+    refresh = request.args.get('refresh', '').lower() in ('1', 'true')
+    result, status_code = scrape_url(url, refresh=refresh)
+    return jsonify(result), status_code
+
+@app.route('/scrape/stream', methods=['GET'])
+def scrape_stream():
     """
-    client = Cerebras(
-        api_key=os.environ.get("CEREBRAS_API_KEY")
+    Scrape a product page, streaming progress as server-sent events
+
+    Takes the same query parameters as /scrape. Events, in order:
+        fetched   {"status_code", "bytes", "truncated", "elapsed"}
+        parsed    {"title", "parser", "text_blocks", "images", ...}
+        product   {"product", "elapsed"} once per product, as it is extracted
+        products  {"products", "extraction_path", "elapsed"}
+        colors    {"ids"}
+        result    the /scrape payload
+        collage   {"collage_path", "collage_renditions"} (null if it wasn't
+                  created within COLLAGE_WAIT_TIMEOUT)
+        done      {"duration"}
+
+    Cached and coalesced scrapes skip straight to result. A "scrape_error"
+    event {"error"} replaces result if the scrape raised; it isn't named
+    "error" so it can't be confused with EventSource's connection errors.
+    """
+    url = request.args.get('url')
+    if not url:
+        return jsonify({
+            "error": "URL parameter is required"
+        }), 400
+    refresh = request.args.get('refresh', '').lower() in ('1', 'true')
+
+    events = queue.Queue()
+
+    def run():
+        try:
+            result, status_code = scrape_url(url, refresh=refresh, on_event=lambda name, data: events.put((name, data)))
+            events.put(('result', {**result, "status_code": status_code}))
+        except Exception as e:
+            events.put(('scrape_error', {"error": str(e)}))
+        events.put(None)
+
+    def sse(name, data):
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+    def generate():
+        start_time = time.time()
+        threading.Thread(target=run, daemon=True).start()
+        result = None
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            name, data = event
+            if name == 'result':
+                result = data
+            yield sse(name, data)
+
+        if result is not None and result.get('products'):
+            url_hash, _ = find_cached_entry(url)
+            collage_path = wait_for_collage(url_hash, timeout=COLLAGE_WAIT_TIMEOUT)
+            entry = product_store.get(url_hash) if collage_path else None
+            yield sse('collage', {
+                "collage_path": collage_path,
+                "collage_renditions": (entry or {}).get('collage_renditions')
+            })
+        yield sse('done', {"duration": round(time.time() - start_time, 2)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
     )
-    
-    # Prepare the context for the AI - include MORE content
-    context = f"""
-    Page Title: {scraped_data.get('title', '')}
-    
-    Full Page Content (first 10000 chars):
-    {scraped_data.get('content', '')[:]}
-    
-    Product Images Found ({len(scraped_data.get('product_images', []))} total):
+
+@app.route('/scrape/batch', methods=['POST'])
+def scrape_batch():
     """
-    
-    # Include more images for better analysis
-    for img in scraped_data.get('product_images', [])[:30]:
-        context += f"\n- Image: {img['src']}"
-        if img['alt']:
-            context += f"\n  Alt text: {img['alt']}"
-        if img['context']:
-            context += f"\n  Context: {img['context'][:200]}"
-    
-    system_prompt = """You are a furniture product data extractor. Analyze the ENTIRE webpage content and ALL images to extract complete product information. Ensure that all image URLs are related to the product, and are not of other product images or logos on the page. Remove all parameters from the image URLs (such as ?f=u).
+    Scrape many product pages concurrently, streaming results as they finish
+
+    Expected JSON body:
+    {
+        "urls": ["https://...", "https://..."],
+        "refresh": false  # optional, same as /scrape?refresh=1
+    }
+
+    Responds with newline-delimited JSON, one line per URL in completion order:
+        {"index": 0, "url": "...", "status_code": 200, "result": { /scrape payload }}
+    followed by a summary line:
+        {"done": true, "total": 2, "succeeded": 2, "failed": 0, "duration": 1.23}
+
+    Cached URLs are answered from the request thread before any page is
+    fetched, and items that aren't URL strings get an error line with
+    status_code 400. Page fetches respect per-host concurrency and rate
+    limits, and LLM extraction is bounded by the LLM gateway's
+    LLM_MAX_CONCURRENCY.
+    """
+    data = request.json or {}
+    urls = data.get('urls')
+    if not isinstance(urls, list) or not urls:
+        return jsonify({
+            "success": False,
+            "error": "urls must be a non-empty list"
+        }), 400
+    if len(urls) > BATCH_MAX_URLS:
+        return jsonify({
+            "success": False,
+            "error": f"At most {BATCH_MAX_URLS} urls per batch"
+        }), 400
+    refresh = bool(data.get('refresh'))
+
+    # Scrape each distinct page once, even if it is listed several times
+    invalid = []
+    indexes_by_hash = {}
+    for index, url in enumerate(urls):
+        if not isinstance(url, str) or not url.strip():
+            invalid.append(index)
+            continue
+        indexes_by_hash.setdefault(get_url_hash(url), []).append(index)
+
+    def generate():
+        start_time = time.time()
+        counts = {'succeeded': 0, 'failed': 0}
+
+        def lines(indexes, result, status_code):
+            ok = status_code == 200 and not result.get('error')
+            for index in indexes:
+                counts['succeeded' if ok else 'failed'] += 1
+                yield json.dumps({
+                    "index": index,
+                    "url": urls[index],
+                    "status_code": status_code,
+                    "result": result
+                }) + "\n"
+
+        # Cache hits don't need a worker; look them up before queueing misses
+        hits = []
+        misses = []
+        for indexes in indexes_by_hash.values():
+            url_hash, cached_data = find_cached_entry(urls[indexes[0]])
+            if cached_data is not None and not refresh:
+                hits.append((indexes, url_hash, cached_data))
+            else:
+                misses.append(indexes)
+        futures = {
+            batch_executor.submit(scrape_url, urls[indexes[0]], refresh): indexes
+            for indexes in misses
+        }
+
+        for index in invalid:
+            yield from lines([index], {"error": "url must be a non-empty string"}, 400)
+        for indexes, url_hash, cached_data in hits:
+            yield from lines(indexes, serve_cached_entry(cached_data, url_hash), 200)
+        for future in as_completed(futures):
+            try:
+                result, status_code = future.result()
+            except Exception as e:
+                result, status_code = {"error": str(e)}, 500
+            yield from lines(futures[future], result, status_code)
+        yield json.dumps({
+            "done": True,
+            "total": len(urls),
+            "succeeded": counts['succeeded'],
+            "failed": counts['failed'],
+            "duration": round(time.time() - start_time, 2)
+        }) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def build_llm_context(scraped_data):
+    """Render scraped page content and images into the LLM user message"""
+    context, stats = build_context(scraped_data)
+    print(f"LLM context: {stats['tokens_before']} -> {stats['tokens_after']} tokens "
+          f"({stats['blocks_selected']}/{stats['blocks_total']} blocks, budget {stats['token_budget']})")
+    return context
+
+PRODUCT_SYSTEM_PROMPT = """You are a furniture product data extractor. Analyze the ENTIRE webpage content and ALL images to extract complete product information. Ensure that all image URLs are related to the product, and are not of other product images or logos on the page. Remove all parameters from the image URLs (such as ?f=u).
     
     IMPORTANT: Extract ALL available details including prices, dimensions, materials, colors, SKUs, and any other specifications mentioned ANYWHERE on the page.
     
@@ -500,8 +759,89 @@ def analyze_products(scraped_data, url):
     }
     
     Look through the ENTIRE content for product details - they may be scattered throughout the page."""
+
+FILL_SYSTEM_PROMPT = """You are a furniture product data extractor. The products below were already identified on the webpage. For each one, find ONLY the requested fields anywhere in the page content.
+    
+    Return a JSON object with the following structure, one entry per product in the same order:
+    {
+        "products": [
+            {"title": "Product name as given", "<field>": "value or empty string"}
+        ]
+    }"""
+
+LLM_MODEL = "gpt-oss-120b"
+
+# Query strings on image URLs (resizing, cache busting) vary between loads
+# of the same page, so they are left out of the extraction cache key
+IMAGE_QUERY_PATTERN = re.compile(r'(https?://[^\s?#]+)[?#]\S*')
+
+def extraction_context_hash(system_prompt, context):
+    """Cache key for an LLM extraction request"""
+    normalized = IMAGE_QUERY_PATTERN.sub(r'\1', ' '.join(context.split()))
+    return hashlib.sha256(f"{LLM_MODEL}\n{system_prompt}\n{normalized}".encode()).hexdigest()
+
+def parse_products_response(response):
+    """Pull the products list out of an LLM completion"""
+    # Try to parse the JSON response
+    try:
+        json_start = response.find('{')
+        json_end = response.rfind('}') + 1
+        if json_start != -1 and json_end > json_start:
+            json_str = response[json_start:json_end]
+            parsed = json.loads(json_str)
+            return parsed.get('products', [])
+    except json.JSONDecodeError:
+        return []
+    
+    return []
+
+def llm_extract_products(scraped_data, fill_products=None, fill_fields=None, on_product=None):
+    """
+    Extract products from scraped content with Cerebras AI
     
-    completion = client.chat.completions.create(
+    The completion is streamed and its products array parsed as it arrives,
+    so on_product sees each product as soon as its object closes, and the
+    stream is dropped as soon as the array is complete or malformed.
+    
+    Args:
+        scraped_data (dict): Page title, content and product_images
+        fill_products (list): Products already known from structured data;
+            when given, only fill_fields are requested for them
+        fill_fields (list): Field names to fill in
+        on_product (callable): Optional on_product(product) called with each
+            raw product, in order
+    
+    Returns:
+        list: Raw product dicts, without color IDs
+    """
+    context = build_llm_context(scraped_data)
+    system_prompt = PRODUCT_SYSTEM_PROMPT
+    max_tokens = 20000
+    if fill_products:
+        system_prompt = FILL_SYSTEM_PROMPT
+        context += "\n\nProducts:\n" + "\n".join(f"- {product['title']}" for product in fill_products)
+        context += "\n\nFields to find: " + ", ".join(fill_fields)
+        # Short, fixed-shape answer
+        max_tokens = 4000
+    
+    # Identical page content has already been paid for, whatever its URL
+    context_hash = extraction_context_hash(system_prompt, context)
+    cached = extraction_cache.get(context_hash)
+    with _extraction_stats_lock:
+        extraction_cache_stats['hits' if cached is not None else 'misses'] += 1
+    if cached is not None:
+        print(f"Extraction cache hit for context {context_hash[:12]}")
+        for product in cached:
+            if on_product:
+                on_product(product)
+        return cached
+    
+    start = time.perf_counter()
+    parser = ProductStreamParser()
+    # on_product may finalize products in place; the cache keeps them raw
+    raw_products = []
+    first_product_at = None
+    deltas = llm_gateway.stream_chat(
         messages=[
             {
                 "role": "system",
@@ -512,45 +852,170 @@ def analyze_products(scraped_data, url):
                 "content": context
             }
         ],
-        model="gpt-oss-120b",
-        stream=False,
-        max_completion_tokens=20000,
+        model=LLM_MODEL,
+        max_completion_tokens=max_tokens,
         temperature=0.7,
         top_p=0.8
     )
+    try:
+        for delta in deltas:
+            for product in parser.feed(delta):
+                if first_product_at is None:
+                    first_product_at = time.perf_counter() - start
+                raw_products.append(copy.deepcopy(product))
+                if on_product:
+                    on_product(product)
+            if parser.done:
+                break
+    except MalformedStreamError as e:
+        # Keep the products that closed before the output went wrong
+        print(f"Aborted malformed LLM stream after {len(parser.products)} products: {e}")
+    finally:
+        # Drops the rest of the completion once the array is complete
+        deltas.close()
     
-    response = completion.choices[0].message.content
+    extraction_templates.record_llm_duration(time.perf_counter() - start)
+    if first_product_at is not None:
+        print(f"LLM stream: first product after {first_product_at:.2f}s, "
+              f"{len(parser.products)} in {time.perf_counter() - start:.2f}s")
+    
+    if parser.done:
+        extraction_cache.put(context_hash, raw_products)
+        return parser.products
+    if not parser.products:
+        # No recognizable products array; try the whole output as one object
+        products = parse_products_response(parser.text)
+        for product in products:
+            if on_product:
+                on_product(product)
+        return products
+    # Truncated output: usable, but not worth caching
+    return parser.products
+
+def finalize_product(product, url, index):
+    """Assign a color ID and clean up Unicode in the index-th product of url"""
+    # Generate a bright color ID for each product (6-char hex color)
+    product_unique = f"{url}_{product.get('title', '')}_{index}"
+    product_id = generate_bright_color_id(product_unique)
+    product['id'] = product_id  # e.g., "ff6b9d" (bright color)
+
+    # Clean up Unicode characters in all product fields
+    for key, value in product.items():
+        if isinstance(value, str) and key != 'id':  # Don't modify the ID
+            # Normalize Unicode to ASCII equivalent
+            value = unicodedata.normalize('NFKD', value)
+            # Replace any remaining non-ASCII characters
+            value = value.encode('ascii', 'ignore').decode('ascii')
+            product[key] = value
+    return product
+
+def finalize_products(products, url):
+    """Assign color IDs and clean up Unicode in extracted products"""
+    for i, product in enumerate(products):
+        finalize_product(product, url, i)
+    return products
+
+def analyze_products(scraped_data, url):
+    """
+    Analyzes scraped content and images to extract furniture product information
+    """
+    return finalize_products(llm_extract_products(scraped_data), url)
+
+def extract_products(scraped_data, url, tree=None, on_product=None):
+    """
+    Extract products, using the page's structured data when it is sufficient
+    
+    JSON-LD/OpenGraph products are used as-is when they carry every
+    LLM_FILL_FIELDS value. Otherwise the retailer's learned template is
+    tried, then the LLM is only asked for the missing fields, and pages
+    without usable structured data go through the full LLM extraction.
+    
+    Args:
+        scraped_data (dict): Output of the page scrape
+        url (str): Page URL, whose domain selects the template
+        tree: Parsed lxml document; templates are skipped without it
+        on_product (callable): Optional on_product(product) called with each
+            finalized product; full LLM extractions call it as each product
+            streams in rather than at the end
+    
+    Returns:
+        tuple: (products, extraction_path) where extraction_path is
+            "structured_data", "template", "structured_data+llm" or "llm"
+    """
+    def finished(products, extraction_path):
+        finalize_products(products, url)
+        for product in products:
+            if on_product:
+                on_product(product)
+        return products, extraction_path
+    
+    products = extract_structured_products(scraped_data.get('structured_data'))
+    fields = sorted({field for product in products for field in missing_fields(product, LLM_FILL_FIELDS)})
+    if products and not fields:
+        return finished(products, 'structured_data')
+    
+    # Templates describe a single product page
+    if tree is not None and len(products) <= 1:
+        product = extraction_templates.extract(url, tree)
+        if product is not None:
+            if products:
+                # Structured data is more reliable for the fields it has
+                product.update({key: value for key, value in products[0].items() if value})
+            return finished([product], 'template')
+    
+    if not products:
+        # Finalize each product as soon as its object closes in the stream
+        raw_products = []
+        
+        def finalize_streamed(product):
+            raw_products.append(copy.deepcopy(product))
+            finalize_product(product, url, len(raw_products) - 1)
+            if on_product:
+                on_product(product)
+        
+        products = llm_extract_products(scraped_data, on_product=finalize_streamed)
+        # Learn (or relearn) the retailer's layout from single-product pages
+        if tree is not None and len(raw_products) == 1:
+            extraction_templates.learn(url, tree, raw_products[0])
+        return products, 'llm'
     
-    # Try to parse the JSON response
     try:
-        json_start = response.find('{')
-        json_end = response.rfind('}') + 1
-        if json_start != -1 and json_end > json_start:
-            json_str = response[json_start:json_end]
-            parsed = json.loads(json_str)
-            products = parsed.get('products', [])
-
-            # Clean up Unicode characters and add unique IDs
-            for i, product in enumerate(products):
-                # Generate a bright color ID for each product (6-char hex color)
-                product_unique = f"{url}_{product.get('title', '')}_{i}"
-                product_id = generate_bright_color_id(product_unique)
-                product['id'] = product_id  # e.g., "ff6b9d" (bright color)
-
-                # Clean up Unicode characters in all product fields
-                for key, value in product.items():
-                    if isinstance(value, str) and key != 'id':  # Don't modify the ID
-                        # Normalize Unicode to ASCII equivalent
-                        value = unicodedata.normalize('NFKD', value)
-                        # Replace any remaining non-ASCII characters
-                        value = value.encode('ascii', 'ignore').decode('ascii')
-                        product[key] = value
-
-            return products
-    except json.JSONDecodeError:
-        return []
+        filled = llm_extract_products(scraped_data, fill_products=products, fill_fields=fields)
+    except Exception as e:
+        # The structured products are still usable without the extra fields
+        print(f"Error filling {fields} with LLM: {e}")
+        return finished(products, 'structured_data')
     
-    return []
+    for i, product in enumerate(products):
+        # Match by position, which the prompt asks for, falling back to title
+        match = filled[i] if i < len(filled) else {}
+        match = next((item for item in filled if item.get('title') == product['title']), match)
+        for field in fields:
+            if not product.get(field) and match.get(field):
+                product[field] = match[field]
+    
+    if tree is not None and len(products) == 1:
+        extraction_templates.learn(url, tree, products[0])
+    return finished(products, 'structured_data+llm')
+
+def write_canvas_upload(upload, path):
+    """
+    Write an uploaded canvas image to path
+
+    Args:
+        upload: A multipart file part, streamed to disk in chunks, or a
+            base64 data URL from the JSON form
+        path (str): Destination file
+
+    Returns:
+        int: Bytes written
+    """
+    if isinstance(upload, str):
+        with open(path, 'wb') as f:
+            f.write(base64.b64decode(upload.split(',')[1]))  # Remove data:image/png;base64, prefix
+    else:
+        upload.save(path)
+    return os.path.getsize(path)
 
 @app.route('/save_canvas', methods=['POST'])
 def save_canvas():
@@ -558,7 +1023,12 @@ def save_canvas():
     Save canvas images (original and annotated) to product_data folder
     Optionally append multiple collage images at specified positions
 
-    Expected JSON body:
+    Expected multipart/form-data body:
+        original_image: Original image file
+        annotated_image: Annotated image file
+        collages: JSON array of collages with their positions (optional)
+
+    or, as before, a JSON body:
     {
         "original_image": "data:image/...",  # Base64 encoded original image
         "annotated_image": "data:image/...",  # Base64 encoded annotated image
@@ -567,93 +1037,86 @@ def save_canvas():
             {"path": "/path/to/collage2.jpg", "x": 300, "y": 400}
         ]
     }
+
+    Images are stored under product_data/canvas by content hash, so the
+    returned paths are shared by every save of the same bytes. The response
+    reports bytes_received (request body and each image on disk),
+    decode_seconds (time spent parsing and writing the images), which images
+    were already stored, whether the collage composite was reused, and
+    overlay_cache: the {"hits", "misses"} of the worker's scaled-collage
+    cache when collages were pasted.
     """
     try:
-        data = request.json
+        decode_start = time.perf_counter()
+        if request.mimetype == 'multipart/form-data':
+            # Parts are spooled to temporary files while parsing rather than
+            # held as strings, and copied to their destination in chunks
+            original_upload = request.files.get('original_image')
+            annotated_upload = request.files.get('annotated_image')
+            collages = json.loads(request.form.get('collages') or '[]')
+        else:
+            data = request.json or {}
+            original_upload = data.get('original_image')
+            annotated_upload = data.get('annotated_image')
+            collages = data.get('collages', [])
 
-        if not data.get('original_image') or not data.get('annotated_image'):
+        if not original_upload or not annotated_upload:
             return jsonify({
                 "success": False,
                 "error": "Both original_image and annotated_image are required"
             }), 400
 
-        # Generate unique timestamp-based filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        unique_id = str(uuid.uuid4())[:8]
+        # Write both uploads to temporary files, then store them by content
+        # hash so a room image re-saved every generate cycle is kept once
+        original_tmp = canvas_store.temp_path()
+        original_size = write_canvas_upload(original_upload, original_tmp)
+        annotated_tmp = canvas_store.temp_path()
+        annotated_size = write_canvas_upload(annotated_upload, annotated_tmp)
+        decode_seconds = time.perf_counter() - decode_start
 
-        # Decode and save original image
-        original_data = data['original_image'].split(',')[1]  # Remove data:image/png;base64, prefix
-        original_bytes = base64.b64decode(original_data)
-        original_filename = f"original_{timestamp}_{unique_id}.png"
-        original_path = os.path.join(DATA_FOLDER, original_filename)
-
-        with open(original_path, 'wb') as f:
-            f.write(original_bytes)
-
-        # Decode and save annotated image
-        annotated_data = data['annotated_image'].split(',')[1]
-        annotated_bytes = base64.b64decode(annotated_data)
-        annotated_filename = f"annotated_{timestamp}_{unique_id}.png"
-        annotated_path = os.path.join(DATA_FOLDER, annotated_filename)
-
-        # Check if we need to append collages
-        collages = data.get('collages', [])
-        collages_appended = 0
-        collage_positions = []
+        original_sha256, original_path, original_deduplicated = canvas_store.add_file(original_tmp)
+        annotated_input_sha256 = file_sha256(annotated_tmp)
 
         # Configurable scale factor for collage size (0.5 = 50%, 0.75 = 75%, 1.0 = 100%)
         COLLAGE_SCALE_FACTOR = 0.75  # Adjust this to control collage size
+        base_max_size = 400  # Base maximum dimension
+        max_size = int(base_max_size * COLLAGE_SCALE_FACTOR)
 
-        if collages:
-            # Load annotated image
-            annotated_img = Image.open(BytesIO(annotated_bytes))
-
-            # Process each collage
-            for collage_data in collages:
-                collage_path = collage_data.get('path')
-                center_x = collage_data.get('x', 0)
-                center_y = collage_data.get('y', 0)
-
-                # Check if collage exists and load it
-                if collage_path and os.path.exists(collage_path):
-                    try:
-                        collage_img = Image.open(collage_path)
-
-                        # Resize collage based on scale factor
-                        base_max_size = 400  # Base maximum dimension
-                        max_size = int(base_max_size * COLLAGE_SCALE_FACTOR)
-                        collage_img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-
-                        # Calculate position to center collage at specified point
-                        paste_x = int(center_x - collage_img.width // 2)
-                        paste_y = int(center_y - collage_img.height // 2)
-
-                        # Ensure paste position is within bounds
-                        paste_x = max(0, min(paste_x, annotated_img.width - collage_img.width))
-                        paste_y = max(0, min(paste_y, annotated_img.height - collage_img.height))
-
-                        # Paste collage onto annotated image
-                        annotated_img.paste(collage_img, (paste_x, paste_y))
-
-                        collages_appended += 1
-                        collage_positions.append({"x": round(center_x), "y": round(center_y)})
-                        print(f"  Collage {collages_appended} appended at position ({center_x:.0f}, {center_y:.0f})")
-
-                    except Exception as e:
-                        print(f"  Error loading collage {collage_path}: {e}")
-
-            if collages_appended > 0:
-                # Save the modified annotated image
-                output_buffer = BytesIO()
-                annotated_img.save(output_buffer, format='PNG')
-                annotated_bytes = output_buffer.getvalue()
-
-        with open(annotated_path, 'wb') as f:
-            f.write(annotated_bytes)
-
+        # Paste collages centered on their pins; the PNG is decoded, composited
+        # and re-encoded on the imaging pool, off this request thread, on the
+        # worker that holds this room's scaled collages. The same annotated
+        # upload with the same collages reuses the earlier composite instead.
+        collage_positions = []
+        cache_stats = None
+        composite_reused = False
+        key = render_key(annotated_input_sha256, collages, max_size) if collages else None
+        render = canvas_store.find_render(key) if key else None
+        if render is not None:
+            os.remove(annotated_tmp)
+            annotated_sha256, annotated_path, collage_positions = render
+            annotated_deduplicated = composite_reused = True
+        else:
+            if collages:
+                collage_positions, cache_stats = imaging_pool.run(
+                    overlay_collages, annotated_tmp, collages, max_size, COLLAGE_RENDITION_SIZES,
+                    key=original_sha256
+                )
+                with _overlay_stats_lock:
+                    overlay_cache_stats['hits'] += cache_stats['hits']
+                    overlay_cache_stats['misses'] += cache_stats['misses']
+            annotated_sha256, annotated_path, annotated_deduplicated = canvas_store.add_file(
+                annotated_tmp, None if collage_positions else annotated_input_sha256
+            )
+            if key:
+                canvas_store.record_render(key, annotated_sha256, collage_positions)
+        canvas_store.record_save(original_sha256, annotated_sha256)
+        collages_appended = len(collage_positions)
+
+        original_filename = os.path.basename(original_path)
+        annotated_filename = os.path.basename(annotated_path)
         print(f"[{datetime.now().isoformat()}] Canvas images saved")
-        print(f"  Original: {original_filename}")
-        print(f"  Annotated: {annotated_filename}")
+        print(f"  Original: {original_filename}{' (deduplicated)' if original_deduplicated else ''}")
+        print(f"  Annotated: {annotated_filename}{' (reused composite)' if composite_reused else ''}")
 
         response_data = {
             "success": True,
@@ -663,6 +1126,17 @@ def save_canvas():
                 "original": original_filename,
                 "annotated": annotated_filename
             },
+            "bytes_received": {
+                "request": request.content_length,
+                "original": original_size,
+                "annotated": annotated_size
+            },
+            "decode_seconds": round(decode_seconds, 4),
+            "deduplicated": {
+                "original": original_deduplicated,
+                "annotated": annotated_deduplicated
+            },
+            "composite_reused": composite_reused,
             "timestamp": datetime.now().isoformat()
         }
 
@@ -670,6 +1144,9 @@ def save_canvas():
         if collages_appended > 0:
             response_data["collages_appended"] = collages_appended
             response_data["collage_positions"] = collage_positions
+            if cache_stats is not None:
+                # Scaled collages found in the worker's cache on this save
+                response_data["overlay_cache"] = cache_stats
         else:
             response_data["collages_appended"] = 0
 
@@ -683,10 +1160,62 @@ def save_canvas():
             "message": "Failed to save canvas images"
         }), 500
 
+CACHE_PAGE_MAX = 500
+
+def _parse_since(value):
+    """Accept epoch seconds or an ISO-8601 timestamp for /cache?since="""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def _decode_cursor(cursor):
+    """[sort value, url_hash] from a next_cursor; ValueError if it isn't one"""
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    if (not isinstance(values, list) or len(values) != 2
+            or not isinstance(values[0], (str, int, float)) or not isinstance(values[1], str)):
+        raise ValueError(f"Malformed cursor: {cursor}")
+    return values
+
+def _project_entry(entry, fields, exclude):
+    """
+    Apply ?fields= / ?exclude= to a cache entry. Both take comma-separated
+    names; "products.<name>" addresses a field of every product.
+    """
+    top_fields = {f for f in fields if '.' not in f}
+    if top_fields:
+        entry = {key: value for key, value in entry.items() if key in top_fields}
+
+    top_exclude = {f for f in exclude if '.' not in f}
+    product_exclude = {f.split('.', 1)[1] for f in exclude if f.startswith('products.')}
+    if top_exclude:
+        entry = {key: value for key, value in entry.items() if key not in top_exclude}
+    if product_exclude and entry.get('products'):
+        entry = dict(entry)
+        entry['products'] = [
+            {key: value for key, value in product.items() if key not in product_exclude}
+            for product in entry['products']
+        ]
+    return entry
+
 @app.route('/cache', methods=['GET'])
 def get_cache():
     """
-    Get all cached product data for frontend sidebar
+    Get cached product data for frontend sidebar
+    
+    Query parameters (all optional; without them the whole catalog is returned):
+        limit: Page size (max 500); the response carries next_cursor if more remain
+        cursor: next_cursor from the previous page
+        since: Epoch seconds or ISO timestamp; only entries added or changed
+               after it are returned. Use next_since from a response as the
+               next since value.
+        fields: Comma-separated top-level keys to keep (e.g. url,products)
+        exclude: Comma-separated keys to drop (e.g. products.description)
+    
+    Responds 304 when If-None-Match matches the current ETag.
     
     Returns:
     {
@@ -695,32 +1224,67 @@ def get_cache():
             "hash1": { product data },
             "hash2": { product data }
         },
-        "count": 2
+        "count": 2,
+        "total": 2,
+        "next_cursor": null,
+        "next_since": 1760000000.0
     }
     """
     try:
-        cache = load_cache()
-        
-        # Sort by timestamp if available
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        since = request.args.get('since')
+        fields = [f for f in request.args.get('fields', '').split(',') if f]
+        exclude = [f for f in request.args.get('exclude', '').split(',') if f]
+
+        if limit is not None:
+            limit = max(1, min(limit, CACHE_PAGE_MAX))
+        try:
+            since = _parse_since(since) if since else None
+            after = _decode_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "Invalid since or cursor parameter"
+            }), 400
+
+        # The ETag only depends on the catalog version and the query, so a
+        # matching If-None-Match is answered without loading any entries
+        total, latest_update = product_store.version()
+        etag = hashlib.md5(
+            f"{total}:{latest_update}:{request.query_string.decode()}".encode()
+        ).hexdigest()
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        if limit is None and since is None and after is None:
+            # The full listing comes from the in-memory catalog; entries are
+            # shared with it, and _project_entry() copies rather than edits
+            rows = [(url_hash, value, None, None) for url_hash, value in _get_catalog().items()]
+        else:
+            rows = product_store.list_entries(limit=limit, after=after, since=since)
+
         sorted_cache = {}
-        cache_items = []
-        
-        for key, value in cache.items():
-            timestamp = value.get('timestamp', '')
-            cache_items.append((timestamp, key, value))
-        
-        # Sort by timestamp descending (newest first)
-        cache_items.sort(reverse=True, key=lambda x: x[0])
-        
-        # Rebuild cache in sorted order
-        for _, key, value in cache_items:
-            sorted_cache[key] = value
-        
-        return jsonify({
+        for url_hash, value, _, _ in rows:
+            sorted_cache[url_hash] = _project_entry(value, fields, exclude) if (fields or exclude) else value
+
+        next_cursor = None
+        if limit is not None and len(rows) == limit:
+            last_hash, _, last_timestamp, last_updated = rows[-1]
+            next_cursor = _encode_cursor([last_updated if since is not None else last_timestamp, last_hash])
+
+        response = jsonify({
             "success": True,
             "cache": sorted_cache,
-            "count": len(sorted_cache)
+            "count": len(sorted_cache),
+            "total": total,
+            "next_cursor": next_cursor,
+            "next_since": latest_update
         })
+        response.set_etag(etag)
+        return response
         
     except Exception as e:
         return jsonify({
@@ -729,6 +1293,90 @@ def get_cache():
             "message": "Failed to load cache"
         }), 500
 
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    """
+    Report in-process cache counters for debugging performance
+    """
+    with _catalog_lock:
+        catalog_stats = dict(catalog_cache_stats)
+    lookups = catalog_stats['hits'] + catalog_stats['misses']
+    catalog_stats['hit_rate'] = round(catalog_stats['hits'] / lookups, 3) if lookups else None
+
+    with _extraction_stats_lock:
+        extraction_stats = dict(extraction_cache_stats)
+    lookups = extraction_stats['hits'] + extraction_stats['misses']
+    extraction_stats['hit_rate'] = round(extraction_stats['hits'] / lookups, 3) if lookups else None
+    extraction_stats['entries'] = extraction_cache.count()
+
+    with _overlay_stats_lock:
+        overlay_stats = dict(overlay_cache_stats)
+    lookups = overlay_stats['hits'] + overlay_stats['misses']
+    overlay_stats['hit_rate'] = round(overlay_stats['hits'] / lookups, 3) if lookups else None
+
+    return jsonify({
+        "success": True,
+        "catalog_cache": catalog_stats,
+        "extraction_cache": extraction_stats,
+        "llm": llm_gateway.stats(),
+        "image_store": get_image_store().stats(),
+        "imaging_pool": imaging_pool.stats(),
+        "canvas_store": canvas_store.stats(),
+        "collage_overlay_cache": overlay_stats,
+        "scrape_single_flight": scrape_flights.stats(),
+        "extraction_templates": extraction_templates.stats()
+    })
+
+@app.route('/jobs', methods=['GET'])
+def get_jobs():
+    """
+    Report the collage job queue
+
+    Query parameters:
+        status: Only list jobs in this state (pending, running, done, failed)
+        limit: Max jobs listed, newest first (default 50, max 500)
+    """
+    status = request.args.get('status') or None
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "limit must be an integer"
+        }), 400
+
+    return jsonify({
+        "success": True,
+        "queue": collage_jobs.stats(),
+        "jobs": collage_jobs.store.list_jobs(status=status, limit=limit)
+    })
+
+@app.route('/collages/<url_hash>', methods=['GET'])
+def get_collage(url_hash):
+    """
+    Serve a product's collage at the nearest pre-rendered size
+
+    Query parameters:
+        size: Longest side needed in px (default: the full 1080p collage)
+        format: jpeg (default) or webp, if WebP renditions are enabled
+    """
+    if not re.fullmatch(r'[0-9a-f]{32}', url_hash):
+        return jsonify({"success": False, "error": "Invalid collage id"}), 400
+    original_path = os.path.abspath(os.path.join(DATA_FOLDER, f"{url_hash}.jpg"))
+    if not os.path.exists(original_path):
+        return jsonify({"success": False, "error": "Collage not found"}), 404
+
+    fmt = request.args.get('format', 'jpeg')
+    if fmt not in ('jpeg', 'webp'):
+        return jsonify({"success": False, "error": "format must be jpeg or webp"}), 400
+    try:
+        size = int(request.args.get('size', 0))
+    except ValueError:
+        return jsonify({"success": False, "error": "size must be an integer"}), 400
+
+    path = nearest_rendition(original_path, size, COLLAGE_RENDITION_SIZES, fmt) if size else original_path
+    return send_file(path, max_age=86400)
+
 @app.route('/generate', methods=['POST'])
 def generate():
     """
@@ -799,12 +1447,9 @@ def generate():
         if 'product_url' in data:
             # Fetch product data from cache or scrape
             url = data['product_url']
-            cache = load_cache()
-            url_hash = get_url_hash(url)
+            url_hash, product_data = find_cached_entry(url)
             
-            if url_hash in cache:
-                product_data = cache[url_hash]
-            else:
+            if product_data is None:
                 # Need to scrape first
                 return jsonify({
                     "success": False,
@@ -891,4 +1536,5 @@ def generate():
 
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Imaging workers would re-import this whole module as their main module
+    raise SystemExit("Run the server with: python main.py")
\ No newline at end of file
@@ -0,0 +1,279 @@
+"""
+Content-addressed storage for /save_canvas images
+
+Usage:
+    python canvas_store.py gc [--dry-run]
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from store import SQLiteStore
+
+CANVAS_FOLDER = os.path.join('product_data', 'canvas')
+CANVAS_DB_FILE = os.path.join('product_data', 'products.db')
+
+# Saves kept referenced; older ones release their images for garbage collection
+CANVAS_SAVE_HISTORY = int(os.environ.get('CANVAS_SAVE_HISTORY', 200))
+
+# Unreferenced blobs (and stray temp files) younger than this are kept, so a
+# save that just found its blob isn't raced by a collection
+GC_GRACE_SECONDS = 3600
+
+HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def render_key(input_sha256, collages, max_size):
+    """
+    Hash of everything an annotated composite depends on: the uploaded
+    annotated image, each collage file (path and mtime) with its position,
+    and the overlay size
+    """
+    inputs = []
+    for collage in collages:
+        path = collage.get('path')
+        try:
+            mtime = os.stat(path).st_mtime_ns if path else None
+        except OSError:
+            mtime = None
+        inputs.append([path, mtime, collage.get('x', 0), collage.get('y', 0)])
+    key = json.dumps([input_sha256, inputs, max_size])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class CanvasIndex(SQLiteStore):
+    """Canvas blobs with reference counts, saves, and rendered composites"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS canvas_blobs (
+            sha256 TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            refs INTEGER NOT NULL DEFAULT 0,
+            last_used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_canvas_blobs_refs ON canvas_blobs(refs);
+        CREATE TABLE IF NOT EXISTS canvas_saves (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            original_sha256 TEXT NOT NULL,
+            annotated_sha256 TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS canvas_renders (
+            render_key TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            positions TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_canvas_renders_sha256 ON canvas_renders(sha256);
+    """
+
+    def lookup(self, sha256):
+        """Path of a stored blob, marking it used, or None"""
+        conn = self._connect()
+        row = conn.execute('SELECT path FROM canvas_blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE canvas_blobs SET last_used = ? WHERE sha256 = ?', (time.time(), sha256))
+        return row[0]
+
+    def add(self, sha256, path, size):
+        """Record a blob, keeping its reference count if it was known"""
+        self._connect().execute(
+            'INSERT INTO canvas_blobs (sha256, path, size, last_used) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(sha256) DO UPDATE SET path = excluded.path, last_used = excluded.last_used',
+            (sha256, path, size, time.time())
+        )
+
+    def record_save(self, original_sha256, annotated_sha256, history=CANVAS_SAVE_HISTORY):
+        """Reference both images from a new save, releasing saves beyond history"""
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO canvas_saves (original_sha256, annotated_sha256, created_at) VALUES (?, ?, ?)',
+                (original_sha256, annotated_sha256, time.time())
+            )
+            conn.execute('UPDATE canvas_blobs SET refs = refs + 1 WHERE sha256 IN (?, ?)',
+                         (original_sha256, annotated_sha256))
+            if original_sha256 == annotated_sha256:
+                conn.execute('UPDATE canvas_blobs SET refs = refs + 1 WHERE sha256 = ?', (original_sha256,))
+
+            expired = conn.execute(
+                'SELECT id, original_sha256, annotated_sha256 FROM canvas_saves ORDER BY id DESC LIMIT -1 OFFSET ?',
+                (history,)
+            ).fetchall()
+            for save_id, original, annotated in expired:
+                for sha256 in (original, annotated):
+                    conn.execute('UPDATE canvas_blobs SET refs = MAX(refs - 1, 0) WHERE sha256 = ?', (sha256,))
+                conn.execute('DELETE FROM canvas_saves WHERE id = ?', (save_id,))
+
+    def get_render(self, key):
+        """(sha256, positions) of an earlier composite with these inputs, or None"""
+        row = self._connect().execute(
+            'SELECT sha256, positions FROM canvas_renders WHERE render_key = ?', (key,)
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def put_render(self, key, sha256, positions):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO canvas_renders (render_key, sha256, positions, created_at) VALUES (?, ?, ?, ?)',
+            (key, sha256, json.dumps(positions), time.time())
+        )
+
+    def collect(self, older_than, dry_run=False):
+        """
+        Drop unreferenced blobs last used before older_than, with the
+        composites that point at them
+
+        Returns:
+            list: (path, size) of the dropped blobs, for the caller to delete
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(
+                'SELECT sha256, path, size FROM canvas_blobs WHERE refs = 0 AND last_used < ?', (older_than,)
+            ).fetchall()
+            for sha256, _, _ in ([] if dry_run else rows):
+                conn.execute('DELETE FROM canvas_renders WHERE sha256 = ?', (sha256,))
+                conn.execute('DELETE FROM canvas_blobs WHERE sha256 = ?', (sha256,))
+        return [(path, size) for _, path, size in rows]
+
+    def paths(self):
+        return {row[0] for row in self._connect().execute('SELECT path FROM canvas_blobs')}
+
+    def counts(self):
+        conn = self._connect()
+        blobs, size, unreferenced = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refs = 0), 0) FROM canvas_blobs'
+        ).fetchone()
+        saves = conn.execute('SELECT COUNT(*) FROM canvas_saves').fetchone()[0]
+        renders = conn.execute('SELECT COUNT(*) FROM canvas_renders').fetchone()[0]
+        return {"blobs": blobs, "bytes": size, "unreferenced": unreferenced, "saves": saves, "renders": renders}
+
+
+class CanvasStore:
+    """
+    Canvas images stored once per content hash
+
+    Uploads are written to a temporary file, hashed, and renamed to
+    folder/ab/<sha256>.png only if that content isn't stored yet, so a room
+    image saved on every generate cycle takes space once. Each save
+    references its original and annotated image; blobs no save references
+    any more are removed by gc().
+    """
+
+    def __init__(self, folder=CANVAS_FOLDER, db_path=CANVAS_DB_FILE):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.index = CanvasIndex(db_path)
+        self._lock = threading.Lock()
+        self._stats = {'stored': 0, 'deduplicated': 0, 'renders_reused': 0}
+
+    def temp_path(self, suffix='.png'):
+        """A new temporary file in the store's folder, for uploads and renders"""
+        fd, path = tempfile.mkstemp(dir=self.folder, prefix='upload_', suffix=suffix)
+        os.close(fd)
+        return path
+
+    def add_file(self, tmp_path, sha256=None):
+        """
+        Move tmp_path into the store, or drop it if its content is stored
+
+        Returns:
+            tuple: (sha256, absolute blob path, whether it was already stored)
+        """
+        sha256 = sha256 or file_sha256(tmp_path)
+        existing = self.index.lookup(sha256)
+        if existing is not None and os.path.exists(existing):
+            os.remove(tmp_path)
+            with self._lock:
+                self._stats['deduplicated'] += 1
+            return sha256, existing, True
+
+        folder = os.path.join(self.folder, sha256[:2])
+        path = os.path.abspath(os.path.join(folder, sha256 + '.png'))
+        os.makedirs(folder, exist_ok=True)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        self.index.add(sha256, path, size)
+        with self._lock:
+            self._stats['stored'] += 1
+        return sha256, path, False
+
+    def find_render(self, key):
+        """(sha256, path, positions) of a stored composite for key, or None"""
+        render = self.index.get_render(key)
+        if render is None:
+            return None
+        sha256, positions = render
+        path = self.index.lookup(sha256)
+        if path is None or not os.path.exists(path):
+            return None
+        with self._lock:
+            self._stats['renders_reused'] += 1
+        return sha256, path, positions
+
+    def record_render(self, key, sha256, positions):
+        self.index.put_render(key, sha256, positions)
+
+    def record_save(self, original_sha256, annotated_sha256):
+        self.index.record_save(original_sha256, annotated_sha256)
+
+    def gc(self, grace_seconds=GC_GRACE_SECONDS, dry_run=False):
+        """
+        Delete unreferenced blobs and stray files older than grace_seconds
+
+        Returns:
+            dict: Blobs and bytes removed
+        """
+        cutoff = time.time() - grace_seconds
+        removed = self.index.collect(cutoff, dry_run=dry_run)
+        for path, _ in ([] if dry_run else removed):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        # Temp files left by interrupted saves, and blobs missing from the index
+        known = self.index.paths()
+        strays = []
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                path = os.path.abspath(os.path.join(root, name))
+                if path in known or os.path.getmtime(path) >= cutoff:
+                    continue
+                strays.append(path)
+                if not dry_run:
+                    os.remove(path)
+
+        return {
+            "blobs_removed": len(removed),
+            "bytes_removed": sum(size for _, size in removed),
+            "stray_files_removed": len(strays),
+            "dry_run": dry_run
+        }
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(self.index.counts())
+        return stats
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'gc':
+        print(__doc__)
+        sys.exit(1)
+    # Run from be/, like main.py, so the product_data paths resolve
+    result = CanvasStore().gc(dry_run='--dry-run' in sys.argv[2:])
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,177 @@
+"""
+Collage rendering and canvas overlay compositing
+
+Everything here takes and produces files on disk rather than image bytes,
+so it can run in an imaging pool worker without pickling pixel data.
+"""
+
+import math
+import os
+import tempfile
+from PIL import Image, ImageDraw, ImageFont
+from imaging import load_thumbnail, write_renditions, nearest_rendition, thumbnail_cache
+
+COLLAGE_SIZE = (1920, 1080)
+TITLE_HEIGHT = 100
+
+
+def get_contrast_color(hex_color):
+    """
+    Determine whether to use black or white text based on background color
+    """
+    # Convert hex to RGB
+    r = int(hex_color[0:2], 16)
+    g = int(hex_color[2:4], 16)
+    b = int(hex_color[4:6], 16)
+
+    # Calculate luminance using W3C formula
+    luminance = (0.299 * r + 0.587 * g + 0.114 * b) / 255
+
+    # Return black for light backgrounds, white for dark
+    return 'black' if luminance > 0.5 else 'white'
+
+
+def grid_layout(num_images):
+    """
+    Cell size and origin function for a grid of num_images under the title
+
+    Returns:
+        tuple: ((cell width, cell height), cell_origin(idx) -> (x, y))
+    """
+    cols = math.ceil(math.sqrt(num_images))
+    rows = math.ceil(num_images / cols)
+
+    # Available space (leaving space for title)
+    img_width = COLLAGE_SIZE[0] // cols
+    img_height = (COLLAGE_SIZE[1] - TITLE_HEIGHT) // rows
+
+    def cell_origin(idx):
+        row = idx // cols
+        col = idx % cols
+        return col * img_width, TITLE_HEIGHT + (row * img_height)
+
+    return (img_width, img_height), cell_origin
+
+
+def render_collage(product, tile_paths, output_path, rendition_sizes=(), rendition_formats=('JPEG',)):
+    """
+    Draw a 1080p collage of a product's images with its color ID and title
+
+    Args:
+        product (dict): Product with 'id' (hex color) and 'title'
+        tile_paths (list): Local image path per grid cell, None for images
+            that couldn't be downloaded (drawn as placeholders)
+        output_path (str): Where the JPEG collage is written
+        rendition_sizes (list): Smaller copies to write next to it
+        rendition_formats (tuple): Formats of those copies
+
+    Returns:
+        list: Rendition dicts from write_renditions(), the original last
+    """
+    # Get product color ID
+    product_id = product.get('id', 'cccccc')  # Default to light gray if no ID
+
+    # Create 1920x1080 canvas with product color as background
+    collage = Image.new('RGB', COLLAGE_SIZE, color=f"#{product_id}")
+    draw = ImageDraw.Draw(collage)
+
+    # Determine text color based on background
+    text_color = get_contrast_color(product_id)
+
+    # Add product ID and title at the top
+    title = product.get('title', 'Product')
+    # Show color ID prominently with title as subtitle
+    display_text = f"#{product_id.upper()} - {title[:50]}" if len(title) > 50 else f"#{product_id.upper()} - {title}"
+    try:
+        # Try to use a larger font, fallback to default if not available
+        font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 48)
+    except OSError:
+        font = ImageFont.load_default()
+
+    # Add text directly on the colored background
+    draw.text((50, 25), display_text, fill=text_color, font=font)
+
+    (img_width, img_height), cell_origin = grid_layout(len(tile_paths))
+    cell_size = (img_width - 10, img_height - 10)
+
+    for idx, path in enumerate(tile_paths):
+        x, y = cell_origin(idx)
+        img = None
+        if path is not None:
+            try:
+                # Decode near the cell size and fit it while maintaining aspect ratio
+                img = load_thumbnail(path, cell_size)
+            except Exception as e:
+                print(f"Error loading image {path}: {e}")
+
+        if img is not None:
+            # Center image in cell
+            collage.paste(img, (x + (img_width - img.width) // 2, y + (img_height - img.height) // 2))
+        else:
+            # Placeholder tile for images that failed or missed the deadline
+            draw.rectangle([x + 5, y + 5, x + img_width - 5, y + img_height - 5], fill='#d9d9d9')
+            draw.text((x + 20, y + 20), "Image unavailable", fill='#555555', font=ImageFont.load_default())
+        draw.rectangle([x, y, x + img_width, y + img_height], outline='gray', width=1)
+
+    # Use JPEG with optimized quality for smaller file size
+    collage.save(output_path, 'JPEG', quality=85, optimize=True)
+    renditions = write_renditions(collage, os.path.splitext(output_path)[0], rendition_sizes, rendition_formats)
+    renditions.append({"size": max(collage.size), "format": "jpeg", "path": output_path})
+    return renditions
+
+
+def overlay_collages(image_path, collages, max_size, rendition_sizes=()):
+    """
+    Paste collages onto the PNG at image_path, rewriting it in place
+
+    Args:
+        image_path (str): Annotated canvas PNG
+        collages (list): {"path", "x", "y"} dicts; each collage is scaled to
+            fit max_size and centered on (x, y), clamped to the image
+        max_size (int): Longest side of a pasted collage
+        rendition_sizes (list): Collage renditions to pick the source from
+
+    Scaled collages come from this process's thumbnail_cache, so collages
+    pasted again while a room is being iterated on aren't decoded again.
+
+    Returns:
+        tuple: ({"x", "y"} of every collage that was pasted,
+            {"hits", "misses"} of the thumbnail cache during this call)
+    """
+    cache_counts = {"hits": 0, "misses": 0}
+    positions = []
+    img = None
+    for collage_data in collages:
+        collage_path = collage_data.get('path')
+        center_x = collage_data.get('x', 0)
+        center_y = collage_data.get('y', 0)
+        if not collage_path or not os.path.exists(collage_path):
+            continue
+        try:
+            collage_img = thumbnail_cache.get(
+                nearest_rendition(collage_path, max_size, rendition_sizes), (max_size, max_size),
+                counts=cache_counts
+            )
+            if img is None:
+                img = Image.open(image_path)
+                img.load()
+
+            # Center collage at the specified point, within bounds
+            paste_x = int(center_x - collage_img.width // 2)
+            paste_y = int(center_y - collage_img.height // 2)
+            paste_x = max(0, min(paste_x, img.width - collage_img.width))
+            paste_y = max(0, min(paste_y, img.height - collage_img.height))
+
+            img.paste(collage_img, (paste_x, paste_y))
+            positions.append({"x": round(center_x), "y": round(center_y)})
+            print(f"  Collage {len(positions)} appended at position ({center_x:.0f}, {center_y:.0f})")
+        except Exception as e:
+            print(f"  Error loading collage {collage_path}: {e}")
+
+    if positions:
+        # Write then rename, so readers never see a partial PNG
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(image_path) or '.', suffix='.png')
+        with os.fdopen(fd, 'wb') as f:
+            img.save(f, format='PNG')
+        os.replace(tmp_path, image_path)
+    return positions, cache_counts
@@ -0,0 +1,222 @@
+import math
+import hashlib
+import threading
+from collections import Counter
+
+# Minimum distance threshold to consider colors different enough
+MIN_COLOR_DISTANCE = 100  # Adjust this for more/less distinction
+
+# Number of hash variations to try before giving up on a unique color
+MAX_COLOR_ATTEMPTS = 50
+
+# Smallest per-channel weight used by color_distance (r, g, b). A neighbour can
+# only be closer than MIN_COLOR_DISTANCE if each channel differs by less than
+# MIN_COLOR_DISTANCE / sqrt(weight), which bounds the grid search.
+_MIN_CHANNEL_WEIGHTS = (2, 4, 2)
+
+
+def hex_to_rgb(color):
+    return int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16)
+
+
+def color_distance(color1, color2):
+    """
+    Calculate perceptual color distance between two hex colors.
+    Returns a value between 0 (identical) and ~765 (maximum difference).
+    """
+    return _rgb_distance(hex_to_rgb(color1), hex_to_rgb(color2))
+
+
+def _rgb_distance(rgb1, rgb2):
+    r1, g1, b1 = rgb1
+    r2, g2, b2 = rgb2
+
+    # Calculate weighted Euclidean distance (human eye is more sensitive to green)
+    # Using weights that account for human perception
+    r_weight = 2 if (r1 + r2) / 2 > 128 else 3
+    g_weight = 4
+    b_weight = 2 if (r1 + r2) / 2 <= 128 else 3
+
+    distance = math.sqrt(
+        r_weight * (r1 - r2) ** 2 +
+        g_weight * (g1 - g2) ** 2 +
+        b_weight * (b1 - b2) ** 2
+    )
+
+    return distance
+
+
+def candidate_color(product_unique, attempt):
+    """
+    Derive the bright, vibrant candidate color for a given attempt number
+    """
+    # Generate initial hash with attempt number for variation
+    hash_input = f"{product_unique}_{attempt}" if attempt > 0 else product_unique
+    base_hash = hashlib.md5(hash_input.encode()).hexdigest()
+
+    # Extract RGB components from hash
+    r = int(base_hash[:2], 16)
+    g = int(base_hash[2:4], 16)
+    b = int(base_hash[4:6], 16)
+
+    # Ensure brightness: at least one channel > 200, and total > 400
+    max_val = max(r, g, b)
+    if max_val < 200:
+        # Scale up the brightest channel
+        scale = 220 / max_val
+        r = min(255, int(r * scale))
+        g = min(255, int(g * scale))
+        b = min(255, int(b * scale))
+
+    # Ensure vibrancy (avoid grays)
+    if abs(r - g) < 30 and abs(g - b) < 30 and abs(r - b) < 30:
+        # Boost the dominant color from hash
+        hash_val = int(base_hash[6:8], 16)
+        boost_index = (hash_val + attempt) % 3
+        if boost_index == 0:
+            r = min(255, r + 80)
+            g = max(0, g - 30)
+            b = max(0, b - 30)
+        elif boost_index == 1:
+            g = min(255, g + 80)
+            r = max(0, r - 30)
+            b = max(0, b - 30)
+        else:
+            b = min(255, b + 80)
+            r = max(0, r - 30)
+            g = max(0, g - 30)
+
+    # Add variation based on attempt number for more diversity
+    if attempt > 0:
+        # Rotate hue slightly with each attempt
+        rotation = (attempt * 30) % 360
+        # Simple hue rotation approximation
+        if rotation < 120:
+            r = min(255, r + rotation // 3)
+            g = max(0, g - rotation // 6)
+        elif rotation < 240:
+            g = min(255, g + (rotation - 120) // 3)
+            b = max(0, b - (rotation - 120) // 6)
+        else:
+            b = min(255, b + (rotation - 240) // 3)
+            r = max(0, r - (rotation - 240) // 6)
+
+    # Ensure total brightness
+    total = r + g + b
+    if total < 400:
+        # Boost all channels proportionally
+        boost = (450 - total) / 3
+        r = min(255, int(r + boost))
+        g = min(255, int(g + boost))
+        b = min(255, int(b + boost))
+
+    return f"{r:02x}{g:02x}{b:02x}"
+
+
+class ColorAllocator:
+    """
+    Hands out product color IDs that are at least min_distance apart.
+
+    Allocated colors are bucketed on a coarse RGB grid, so checking a candidate
+    only compares it against colors in the neighbouring cells that could
+    possibly be within min_distance, instead of against every product. Picking
+    and reserving a color happens under one lock, so concurrent scrapes can't
+    both claim the same region of color space.
+    """
+
+    def __init__(self, min_distance=MIN_COLOR_DISTANCE, cell_size=32, seed_loader=None):
+        """
+        Args:
+            min_distance (float): Minimum color_distance between allocated colors
+            cell_size (int): Width of a grid cell along each RGB channel
+            seed_loader (callable): Optional function returning already used
+                color IDs, once per product using each; called once, on first use
+        """
+        self.min_distance = min_distance
+        self.cell_size = cell_size
+        self._min_distance_sq = min_distance ** 2
+        # Cell offsets that may hold a close neighbour, nearest first so that a
+        # conflict is usually found in the first bucket or two
+        spans = [math.ceil(min_distance / math.sqrt(weight) / cell_size) for weight in _MIN_CHANNEL_WEIGHTS]
+        self._offsets = sorted(
+            ((dr, dg, db)
+             for dr in range(-spans[0], spans[0] + 1)
+             for dg in range(-spans[1], spans[1] + 1)
+             for db in range(-spans[2], spans[2] + 1)),
+            key=lambda offset: sum(d * d for d in offset)
+        )
+        self._grid = {}
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._seed_loader = seed_loader
+        self._seeded = seed_loader is None
+
+    def _cell(self, rgb):
+        return tuple(channel // self.cell_size for channel in rgb)
+
+    def _ensure_seeded(self):
+        # Called with the lock held
+        if self._seeded:
+            return
+        self._seeded = True
+        for color_id in self._seed_loader():
+            self._add(color_id)
+
+    def _add(self, color_id):
+        color_id = color_id.lower()
+        self._counts[color_id] += 1
+        if self._counts[color_id] == 1:
+            rgb = hex_to_rgb(color_id)
+            self._grid.setdefault(self._cell(rgb), []).append(rgb)
+
+    def _is_far_enough(self, rgb):
+        r, g, b = rgb
+        cr, cg, cb = self._cell(rgb)
+        grid = self._grid
+        limit = self._min_distance_sq
+        for dr, dg, db in self._offsets:
+            bucket = grid.get((cr + dr, cg + dg, cb + db))
+            if not bucket:
+                continue
+            for r2, g2, b2 in bucket:
+                # Same weighting as color_distance, compared squared to skip the sqrt
+                if (r + r2) / 2 > 128:
+                    distance_sq = 2 * (r - r2) ** 2 + 4 * (g - g2) ** 2 + 3 * (b - b2) ** 2
+                else:
+                    distance_sq = 3 * (r - r2) ** 2 + 4 * (g - g2) ** 2 + 2 * (b - b2) ** 2
+                if distance_sq < limit:
+                    return False
+        return True
+
+    def allocate(self, product_unique):
+        """
+        Pick a color for product_unique and reserve it.
+
+        Falls back to the last candidate if no sufficiently distinct color is
+        found within MAX_COLOR_ATTEMPTS (better than nothing).
+        """
+        with self._lock:
+            self._ensure_seeded()
+            for attempt in range(MAX_COLOR_ATTEMPTS):
+                color_id = candidate_color(product_unique, attempt)
+                if self._is_far_enough(hex_to_rgb(color_id)):
+                    break
+            self._add(color_id)
+            return color_id
+
+    def release(self, color_id):
+        """Return a color, e.g. when the product holding it is replaced"""
+        color_id = color_id.lower()
+        with self._lock:
+            if not self._counts.get(color_id):
+                return
+            self._counts[color_id] -= 1
+            if self._counts[color_id] == 0:
+                del self._counts[color_id]
+                rgb = hex_to_rgb(color_id)
+                bucket = self._grid.get(self._cell(rgb), [])
+                bucket.remove(rgb)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._counts)
@@ -0,0 +1,174 @@
+import os
+import re
+
+# Prompt size budget for the page content + images part of the LLM context
+DEFAULT_TOKEN_BUDGET = int(os.environ.get('LLM_CONTEXT_TOKEN_BUDGET', 6000))
+
+# Share of the budget the image list may use at most
+IMAGE_BUDGET_SHARE = 0.3
+
+# Max images listed in the context
+MAX_CONTEXT_IMAGES = 30
+
+PRICE_PATTERN = re.compile(r'(?:[$€£]\s?\d)|(?:\d[\d,.]*\s?(?:CAD|USD|EUR|GBP)\b)', re.IGNORECASE)
+UNIT_PATTERN = re.compile(
+    r'\d+(?:[.,]\d+)?\s?(?:cm|mm|m|in|inch|inches|ft|kg|lb|lbs|oz|"|\'|m2|sq ft)\b',
+    re.IGNORECASE
+)
+SPEC_KEYWORDS = re.compile(
+    r'\b(?:width|height|depth|length|diameter|thickness|dimensions?|material|fabric|cover|frame|'
+    r'colou?r|finish|sku|article number|item number|model|weight|assembly|warranty|care)\b',
+    re.IGNORECASE
+)
+BOILERPLATE_PATTERN = re.compile(
+    r'\b(?:cookies?|privacy policy|terms of (?:use|service)|sign in|log in|newsletter|subscribe|'
+    r'all rights reserved|gift cards?|store locator|customer service|skip to)\b|©',
+    re.IGNORECASE
+)
+REVIEW_PATTERN = re.compile(r'\b(?:reviews?|rated|stars?|helpful|verified (?:buyer|purchase))\b', re.IGNORECASE)
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Blocks scoring below this are noise (reviews, chrome) even if budget remains
+MIN_BLOCK_SCORE = 0.0
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English/markup)"""
+    return (len(text) + 3) // 4
+
+
+def _normalize(block):
+    return ' '.join(WORD_PATTERN.findall(block.lower()))
+
+
+def dedupe_blocks(blocks):
+    """
+    Drop empty, duplicate and boilerplate blocks, keeping first occurrences
+
+    Returns:
+        list: (original index, block) pairs
+    """
+    seen = set()
+    kept = []
+    for index, block in enumerate(blocks):
+        key = _normalize(block)
+        if len(key) < 2 or key in seen:
+            continue
+        seen.add(key)
+        # Short blocks that look like site chrome ("Sign in", "© 2025 ...")
+        if len(block) < 200 and BOILERPLATE_PATTERN.search(block):
+            continue
+        kept.append((index, block))
+    return kept
+
+
+def score_block(block, title_words, position, total):
+    """Higher is more likely to describe the product"""
+    words = set(WORD_PATTERN.findall(block.lower()))
+    score = 0.0
+    if title_words:
+        score += 3.0 * len(words & title_words) / len(title_words)
+    score += 2.0 * min(len(UNIT_PATTERN.findall(block)), 3)
+    score += 2.0 if PRICE_PATTERN.search(block) else 0.0
+    score += 1.5 * min(len(SPEC_KEYWORDS.findall(block)), 3)
+    if REVIEW_PATTERN.search(block):
+        score -= 2.0
+    # Product details usually come before related products and reviews
+    score += 1.0 - position / max(total, 1)
+    # Very long blocks are usually reviews or marketing copy
+    if len(block) > 1500:
+        score -= 1.0
+    return score
+
+
+def select_blocks(blocks, title, token_budget):
+    """
+    Pick the most product-relevant blocks that fit in token_budget
+
+    Returns:
+        list: Selected blocks in page order
+    """
+    kept = dedupe_blocks(blocks)
+    title_words = {word for word in WORD_PATTERN.findall(title.lower()) if len(word) > 2}
+    scored = [
+        (score_block(block, title_words, index, len(blocks)), index, block)
+        for index, block in kept
+    ]
+    ranked = sorted(
+        (item for item in scored if item[0] >= MIN_BLOCK_SCORE),
+        key=lambda item: item[0],
+        reverse=True
+    )
+
+    selected = []
+    used = 0
+    for _, index, block in ranked:
+        cost = estimate_tokens(block) + 1
+        if used + cost > token_budget:
+            continue
+        selected.append((index, block))
+        used += cost
+    selected.sort()
+    return [block for _, block in selected]
+
+
+def _format_images(images, token_budget):
+    lines = []
+    used = 0
+    for img in images[:MAX_CONTEXT_IMAGES]:
+        entry = f"\n- Image: {img['src']}"
+        if img['alt']:
+            entry += f"\n  Alt text: {img['alt']}"
+        if img['context']:
+            entry += f"\n  Context: {img['context'][:200]}"
+        cost = estimate_tokens(entry)
+        if used + cost > token_budget:
+            break
+        lines.append(entry)
+        used += cost
+    return ''.join(lines)
+
+
+def build_context(scraped_data, token_budget=None):
+    """
+    Build the LLM user message for a scraped page within a token budget
+
+    Args:
+        scraped_data (dict): title, content/text_blocks and product_images
+        token_budget (int): Max estimated tokens; defaults to DEFAULT_TOKEN_BUDGET
+
+    Returns:
+        tuple: (context string, stats dict with tokens_before/tokens_after)
+    """
+    token_budget = token_budget or DEFAULT_TOKEN_BUDGET
+    title = scraped_data.get('title', '')
+    blocks = scraped_data.get('text_blocks') or [scraped_data.get('content', '')]
+    images = scraped_data.get('product_images', [])
+
+    # What the context would cost with everything included
+    full_images = _format_images(images, float('inf'))
+    tokens_before = estimate_tokens(title) + estimate_tokens(' '.join(blocks)) + estimate_tokens(full_images)
+
+    image_text = _format_images(images, int(token_budget * IMAGE_BUDGET_SHARE))
+    text_budget = token_budget - estimate_tokens(title) - estimate_tokens(image_text)
+    selected = select_blocks(blocks, title, max(text_budget, 0))
+    content = '\n'.join(selected)
+
+    context = f"""
+    Page Title: {title}
+
+    Relevant Page Content:
+    {content}
+
+    Product Images Found ({len(images)} total):
+    """
+    context += image_text
+
+    stats = {
+        "tokens_before": tokens_before,
+        "tokens_after": estimate_tokens(context),
+        "token_budget": token_budget,
+        "blocks_total": len(blocks),
+        "blocks_selected": len(selected)
+    }
+    return context, stats
@@ -0,0 +1,281 @@
+import json
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+# Prefer the C-backed lxml parser; fall back to BeautifulSoup's pure-Python one
+try:
+    import lxml.html
+    from lxml import etree
+    DEFAULT_PARSER = 'lxml'
+except ImportError:
+    DEFAULT_PARSER = 'html.parser'
+
+# Product pages are rarely over 2 MB; the cap leaves a third more headroom,
+# and anything past it is inline data or junk
+MAX_HTML_BYTES = 3 * 1024 * 1024
+
+# Max number of images passed on to product analysis
+MAX_IMAGES = 50
+
+# Subtrees that never hold product details
+PRUNE_TAGS = ['script', 'style', 'noscript', 'template', 'svg', 'iframe', 'nav', 'footer']
+PRUNE_ROLES = ['navigation', 'contentinfo', 'banner']
+
+SKIP_IMAGE_PATTERNS = ['icon', 'logo', 'svg', 'data:image']
+
+# Elements that start a new block of text (paragraph, list item, cell, ...)
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'fieldset',
+    'figcaption', 'figure', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'li', 'main',
+    'ol', 'p', 'pre', 'section', 'table', 'tbody', 'td', 'th', 'thead', 'tr', 'ul'
+}
+
+# <meta property=...> prefixes worth keeping for structured extraction
+STRUCTURED_META_PREFIXES = ('og:', 'product:')
+
+
+def read_capped(response, max_bytes=MAX_HTML_BYTES):
+    """
+    Read a streamed requests response, stopping after max_bytes
+
+    Returns:
+        tuple: (body bytes, whether the body was truncated)
+    """
+    chunks = []
+    received = 0
+    truncated = False
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        chunks.append(chunk)
+        received += len(chunk)
+        if received >= max_bytes:
+            truncated = True
+            break
+    response.close()
+    return b''.join(chunks)[:max_bytes], truncated
+
+
+def _load_json_ld(texts):
+    """Parse JSON-LD blocks, skipping ones that aren't valid JSON"""
+    blocks = []
+    for text in texts:
+        try:
+            blocks.append(json.loads(text, strict=False))
+        except (TypeError, ValueError):
+            continue
+    return blocks
+
+
+def _structured_meta(pairs):
+    meta = {}
+    for key, content in pairs:
+        if key and content and key.startswith(STRUCTURED_META_PREFIXES):
+            # Keep the first value; og:image may repeat for extra images
+            if key == 'og:image':
+                meta.setdefault('og:images', []).append(content)
+            meta.setdefault(key, content)
+    return meta
+
+
+class _BlockCollector:
+    """Accumulates text fragments, cutting a new block at block-level tags"""
+
+    def __init__(self):
+        self.blocks = []
+        self._current = []
+
+    def add(self, text):
+        text = text.strip() if text else ''
+        if text:
+            self._current.append(text)
+
+    def flush(self):
+        if self._current:
+            self.blocks.append(' '.join(self._current))
+            self._current = []
+
+
+def _lxml_text_blocks(body):
+    collector = _BlockCollector()
+    for event, element in etree.iterwalk(body, events=('start', 'end')):
+        is_block = isinstance(element.tag, str) and element.tag in BLOCK_TAGS
+        if event == 'start':
+            if is_block:
+                collector.flush()
+            collector.add(element.text)
+        else:
+            if is_block:
+                collector.flush()
+            # The tail belongs to the parent, after this element closes
+            if element is not body:
+                collector.add(element.tail)
+    collector.flush()
+    return collector.blocks
+
+
+def _soup_text_blocks(body):
+    collector = _BlockCollector()
+
+    def walk(element):
+        for child in element.children:
+            if isinstance(child, Tag):
+                is_block = child.name in BLOCK_TAGS
+                if is_block:
+                    collector.flush()
+                walk(child)
+                if is_block:
+                    collector.flush()
+            elif type(child) is NavigableString:
+                collector.add(child)
+
+    walk(body)
+    collector.flush()
+    return collector.blocks
+
+
+def is_product_image(src):
+    """Whether an <img> src could be a product photo rather than an icon or logo"""
+    return src and not any(skip in src.lower() for skip in SKIP_IMAGE_PATTERNS)
+
+
+def _parse_with_lxml(html):
+    """Fast path: prune and extract directly on the lxml tree"""
+    try:
+        root = lxml.html.fromstring(html)
+    except etree.ParserError:
+        # Empty or whitespace-only body; there's nothing to extract
+        empty_data = {'json_ld': [], 'meta': _structured_meta(())}
+        return 'No title found', [], [], empty_data, None
+
+    title = root.findtext('.//title')
+    title = title if title is not None else 'No title found'
+
+    # Structured data lives in <script>/<meta>, so grab it before pruning
+    structured_data = {
+        'json_ld': _load_json_ld(root.xpath('//script[@type="application/ld+json"]/text()')),
+        'meta': _structured_meta(
+            (meta.get('property') or meta.get('name'), meta.get('content'))
+            for meta in root.iter('meta')
+        )
+    }
+
+    etree.strip_elements(root, etree.Comment, *PRUNE_TAGS, with_tail=False)
+    role_test = ' or '.join(f'@role="{role}"' for role in PRUNE_ROLES)
+    # Page-level headers are site chrome; headers inside <main>/<article> are content
+    chrome = root.xpath(f'//*[{role_test}] | //header[not(ancestor::main or ancestor::article)]')
+    for element in chrome:
+        if element.getparent() is not None:
+            element.drop_tree()
+
+    body = root.find('body')
+    body = body if body is not None else root
+    text_blocks = _lxml_text_blocks(body)
+
+    images_with_context = []
+    for img in body.iter('img'):
+        img_src = img.get('src', '')
+        if is_product_image(img_src):
+            parent = img.getparent()
+            images_with_context.append({
+                'src': img_src,
+                'alt': img.get('alt', ''),
+                'title': img.get('title', ''),
+                # Get surrounding text context
+                'context': ''.join(text.strip() for text in parent.itertext())[:300] if parent is not None else ''
+            })
+            if len(images_with_context) >= MAX_IMAGES:
+                break
+
+    return title, text_blocks, images_with_context, structured_data, root
+
+
+def _parse_with_soup(html, parser):
+    """Fallback: BeautifulSoup with any tree builder"""
+    soup = BeautifulSoup(html, parser)
+
+    title_tag = soup.find('title')
+    title = title_tag.text if title_tag else 'No title found'
+
+    # Structured data lives in <script>/<meta>, so grab it before pruning
+    structured_data = {
+        'json_ld': _load_json_ld(
+            script.string for script in soup.find_all('script', type='application/ld+json')
+        ),
+        'meta': _structured_meta(
+            (meta.get('property') or meta.get('name'), meta.get('content'))
+            for meta in soup.find_all('meta')
+        )
+    }
+
+    # Collect chrome in one pass over the tree; find_all() with several
+    # filters is much slower than checking each tag once
+    prune_tags = set(PRUNE_TAGS)
+    prune_roles = set(PRUNE_ROLES)
+    chrome = []
+    for element in soup.find_all(True):
+        if (element.name in prune_tags
+                or element.get('role') in prune_roles
+                or (element.name == 'header' and not element.find_parent(['main', 'article']))):
+            chrome.append(element)
+    for element in chrome:
+        # Skip elements already removed along with a pruned ancestor
+        if not element.decomposed:
+            element.decompose()
+
+    body = soup.body or soup
+    text_blocks = _soup_text_blocks(body)
+
+    images_with_context = []
+    for img in body.find_all('img'):
+        img_src = img.get('src', '')
+        if is_product_image(img_src):
+            img_data = {
+                'src': img_src,
+                'alt': img.get('alt', ''),
+                'title': img.get('title', ''),
+                'context': ''
+            }
+
+            # Get surrounding text context
+            parent = img.parent
+            if parent:
+                img_data['context'] = parent.get_text(strip=True)[:300]
+
+            images_with_context.append(img_data)
+            if len(images_with_context) >= MAX_IMAGES:
+                break
+
+    return title, text_blocks, images_with_context, structured_data, None
+
+
+def parse_page(html, parser=None, max_bytes=MAX_HTML_BYTES):
+    """
+    Parse a product page into the fields used for product analysis
+
+    Args:
+        html (bytes or str): Raw page body
+        parser (str): 'lxml' or a BeautifulSoup parser name; defaults to DEFAULT_PARSER
+        max_bytes (int): Bytes of html to parse at most
+
+    Returns:
+        dict: title, content (visible text), text_blocks (content split at
+            block-level elements), product_images,
+            structured_data (JSON-LD blocks and og:/product: meta tags), parser,
+            tree (the pruned lxml element tree, or None with other parsers)
+    """
+    parser = parser or DEFAULT_PARSER
+    if len(html) > max_bytes:
+        html = html[:max_bytes]
+
+    if parser == 'lxml':
+        title, text_blocks, images_with_context, structured_data, tree = _parse_with_lxml(html)
+    else:
+        title, text_blocks, images_with_context, structured_data, tree = _parse_with_soup(html, parser)
+
+    return {
+        "title": title,
+        "content": ' '.join(text_blocks),
+        "text_blocks": text_blocks,
+        "product_images": images_with_context,
+        "structured_data": structured_data,
+        "parser": parser,
+        "tree": tree
+    }
@@ -4,8 +4,8 @@ from dotenv import load_dotenv
 import json
 import base64
 from PIL import Image
-import requests
-from io import BytesIO
+from image_store import get_image_store
+from image_probe import probe_dimensions
 
 # Load environment variables
 load_dotenv()
@@ -55,14 +55,11 @@ def get_image_dimensions(image_path_or_url):
     """
     try:
         if image_path_or_url.startswith('http://') or image_path_or_url.startswith('https://'):
-            # Download image from URL
-            response = requests.get(image_path_or_url, timeout=10)
-            img = Image.open(BytesIO(response.content))
-        else:
-            # Open local image
-            img = Image.open(image_path_or_url)
+            # Known from the image store, or probed from the first few KB
+            return get_image_store().dimensions(image_path_or_url, timeout=10)
         
-        return img.size  # Returns (width, height)
+        # Read only the local image's header
+        return probe_dimensions(image_path_or_url) or Image.open(image_path_or_url).size
     except Exception as e:
         print(f"Error getting image dimensions: {e}")
         return None
@@ -0,0 +1,115 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+# Connections kept alive per host
+POOL_MAXSIZE = 10
+
+# Politeness limits for page fetches: concurrent requests per host, and the
+# minimum gap between two request starts to the same host
+HOST_MAX_CONCURRENCY = int(os.environ.get('HOST_MAX_CONCURRENCY', 4))
+HOST_MIN_INTERVAL = float(os.environ.get('HOST_MIN_INTERVAL', 0.25))
+
+# Headers that make product pages serve the same HTML a browser would get
+BROWSER_HEADERS = {
+    'accept-encoding': 'gzip, deflate, zstd',
+    'accept-language': 'en-US,en;q=0.9,en-GB;q=0.8',
+    'cache-control': 'max-age=0',
+    'priority': 'u=0, i',
+    'sec-ch-ua': '"Not;A=Brand";v="99", "Microsoft Edge";v="139", "Chromium";v="139"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"macOS"',
+    'sec-fetch-dest': 'document',
+    'sec-fetch-mode': 'navigate',
+    'sec-fetch-site': 'none',
+    'sec-fetch-user': '?1',
+    'upgrade-insecure-requests': '1',
+    'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36 Edg/139.0.0.0'
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+_host_semaphores = {}
+_host_next_start = {}
+_host_lock = threading.Lock()
+
+
+def _host(url):
+    return urlsplit(url).netloc.lower()
+
+
+def get_session(url):
+    """
+    Return the shared session for url's host, creating it on first use.
+
+    Each host gets its own session and connection pool, so repeated requests
+    to the same retailer or CDN reuse keep-alive connections instead of
+    paying for a new TCP/TLS handshake every time.
+    """
+    host = _host(url)
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[host] = session
+    return session
+
+
+@contextmanager
+def host_slot(url):
+    """
+    Hold one of url's host slots for the duration of the block
+
+    At most HOST_MAX_CONCURRENCY blocks run per host at once, and their
+    starts are spaced at least HOST_MIN_INTERVAL seconds apart. A lone
+    request is never delayed.
+    """
+    host = _host(url)
+    with _host_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = _host_semaphores[host] = threading.BoundedSemaphore(HOST_MAX_CONCURRENCY)
+
+    with semaphore:
+        with _host_lock:
+            now = time.monotonic()
+            start_at = max(now, _host_next_start.get(host, now))
+            _host_next_start[host] = start_at + HOST_MIN_INTERVAL
+        if start_at > now:
+            time.sleep(start_at - now)
+        yield
+
+
+def get(url, **kwargs):
+    """requests.get() over the pooled session for url's host"""
+    return get_session(url).get(url, **kwargs)
+
+
+def conditional_get(url, etag=None, last_modified=None, headers=None, **kwargs):
+    """
+    GET url, sending If-None-Match / If-Modified-Since when validators from a
+    previous response are known. A 304 response means the stored copy is
+    still current.
+    """
+    headers = dict(headers or {})
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return get(url, headers=headers, **kwargs)
+
+
+def get_validators(response):
+    """Extract the cache validators worth storing from a response"""
+    return {
+        'http_etag': response.headers.get('ETag'),
+        'http_last_modified': response.headers.get('Last-Modified')
+    }
@@ -0,0 +1,147 @@
+"""
+Image dimensions from the first bytes of a file or URL
+
+PNG, GIF, JPEG and WebP store their size in the header (for JPEG, in the
+first start-of-frame segment after any EXIF/ICC data), so there's no need
+to download or decode the whole image to learn it.
+"""
+
+import os
+import struct
+import threading
+from collections import OrderedDict
+import http_client
+
+# Bytes read per step, and the most read before giving up (JPEGs with large
+# embedded thumbnails or color profiles push the frame header further in)
+PROBE_CHUNK = 4096
+PROBE_MAX_BYTES = 256 * 1024
+
+# Probed sizes remembered per URL, and per path + mtime
+PROBE_CACHE_SIZE = 1024
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Start-of-frame markers; 0xC4 (DHT), 0xC8 (JPG) and 0xCC (DAC) share the range
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _jpeg_dimensions(data):
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a length
+            i += 2
+            continue
+        length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            if i + 9 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def _webp_dimensions(data):
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and len(data) >= 30:
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(data) >= 25:
+        bits = struct.unpack('<I', data[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(data) >= 30:
+        return 1 + int.from_bytes(data[24:27], 'little'), 1 + int.from_bytes(data[27:30], 'little')
+    return None
+
+
+def parse_dimensions(data):
+    """
+    (width, height) from the start of an image, or None if data isn't a
+    supported format or doesn't reach the size yet
+    """
+    if data.startswith(PNG_SIGNATURE):
+        if len(data) >= 24 and data[12:16] == b'IHDR':
+            return struct.unpack('>II', data[16:24])
+        return None
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return struct.unpack('<HH', data[6:10]) if len(data) >= 10 else None
+    if data.startswith(b'\xff\xd8'):
+        return _jpeg_dimensions(data)
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return _webp_dimensions(data)
+    return None
+
+
+def _read_dimensions(chunks):
+    """Feed chunks to parse_dimensions until it answers or PROBE_MAX_BYTES is read"""
+    data = b''
+    for chunk in chunks:
+        data += chunk
+        dimensions = parse_dimensions(data)
+        if dimensions is not None or len(data) >= PROBE_MAX_BYTES:
+            return dimensions
+    return parse_dimensions(data)
+
+
+def probe_file(path):
+    with open(path, 'rb') as f:
+        return _read_dimensions(iter(lambda: f.read(PROBE_CHUNK), b''))
+
+
+def probe_url(url, timeout=10):
+    """
+    Read just enough of url to parse its dimensions
+
+    Asks for the first PROBE_MAX_BYTES with a Range header and stops reading
+    as soon as the size is known; servers that ignore Range are cut off the
+    same way.
+    """
+    headers = {'Range': f'bytes=0-{PROBE_MAX_BYTES - 1}', 'Accept-Encoding': 'identity'}
+    with http_client.get(url, headers=headers, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        return _read_dimensions(response.iter_content(PROBE_CHUNK))
+
+
+def probe_dimensions(source, timeout=10):
+    """
+    (width, height) of a local image or image URL, reading only its header
+
+    Results are memoized per URL, or per path and modification time.
+
+    Returns:
+        tuple: (width, height), or None if the header couldn't be parsed
+
+    Raises:
+        OSError / requests.RequestException: If the image can't be read
+    """
+    remote = source.startswith(('http://', 'https://'))
+    if remote:
+        key = source
+    else:
+        stat = os.stat(source)
+        key = (os.path.abspath(source), stat.st_mtime_ns, stat.st_size)
+
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    dimensions = probe_url(source, timeout) if remote else probe_file(source)
+    if dimensions is not None:
+        with _cache_lock:
+            _cache[key] = dimensions
+            if len(_cache) > PROBE_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return dimensions
@@ -0,0 +1,293 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from io import BytesIO
+from collections import Counter
+from PIL import Image
+import http_client
+from store import SQLiteStore
+from singleflight import SingleFlight
+from image_probe import probe_dimensions
+
+IMAGE_STORE_FOLDER = os.path.join('product_data', 'images')
+
+# Total blob size kept on disk before least recently used blobs are evicted
+IMAGE_STORE_MAX_BYTES = int(os.environ.get('IMAGE_STORE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Eviction frees space down to this share of the limit, so it doesn't run
+# on every insert once the store is full
+EVICT_TO_SHARE = 0.9
+
+# Times checkout() re-fetches a blob that was evicted before it could be pinned
+CHECKOUT_ATTEMPTS = 3
+
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+
+
+class ImageIndex(SQLiteStore):
+    """URL → blob mapping and blob metadata for the image store"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS image_urls (
+            url TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_image_urls_sha256 ON image_urls(sha256);
+        CREATE TABLE IF NOT EXISTS image_blobs (
+            sha256 TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            format TEXT,
+            last_used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_image_blobs_last_used ON image_blobs(last_used);
+    """
+
+    COLUMNS = 'b.sha256, b.path, b.size, b.width, b.height, b.format, u.etag, u.last_modified'
+
+    @staticmethod
+    def _row_to_dict(row):
+        sha256, path, size, width, height, fmt, etag, last_modified = row
+        return {
+            "sha256": sha256,
+            "path": path,
+            "size": size,
+            "width": width,
+            "height": height,
+            "format": fmt,
+            "etag": etag,
+            "last_modified": last_modified
+        }
+
+    def lookup(self, url):
+        """Return url's blob metadata and mark it used, or None"""
+        conn = self._connect()
+        row = conn.execute(
+            f'SELECT {self.COLUMNS} FROM image_urls u JOIN image_blobs b ON b.sha256 = u.sha256 '
+            'WHERE u.url = ?', (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE image_blobs SET last_used = ? WHERE sha256 = ?', (time.time(), row[0]))
+        return self._row_to_dict(row)
+
+    def add(self, url, blob, etag=None, last_modified=None):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO image_blobs (sha256, path, size, width, height, format, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (blob['sha256'], blob['path'], blob['size'], blob['width'], blob['height'], blob['format'], now)
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO image_urls (url, sha256, etag, last_modified, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (url, blob['sha256'], etag, last_modified, now)
+            )
+
+    def total_size(self):
+        return self._connect().execute('SELECT COALESCE(SUM(size), 0) FROM image_blobs').fetchone()[0]
+
+    def evict(self, target_size, keep=None):
+        """
+        Drop least recently used blobs until the total is at most target_size,
+        never dropping the blobs whose sha256 is in keep
+
+        Returns:
+            list: Paths of the evicted blobs, for the caller to delete
+        """
+        evicted = []
+        with self._transaction() as conn:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM image_blobs').fetchone()[0]
+            for sha256, path, size in conn.execute(
+                'SELECT sha256, path, size FROM image_blobs ORDER BY last_used'
+            ).fetchall():
+                if total <= target_size:
+                    break
+                if keep and sha256 in keep:
+                    continue
+                conn.execute('DELETE FROM image_urls WHERE sha256 = ?', (sha256,))
+                conn.execute('DELETE FROM image_blobs WHERE sha256 = ?', (sha256,))
+                evicted.append(path)
+                total -= size
+        return evicted
+
+    def counts(self):
+        urls = self._connect().execute('SELECT COUNT(*) FROM image_urls').fetchone()[0]
+        blobs = self._connect().execute('SELECT COUNT(*) FROM image_blobs').fetchone()[0]
+        return urls, blobs
+
+
+class ImageStore:
+    """
+    Content-addressed on-disk cache of remote images
+
+    Each URL is downloaded once; its bytes are stored under their sha256
+    (so the same image behind several URLs is stored once) together with
+    its dimensions, format and HTTP validators. Blobs are evicted least
+    recently used first once the store outgrows max_bytes, except those
+    checked out by a reader in this process.
+    """
+
+    def __init__(self, folder=IMAGE_STORE_FOLDER, max_bytes=IMAGE_STORE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+        self.index = ImageIndex(os.path.join(folder, 'index.db'))
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        # Checked-out blobs by sha256; guards picking and deleting evicted
+        # blobs too, so a blob can't be checked out halfway through
+        self._pins = Counter()
+        self._pins_lock = threading.Lock()
+        self._stats = {'hits': 0, 'downloads': 0, 'revalidated': 0, 'evicted': 0}
+
+    def fetch(self, url, timeout=10, revalidate=False):
+        """
+        Return url's stored image, downloading it on first use
+
+        Args:
+            url (str): Image URL
+            timeout (float): Download timeout in seconds
+            revalidate (bool): Send a conditional request even if stored
+
+        Returns:
+            dict: sha256, path, size, width, height, format, etag, last_modified
+
+        Raises:
+            requests.RequestException: If the download fails
+            PIL.UnidentifiedImageError: If the response isn't an image
+        """
+        entry = self.index.lookup(url)
+        if entry is not None and not revalidate and os.path.exists(entry['path']):
+            with self._lock:
+                self._stats['hits'] += 1
+            return entry
+        # Concurrent requests for the same URL share one download
+        result, _ = self._flights.do(url, self._download, url, timeout, entry)
+        return result
+
+    def checkout(self, url, timeout=10):
+        """
+        Like fetch, but the blob is kept from eviction until release(entry),
+        so its path stays valid for whoever reads it meanwhile (this process
+        or a worker the path is handed to)
+        """
+        for _ in range(CHECKOUT_ATTEMPTS):
+            entry = self.fetch(url, timeout=timeout)
+            with self._pins_lock:
+                if os.path.exists(entry['path']):
+                    self._pins[entry['sha256']] += 1
+                    return entry
+            # Evicted between the fetch and the pin; fetch downloads it again
+        raise FileNotFoundError(f"Image for {url} was evicted {CHECKOUT_ATTEMPTS} times before it could be read")
+
+    def release(self, entry):
+        """Let a checked-out blob be evicted again"""
+        with self._pins_lock:
+            self._pins[entry['sha256']] -= 1
+            if self._pins[entry['sha256']] <= 0:
+                del self._pins[entry['sha256']]
+
+    def dimensions(self, url, timeout=10):
+        """
+        (width, height) of url's image
+
+        Stored images answer from the index; others are probed from their
+        first few KB, downloading the whole image only if that fails.
+        """
+        entry = self.index.lookup(url)
+        if entry is None:
+            try:
+                dimensions = probe_dimensions(url, timeout=timeout)
+            except Exception as e:
+                print(f"Error probing image dimensions for {url}: {e}")
+                dimensions = None
+            if dimensions is not None:
+                return dimensions
+            entry = self.fetch(url, timeout=timeout)
+        return entry['width'], entry['height']
+
+    def _download(self, url, timeout, entry):
+        if entry is not None and os.path.exists(entry['path']):
+            response = http_client.conditional_get(
+                url, etag=entry['etag'], last_modified=entry['last_modified'], timeout=timeout
+            )
+            if response.status_code == 304:
+                with self._lock:
+                    self._stats['revalidated'] += 1
+                return entry
+        else:
+            response = http_client.get(url, timeout=timeout)
+        response.raise_for_status()
+        data = response.content
+
+        img = Image.open(BytesIO(data))
+        blob = {
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "size": len(data),
+            "width": img.width,
+            "height": img.height,
+            "format": img.format
+        }
+        blob['path'] = self._write_blob(blob['sha256'], FORMAT_EXTENSIONS.get(img.format, ''), data)
+        validators = http_client.get_validators(response)
+        self.index.add(url, blob, validators['http_etag'], validators['http_last_modified'])
+        with self._lock:
+            self._stats['downloads'] += 1
+
+        if self.index.total_size() > self.max_bytes:
+            self._evict(keep=blob['sha256'])
+        return {**blob, "etag": validators['http_etag'], "last_modified": validators['http_last_modified']}
+
+    def _write_blob(self, sha256, extension, data):
+        folder = os.path.join(self.folder, sha256[:2])
+        path = os.path.abspath(os.path.join(folder, sha256 + extension))
+        if not os.path.exists(path):
+            os.makedirs(folder, exist_ok=True)
+            # Write then rename, so readers never see a partial blob
+            fd, tmp_path = tempfile.mkstemp(dir=folder)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return path
+
+    def _evict(self, keep=None):
+        with self._pins_lock:
+            keep = set(self._pins) | {keep}
+            evicted = self.index.evict(int(self.max_bytes * EVICT_TO_SHARE), keep=keep)
+            for path in evicted:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            self._stats['evicted'] += len(evicted)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['urls'], stats['blobs'] = self.index.counts()
+        stats['bytes'] = self.index.total_size()
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_image_store():
+    """The process-wide image store under product_data/images"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ImageStore()
+    return _default_store
@@ -0,0 +1,202 @@
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+# Downscales of at least this ratio first shrink by an integer factor
+# (JPEG draft decoding or Image.reduce) and then resample the remaining
+# <= REDUCING_GAP x step with a cheaper filter; smaller downscales use
+# LANCZOS on the full image, where its sharpness is visible.
+REDUCE_RATIO = 2.0
+REDUCING_GAP = 2.0
+
+DEFAULT_BACKGROUND = (255, 255, 255)
+
+# Decoded pixels kept by thumbnail_cache; an imaging pool divides this
+# between its workers, so the total stays the same for any pool size
+THUMBNAIL_CACHE_BYTES = int(os.environ.get('THUMBNAIL_CACHE_BYTES', 64 * 1024 * 1024))
+
+
+def fit_size(size, box):
+    """Largest size with size's aspect ratio that fits in box, never upscaling"""
+    width, height = size
+    scale = min(box[0] / width, box[1] / height, 1.0)
+    return max(round(width * scale), 1), max(round(height * scale), 1)
+
+
+def downscale_ratio(size, target):
+    return max(size[0] / target[0], size[1] / target[1])
+
+
+def pick_filter(size, target):
+    """Resampling filter for scaling an image of size down to target"""
+    if downscale_ratio(size, target) >= REDUCE_RATIO:
+        return Image.Resampling.BICUBIC
+    return Image.Resampling.LANCZOS
+
+
+def to_rgb(img, background=DEFAULT_BACKGROUND):
+    """
+    Convert any mode to RGB, flattening transparency onto background
+
+    Plain convert('RGB') turns transparent pixels black (or whatever color
+    they happen to hold), which shows as dark boxes around product cutouts.
+    """
+    if img.mode == 'RGB':
+        return img
+    if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        flattened = Image.new('RGB', img.size, background)
+        flattened.paste(img, mask=img.getchannel('A'))
+        return flattened
+    return img.convert('RGB')
+
+
+def load_thumbnail(source, box, background=DEFAULT_BACKGROUND):
+    """
+    Decode an image straight to an RGB thumbnail that fits in box
+
+    JPEGs are decoded with draft mode at the smallest 1/2, 1/4 or 1/8 scale
+    that still covers the target, so a 1080p collage destined for a 300px
+    overlay never exists in memory at full size.
+
+    Args:
+        source: Path or file object
+        box (tuple): (max width, max height)
+        background (tuple): Color transparent pixels are flattened onto
+
+    Returns:
+        PIL.Image.Image: RGB image no larger than box
+    """
+    img = Image.open(source)
+    target = fit_size(img.size, box)
+    if img.format == 'JPEG':
+        img.draft('RGB', target)
+    # Palette images can only be resampled after expanding them; everything
+    # else is scaled first so transparency is flattened at the small size
+    if img.mode == 'P':
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    elif img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        img = img.convert('RGB')
+    return to_rgb(scale_to(img, target), background)
+
+
+def scale_to(img, target):
+    """Resize img to exactly target with a filter suited to the ratio"""
+    if img.size == target:
+        return img
+    resample = pick_filter(img.size, target)
+    reducing_gap = REDUCING_GAP if resample != Image.Resampling.LANCZOS else None
+    return img.resize(target, resample, reducing_gap=reducing_gap)
+
+
+def write_renditions(img, base_path, sizes, formats=('JPEG',), quality=85):
+    """
+    Save downscaled copies of img next to base_path
+
+    Each size is the longest side in pixels; a rendition is written as
+    "<base_path>_<size>.<ext>" for every format. Sizes at or above img's
+    own longest side are skipped.
+
+    Returns:
+        list: {"size", "format", "path"} dicts, smallest first
+    """
+    extensions = {'JPEG': '.jpg', 'WEBP': '.webp'}
+    renditions = []
+    for size in sorted(sizes):
+        if size >= max(img.size):
+            continue
+        scaled = scale_to(img, fit_size(img.size, (size, size)))
+        for fmt in formats:
+            path = f"{base_path}_{size}{extensions[fmt]}"
+            options = {'optimize': True} if fmt == 'JPEG' else {}
+            scaled.save(path, fmt, quality=quality, **options)
+            renditions.append({"size": size, "format": fmt.lower(), "path": path})
+    return renditions
+
+
+def nearest_rendition(original_path, size, sizes, fmt='jpeg'):
+    """
+    Path of the smallest rendition of original_path covering size
+
+    Falls back to the original when no rendition is large enough or none
+    has been written yet.
+    """
+    base_path = os.path.splitext(original_path)[0]
+    extension = {'jpeg': '.jpg', 'webp': '.webp'}[fmt]
+    for candidate in sorted(sizes):
+        if candidate >= size:
+            path = f"{base_path}_{candidate}{extension}"
+            if os.path.exists(path):
+                return path
+    return original_path
+
+
+class ThumbnailCache:
+    """
+    Bounded LRU of decoded thumbnails keyed by path, mtime and box
+
+    A changed file gets a new mtime and so misses. Cached images are shared
+    between callers and must not be modified; pasting them is fine.
+    """
+
+    def __init__(self, max_bytes=THUMBNAIL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, box, background=DEFAULT_BACKGROUND, counts=None):
+        """
+        load_thumbnail(path, box, background), served from memory when possible
+
+        Args:
+            counts (dict): Optional {"hits", "misses"} tally for the caller
+        """
+        key = (os.path.abspath(path), os.stat(path).st_mtime_ns, tuple(box), tuple(background))
+        with self._lock:
+            img = self._entries.get(key)
+            if img is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if counts is not None:
+            counts['hits' if img is not None else 'misses'] += 1
+        if img is not None:
+            return img
+
+        img = load_thumbnail(path, box, background)
+        size = img.width * img.height * len(img.getbands())
+        with self._lock:
+            if key not in self._entries and size <= self.max_bytes:
+                self._entries[key] = img
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= evicted.width * evicted.height * len(evicted.getbands())
+        return img
+
+    def resize(self, max_bytes):
+        """Change the byte budget, evicting least recently used entries to fit"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.width * evicted.height * len(evicted.getbands())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+# Shared by everything in this process, including imaging pool workers
+thumbnail_cache = ThumbnailCache()
@@ -0,0 +1,153 @@
+import os
+import time
+import zlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, ImageFont
+from imaging import THUMBNAIL_CACHE_BYTES, thumbnail_cache
+
+# Worker processes for CPU-bound imaging (decoding, resampling, compositing,
+# encoding). 0 runs tasks inline in the calling thread.
+IMAGING_WORKERS = int(os.environ.get('IMAGING_WORKERS', os.cpu_count() or 1))
+
+
+def warm_up(workers=1):
+    """
+    Load Pillow's codecs and fonts so a worker's first real task isn't slow,
+    and give the worker its share of the thumbnail cache budget
+    """
+    thumbnail_cache.resize(THUMBNAIL_CACHE_BYTES // max(workers, 1))
+    Image.init()
+    ImageFont.load_default()
+    Image.new('RGB', (8, 8)).resize((4, 4), Image.Resampling.LANCZOS)
+    return os.getpid()
+
+
+class ImagingPool:
+    """
+    Process pool for Pillow work that would otherwise hold the GIL in
+    request and job threads
+
+    Tasks are module-level functions taking and returning file paths and
+    small metadata; image bytes stay on disk instead of being pickled
+    between processes.
+
+    Each worker is a single-process lane. Tasks go to the least busy lane,
+    or, when run() is given a key, always to the same lane for that key, so
+    work that benefits from a worker's thumbnail cache (overlays for one
+    canvas) finds it warm.
+
+    Workers come from a fork server (spawn where that isn't available), so
+    they never inherit the server's threads, locks or SQLite connections,
+    and a lane can be rebuilt safely if its worker dies. Each worker runs
+    warm_up() as it starts and keeps 1/workers of THUMBNAIL_CACHE_BYTES
+    in its thumbnail cache. Until start() has every worker up, tasks run
+    inline.
+    """
+
+    def __init__(self, workers=IMAGING_WORKERS):
+        self.workers = workers
+        self._lanes = []
+        self._pending = []
+        self._turn = 0
+        self._lock = threading.Lock()
+        self._stats = {'tasks': 0, 'errors': 0, 'restarts': 0, 'task_seconds': 0.0}
+
+    @staticmethod
+    def _context():
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            # Loaded once in the fork server and inherited by every worker.
+            # Workers also re-import the main module, which is why the server
+            # runs from main.py rather than app.py.
+            context.set_forkserver_preload(['collage'])
+            return context
+        return multiprocessing.get_context('spawn')
+
+    def _new_lane(self, context):
+        return ProcessPoolExecutor(
+            max_workers=1, mp_context=context,
+            initializer=warm_up, initargs=(self.workers,)
+        )
+
+    def start(self):
+        """Start the workers and wait until each has warmed up"""
+        if self.workers <= 0:
+            return
+        context = self._context()
+        lanes = [self._new_lane(context) for _ in range(self.workers)]
+        # Workers start on demand; one task per lane brings them all up now
+        for future in [lane.submit(os.getpid) for lane in lanes]:
+            future.result()
+        with self._lock:
+            self._lanes = lanes
+            self._pending = [0] * len(lanes)
+        print(f"Imaging pool started with {self.workers} workers")
+
+    def ready(self):
+        with self._lock:
+            return bool(self._lanes)
+
+    def run(self, fn, *args, key=None, timeout=None):
+        """
+        Run fn(*args) on a worker and return its result
+
+        Args:
+            key (str): Optional affinity key; tasks with the same key run on
+                the same worker
+
+        Raises:
+            Whatever fn raised, or concurrent.futures.TimeoutError
+        """
+        start = time.perf_counter()
+        index = None
+        try:
+            with self._lock:
+                if self._lanes:
+                    if key is not None:
+                        index = zlib.crc32(key.encode()) % len(self._lanes)
+                    else:
+                        # Least busy lane, taking turns between equally busy ones
+                        count = len(self._lanes)
+                        self._turn = (self._turn + 1) % count
+                        order = [(self._turn + i) % count for i in range(count)]
+                        index = min(order, key=self._pending.__getitem__)
+                    lane = self._lanes[index]
+                    self._pending[index] += 1
+            if index is None:
+                return fn(*args)
+            try:
+                return lane.submit(fn, *args).result(timeout=timeout)
+            except BrokenProcessPool:
+                self._restart(index, lane)
+                raise
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                if index is not None:
+                    self._pending[index] -= 1
+                self._stats['tasks'] += 1
+                self._stats['task_seconds'] += time.perf_counter() - start
+
+    def _restart(self, index, broken):
+        with self._lock:
+            if self._lanes[index] is not broken:
+                return
+            self._lanes[index] = lane = self._new_lane(self._context())
+            self._stats['restarts'] += 1
+        print(f"Imaging worker {index} broke, restarting it")
+        broken.shutdown(wait=False, cancel_futures=True)
+        lane.submit(os.getpid).result()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['busy_workers'] = sum(1 for pending in self._pending if pending)
+        stats['workers'] = self.workers
+        stats['task_seconds'] = round(stats['task_seconds'], 3)
+        return stats
@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import socket
+import threading
+from store import SQLiteStore
+
+# How long an idle worker sleeps before re-checking the table for jobs
+# queued by another process
+POLL_INTERVAL = 1.0
+
+# Finished jobs kept for /jobs timing history
+JOB_HISTORY = 500
+
+# How long a claimed job belongs to its worker without being renewed. The
+# queue renews its jobs' leases every LEASE_SECONDS / 3 while they run, so a
+# job still running when its lease expires is assumed abandoned (its process
+# died) and is claimed again.
+LEASE_SECONDS = 120
+
+# Claims before an abandoned job is given up on as failed, so a job that
+# kills its process isn't re-leased forever
+MAX_ATTEMPTS = 3
+
+
+class JobStore(SQLiteStore):
+    """
+    Durable job table, one row per key (url_hash)
+
+    A key has at most one job: enqueueing a key that is already pending
+    replaces its payload, and enqueueing a running key marks it to run
+    again once the current run finishes. Running jobs are leased to the
+    worker that claimed them; several processes can share the table.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS collage_jobs (
+            url_hash TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            rerun INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            enqueued_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            error TEXT,
+            owner TEXT,
+            lease_expires REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_collage_jobs_status ON collage_jobs(status, enqueued_at);
+    """
+
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        # Tables created before leases existed
+        conn = self._connect()
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(collage_jobs)')}
+        for column, kind in (('owner', 'TEXT'), ('lease_expires', 'REAL')):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE collage_jobs ADD COLUMN {column} {kind}')
+
+    def enqueue(self, url_hash, payload, max_pending):
+        """
+        Returns:
+            str: "queued", "deduplicated", or "rejected" if max_pending
+                jobs are already waiting
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT status FROM collage_jobs WHERE url_hash = ?', (url_hash,)
+            ).fetchone()
+            if row and row[0] == 'pending':
+                conn.execute(
+                    'UPDATE collage_jobs SET payload = ? WHERE url_hash = ?',
+                    (json.dumps(payload), url_hash)
+                )
+                return 'deduplicated'
+            if row and row[0] == 'running':
+                conn.execute(
+                    'UPDATE collage_jobs SET payload = ?, rerun = 1 WHERE url_hash = ?',
+                    (json.dumps(payload), url_hash)
+                )
+                return 'deduplicated'
+
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM collage_jobs WHERE status = 'pending'"
+            ).fetchone()[0]
+            if pending >= max_pending:
+                return 'rejected'
+
+            conn.execute(
+                'INSERT OR REPLACE INTO collage_jobs (url_hash, status, payload, enqueued_at) '
+                "VALUES (?, 'pending', ?, ?)",
+                (url_hash, json.dumps(payload), time.time())
+            )
+            return 'queued'
+
+    def claim(self, owner, lease_seconds=LEASE_SECONDS):
+        """
+        Lease the oldest pending job, or a running one whose lease expired,
+        to owner and return it, or None
+
+        Abandoned jobs already claimed MAX_ATTEMPTS times are marked failed
+        instead.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE collage_jobs SET status = 'failed', finished_at = ?, error = ?, "
+                'owner = NULL, lease_expires = NULL '
+                "WHERE status = 'running' AND COALESCE(lease_expires, 0) < ? AND attempts >= ?",
+                (now, f'abandoned after {MAX_ATTEMPTS} attempts', now, MAX_ATTEMPTS)
+            )
+            row = conn.execute(
+                "SELECT url_hash, payload FROM collage_jobs WHERE status = 'pending' "
+                "OR (status = 'running' AND COALESCE(lease_expires, 0) < ?) "
+                'ORDER BY enqueued_at LIMIT 1',
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE collage_jobs SET status = 'running', rerun = 0, attempts = attempts + 1, "
+                'started_at = ?, finished_at = NULL, error = NULL, owner = ?, lease_expires = ? '
+                'WHERE url_hash = ?',
+                (now, owner, now + lease_seconds, row[0])
+            )
+            return row[0], json.loads(row[1])
+
+    def renew(self, owner, lease_seconds=LEASE_SECONDS):
+        """Extend the lease of every job owner is running; returns how many"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE collage_jobs SET lease_expires = ? WHERE status = 'running' AND owner = ?",
+                (time.time() + lease_seconds, owner)
+            ).rowcount
+
+    def finish(self, url_hash, owner, error=None):
+        """
+        Record a finished run, unless owner's lease was lost to another worker
+
+        Returns:
+            bool: True if the job was re-queued because it was enqueued again
+                while running
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT rerun, owner FROM collage_jobs WHERE url_hash = ?', (url_hash,)
+            ).fetchone()
+            if row and row[1] != owner:
+                return False
+            if row and row[0]:
+                conn.execute(
+                    "UPDATE collage_jobs SET status = 'pending', rerun = 0, attempts = 0, enqueued_at = ?, "
+                    'owner = NULL, lease_expires = NULL WHERE url_hash = ?',
+                    (time.time(), url_hash)
+                )
+                return True
+            conn.execute(
+                'UPDATE collage_jobs SET status = ?, finished_at = ?, error = ?, '
+                'owner = NULL, lease_expires = NULL WHERE url_hash = ?',
+                ('failed' if error else 'done', time.time(), error, url_hash)
+            )
+            conn.execute(
+                "DELETE FROM collage_jobs WHERE status IN ('done', 'failed') AND url_hash NOT IN ("
+                "SELECT url_hash FROM collage_jobs WHERE status IN ('done', 'failed') "
+                'ORDER BY finished_at DESC LIMIT ?)',
+                (JOB_HISTORY,)
+            )
+            return False
+
+    def status(self, url_hash):
+        row = self._connect().execute(
+            'SELECT status FROM collage_jobs WHERE url_hash = ?', (url_hash,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def counts(self):
+        rows = self._connect().execute(
+            'SELECT status, COUNT(*) FROM collage_jobs GROUP BY status'
+        ).fetchall()
+        counts = {'pending': 0, 'running': 0, 'done': 0, 'failed': 0}
+        counts.update(dict(rows))
+        return counts
+
+    def list_jobs(self, status=None, limit=50):
+        """Most recently enqueued jobs first, with per-job timing"""
+        query = ('SELECT url_hash, status, attempts, enqueued_at, started_at, finished_at, error '
+                 'FROM collage_jobs')
+        params = []
+        if status:
+            query += ' WHERE status = ?'
+            params.append(status)
+        query += ' ORDER BY enqueued_at DESC LIMIT ?'
+        params.append(limit)
+
+        jobs = []
+        for url_hash, status, attempts, enqueued_at, started_at, finished_at, error in \
+                self._connect().execute(query, params).fetchall():
+            jobs.append({
+                "url_hash": url_hash,
+                "status": status,
+                "attempts": attempts,
+                "enqueued_at": enqueued_at,
+                "started_at": started_at,
+                "finished_at": finished_at,
+                "wait_seconds": round(started_at - enqueued_at, 3) if started_at and started_at >= enqueued_at else None,
+                "run_seconds": round(finished_at - started_at, 3) if finished_at and started_at else None,
+                "error": error
+            })
+        return jobs
+
+
+class JobQueue:
+    """
+    Fixed pool of worker threads draining a JobStore
+
+    handler(payload, url_hash) runs for each job and returns a falsy value
+    (or raises) on failure. Jobs survive restarts: a job left running by a
+    process that died is claimed again once its lease expires, up to
+    MAX_ATTEMPTS times. Leases of running jobs are renewed in the background,
+    so a job may run longer than LEASE_SECONDS.
+    """
+
+    def __init__(self, store, handler, workers=2, max_pending=200):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = threading.Condition()
+        # Bumped by every submit, so a worker can tell whether one happened
+        # while it was claiming
+        self._submits = 0
+        self._finished = threading.Condition()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"collage-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._renew_leases, name="collage-leases", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def submit(self, url_hash, payload):
+        """
+        Queue a job for url_hash, merging it with any queued or running one
+
+        Returns:
+            bool: False if the queue is full and the job was dropped
+        """
+        outcome = self.store.enqueue(url_hash, payload, self.max_pending)
+        if outcome == 'rejected':
+            print(f"Collage queue full ({self.max_pending} pending), dropping job for {url_hash}")
+            return False
+        with self._wakeup:
+            self._submits += 1
+            self._wakeup.notify()
+        return True
+
+    def wait(self, url_hash, timeout=None):
+        """
+        Block until url_hash's job (if any) finishes
+
+        Jobs finished by this process's workers wake the waiter at once;
+        the job's row is also re-checked every POLL_INTERVAL, which covers
+        jobs run by another process sharing the table.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.store.status(url_hash) in ('pending', 'running'):
+            remaining = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, deadline - time.monotonic())
+            if remaining <= 0:
+                return
+            with self._finished:
+                self._finished.wait(remaining)
+
+    def _work(self):
+        while True:
+            # Claim outside the condition, so submit() never waits on SQLite
+            # behind a claim; a submit since the snapshot may be the job the
+            # claim missed, so skip the wait then
+            with self._wakeup:
+                submits = self._submits
+            job = self.store.claim(self.owner)
+            if job is None:
+                with self._wakeup:
+                    if self._submits == submits:
+                        self._wakeup.wait(POLL_INTERVAL)
+                continue
+            url_hash, payload = job
+
+            error = None
+            try:
+                if not self.handler(payload, url_hash):
+                    error = 'handler returned no result'
+            except Exception as e:
+                error = str(e)
+                print(f"Collage job {url_hash} failed: {e}")
+
+            self.store.finish(url_hash, self.owner, error)
+            with self._finished:
+                self._finished.notify_all()
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(LEASE_SECONDS / 3)
+            try:
+                self.store.renew(self.owner)
+            except Exception as e:
+                print(f"Collage lease renewal failed: {e}")
+
+    def stats(self):
+        counts = self.store.counts()
+        return {
+            "depth": counts['pending'],
+            "running": counts['running'],
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "counts": counts
+        }
@@ -0,0 +1,299 @@
+import os
+import time
+import queue
+import random
+import threading
+from collections import deque
+from cerebras.cloud.sdk import Cerebras, APIConnectionError, APIStatusError
+from context_builder import estimate_tokens
+
+# Completions in flight at once across the whole process
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 4))
+
+# Attempts after the first for errors worth retrying (connection errors,
+# timeouts, 408/409/429 and 5xx responses)
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+# Hedging: when a request hasn't produced its first token by the p95 of
+# recent time-to-first-token, send a duplicate and use whichever answers
+# first. Off unless LLM_HEDGE=1, since it can double token spend.
+LLM_HEDGE = os.environ.get('LLM_HEDGE', '').lower() in ('1', 'true')
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 1.0
+
+# Point at another OpenAI-compatible server, e.g. testers/llm_stub_server.py
+LLM_BASE_URL = os.environ.get('CEREBRAS_BASE_URL') or None
+
+# Recent calls kept for /stats
+CALL_HISTORY = 200
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def is_retryable(error):
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class LLMGateway:
+    """
+    Shared entry point for Cerebras completions
+
+    Reuses one client (and so one HTTP connection pool) per API key and base
+    URL, caps completions in flight, retries transient failures with
+    jittered exponential backoff, optionally hedges slow requests, and
+    records tokens and latency per call.
+    """
+
+    def __init__(self, api_key=None, base_url=LLM_BASE_URL, max_concurrency=LLM_MAX_CONCURRENCY,
+                 max_retries=LLM_MAX_RETRIES, hedge=LLM_HEDGE):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._in_flight = 0
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=CALL_HISTORY)
+        self._first_token_seconds = deque(maxlen=CALL_HISTORY)
+        self._stats = {
+            'calls': 0,
+            'errors': 0,
+            'retries': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0
+        }
+
+    def get_client(self):
+        """Return the shared client for the current API key and base URL"""
+        api_key = self.api_key or os.environ.get("CEREBRAS_API_KEY")
+        key = (api_key, self.base_url)
+        with self._clients_lock:
+            client = self._clients.get(key)
+            if client is None:
+                kwargs = {'api_key': api_key}
+                if self.base_url:
+                    kwargs['base_url'] = self.base_url
+                # Retries are done here, where they can be logged and hedged
+                client = self._clients[key] = Cerebras(max_retries=0, **kwargs)
+        return client
+
+    def stream_chat(self, messages, **params):
+        """
+        Stream a chat completion, yielding text deltas
+
+        Holds one in-flight slot per request sent (two while a hedge races
+        the original) and keeps the winning stream's slot until the
+        generator is exhausted or closed; closing it early (e.g. once the
+        answer is complete) drops the underlying stream. Failures are retried
+        only before the first token, since callers may already have acted
+        on streamed output after that.
+        """
+        record = {
+            'model': params.get('model'),
+            'started_at': time.time(),
+            'attempts': 0,
+            'hedged': False,
+            'error': None
+        }
+        start = time.perf_counter()
+        text = []
+        usage = None
+        stream = None
+
+        try:
+            # The returned stream comes with the slot it was opened under
+            stream, chunks, first_chunk = self._open_stream(messages, params, record)
+            record['first_token_seconds'] = round(time.perf_counter() - start, 3)
+            with self._lock:
+                self._first_token_seconds.append(time.perf_counter() - start)
+
+            first = [first_chunk] if first_chunk is not None else []
+            for chunk in self._chain(first, chunks):
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ''
+                if delta:
+                    text.append(delta)
+                    yield delta
+        except Exception as e:
+            record['error'] = str(e)
+            raise
+        finally:
+            if stream is not None:
+                close = getattr(stream, 'close', None)
+                if close:
+                    close()
+                self._release_slot()
+            self._record(record, messages, ''.join(text), usage, time.perf_counter() - start)
+
+    def _acquire_slot(self, blocking=True):
+        if not self._slots.acquire(blocking=blocking):
+            return False
+        with self._lock:
+            self._in_flight += 1
+        return True
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    @staticmethod
+    def _chain(first, rest):
+        yield from first
+        yield from rest
+
+    def _open_stream(self, messages, params, record):
+        """
+        Open a stream and wait for its first chunk, retrying and hedging
+
+        No slot is held while backing off between attempts.
+
+        Returns:
+            tuple: (stream, its chunk iterator, first chunk or None if the
+                stream was empty); the caller owns the stream's in-flight
+                slot and must release it once the stream is closed
+        """
+        for attempt in range(self.max_retries + 1):
+            record['attempts'] += 1
+            try:
+                return self._first_response(messages, params, record)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY)
+                delay = random.uniform(delay / 2, delay)
+                with self._lock:
+                    self._stats['retries'] += 1
+                print(f"LLM call failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _hedge_delay(self):
+        with self._lock:
+            samples = list(self._first_token_seconds)
+        if not self.hedge or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(_percentile(samples, 0.95), HEDGE_MIN_DELAY)
+
+    def _first_response(self, messages, params, record):
+        """One try of _open_stream(): a slot per request sent, the winner's kept"""
+        self._acquire_slot()
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is None:
+            try:
+                stream = self.get_client().chat.completions.create(messages=messages, stream=True, **params)
+                chunks = iter(stream)
+                return stream, chunks, next(chunks, None)
+            except BaseException:
+                self._release_slot()
+                raise
+
+        # Race the original against a duplicate sent once it's slower than p95
+        results = queue.Queue()
+        winner = []
+        winner_lock = threading.Lock()
+
+        def attempt(index):
+            # Runs holding a slot; the winner's goes with its stream to the
+            # caller, a loser's is released once its request is closed
+            won = False
+            try:
+                try:
+                    stream = self.get_client().chat.completions.create(messages=messages, stream=True, **params)
+                    chunks = iter(stream)
+                    first = next(chunks, None)
+                except Exception as e:
+                    results.put((index, None, None, None, e))
+                    return
+                with winner_lock:
+                    won = not winner
+                    if won:
+                        winner.append(index)
+                if won:
+                    results.put((index, stream, chunks, first, None))
+                else:
+                    close = getattr(stream, 'close', None)
+                    if close:
+                        close()
+            finally:
+                if not won:
+                    self._release_slot()
+
+        threading.Thread(target=attempt, args=(0,), daemon=True).start()
+        started = 1
+        try:
+            index, stream, chunks, first, error = results.get(timeout=hedge_delay)
+        except queue.Empty:
+            # Only hedge while the gateway has spare capacity
+            if self._acquire_slot(blocking=False):
+                record['hedged'] = True
+                with self._lock:
+                    self._stats['hedged'] += 1
+                threading.Thread(target=attempt, args=(1,), daemon=True).start()
+                started = 2
+            index, stream, chunks, first, error = results.get()
+
+        # A failed attempt only counts if no other attempt can still win
+        failures = 0
+        while error is not None:
+            failures += 1
+            if failures == started:
+                raise error
+            index, stream, chunks, first, error = results.get()
+        if index == 1:
+            with self._lock:
+                self._stats['hedge_wins'] += 1
+        return stream, chunks, first
+
+    def _record(self, record, messages, text, usage, seconds):
+        prompt_tokens = getattr(usage, 'prompt_tokens', None) if usage else None
+        completion_tokens = getattr(usage, 'completion_tokens', None) if usage else None
+        # Streams closed early never see the usage chunk
+        record['tokens_estimated'] = prompt_tokens is None
+        if prompt_tokens is None:
+            prompt_tokens = sum(estimate_tokens(message.get('content', '')) for message in messages)
+            completion_tokens = estimate_tokens(text)
+        record['prompt_tokens'] = prompt_tokens
+        record['completion_tokens'] = completion_tokens
+        record['latency_seconds'] = round(seconds, 3)
+
+        with self._lock:
+            self._calls.append(record)
+            self._stats['calls'] += 1
+            self._stats['errors'] += record['error'] is not None
+            self._stats['prompt_tokens'] += prompt_tokens
+            self._stats['completion_tokens'] += completion_tokens
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            # Requests sent and not yet closed, hedges and losing attempts included
+            stats['in_flight'] = self._in_flight
+            calls = list(self._calls)
+            first_token = list(self._first_token_seconds)
+        latencies = [call['latency_seconds'] for call in calls if call['error'] is None]
+        stats['latency_p50'] = _percentile(latencies, 0.5)
+        stats['latency_p95'] = _percentile(latencies, 0.95)
+        stats['first_token_p95'] = round(_percentile(first_token, 0.95), 3) if first_token else None
+        stats['recent_calls'] = calls[-20:]
+        return stats
@@ -0,0 +1,94 @@
+import re
+import json
+
+PRODUCTS_ARRAY_PATTERN = re.compile(r'"products"\s*:\s*\[')
+
+# Give up looking for the products array after this much output
+MAX_PREAMBLE_CHARS = 20000
+
+
+class MalformedStreamError(ValueError):
+    """The streamed completion can no longer become a valid products array"""
+
+
+class ProductStreamParser:
+    """
+    Incrementally parse the "products" array out of a streamed completion
+
+    feed() takes text chunks as they arrive and returns the product objects
+    completed by that chunk, so each product can be used as soon as its
+    closing brace is received. Once the array's closing bracket arrives,
+    done is True and the rest of the stream can be dropped.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.done = False
+        self.products = []
+        self._pos = None  # scan position inside the array, once found
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = None
+
+    def feed(self, chunk):
+        """
+        Returns:
+            list: Product dicts completed by this chunk
+
+        Raises:
+            MalformedStreamError: If the output can't be a valid array
+        """
+        if self.done or not chunk:
+            return []
+        self.text += chunk
+
+        if self._pos is None:
+            match = PRODUCTS_ARRAY_PATTERN.search(self.text)
+            if match is None:
+                if len(self.text) > MAX_PREAMBLE_CHARS:
+                    raise MalformedStreamError('no "products" array in output')
+                return []
+            self._pos = match.end()
+
+        completed = []
+        text = self.text
+        while self._pos < len(text):
+            char = text[self._pos]
+            self._pos += 1
+
+            if self._depth == 0:
+                # Between array elements only separators are allowed
+                if char == '{':
+                    self._depth = 1
+                    self._object_start = self._pos - 1
+                elif char == ']':
+                    self.done = True
+                    break
+                elif char != ',' and not char.isspace():
+                    raise MalformedStreamError(f"unexpected {char!r} in products array")
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        product = json.loads(text[self._object_start:self._pos])
+                    except json.JSONDecodeError as e:
+                        raise MalformedStreamError(f"invalid product object: {e}")
+                    if not isinstance(product, dict):
+                        raise MalformedStreamError('product is not an object')
+                    self.products.append(product)
+                    completed.append(product)
+        return completed
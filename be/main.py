@@ -0,0 +1,20 @@
+"""
+Development server entry point
+
+Usage:
+    python main.py
+
+Imaging pool workers re-import the main module as they start (as
+__mp_main__), running everything outside its __name__ guard. Serving from
+this file instead of app.py keeps that to nothing here, so workers load
+only the imaging modules, not the app's stores, executors and LLM client.
+"""
+
+if __name__ == '__main__':
+    import os
+    from app import app, start_background_workers
+
+    # With the reloader on, only the child it spawns (WERKZEUG_RUN_MAIN) serves
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
+    app.run(debug=True, host='0.0.0.0', port=5000)
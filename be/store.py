@@ -0,0 +1,283 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class SQLiteStore:
+    """
+    Base for the small SQLite-backed stores in product_data.
+
+    Connections are opened per thread in WAL mode with a generous busy
+    timeout, so stores can be shared by Flask request threads and
+    background workers.
+    """
+
+    SCHEMA = ''
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run the block in an immediate (write-locked) transaction"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+
+class ProductStore(SQLiteStore):
+    """
+    SQLite-backed store for scraped product data, keyed by URL hash.
+
+    Each cache entry lives in its own row, so reading or writing a single
+    product no longer parses or rewrites the whole catalog. The database runs
+    in WAL mode so readers never block the writer, and partial updates happen
+    inside an immediate transaction so concurrent writers can't lose each
+    other's changes.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS products (
+            url_hash TEXT PRIMARY KEY,
+            url TEXT,
+            timestamp TEXT,
+            updated_at REAL NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_products_timestamp ON products(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_products_updated_at ON products(updated_at);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, db_path, legacy_json_path=None):
+        """
+        Args:
+            db_path (str): Path to the SQLite database file
+            legacy_json_path (str): Optional db.json to import on first use
+        """
+        super().__init__(db_path)
+        self.legacy_json_path = legacy_json_path
+        if legacy_json_path:
+            self._migrate_legacy_json(legacy_json_path)
+
+    def _migrate_legacy_json(self, json_path):
+        """One-time import of the old whole-file db.json cache"""
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_json_migrated'").fetchone():
+            return
+        if not os.path.exists(json_path):
+            return
+
+        try:
+            with open(json_path, 'r') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            print(f"Error reading legacy cache {json_path}: {e}")
+            return
+
+        with self._transaction() as conn:
+            # Re-check inside the write lock in case another process migrated first
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_json_migrated'").fetchone():
+                return
+            for url_hash, entry in legacy.items():
+                # Existing rows are newer than the legacy file, so never overwrite them
+                conn.execute(
+                    'INSERT OR IGNORE INTO products (url_hash, url, timestamp, updated_at, data) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    self._row_values(url_hash, entry)
+                )
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('legacy_json_migrated', ?)",
+                (str(time.time()),)
+            )
+        print(f"Migrated {len(legacy)} entries from {json_path}")
+
+    @staticmethod
+    def _row_values(url_hash, entry):
+        return (
+            url_hash,
+            entry.get('url'),
+            entry.get('timestamp', ''),
+            time.time(),
+            json.dumps(entry)
+        )
+
+    def get(self, url_hash):
+        """Return the entry for url_hash, or None if it isn't stored"""
+        row = self._connect().execute(
+            'SELECT data FROM products WHERE url_hash = ?', (url_hash,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def contains(self, url_hash):
+        row = self._connect().execute(
+            'SELECT 1 FROM products WHERE url_hash = ?', (url_hash,)
+        ).fetchone()
+        return row is not None
+
+    def put(self, url_hash, entry):
+        """Insert or replace a single entry"""
+        self._connect().execute(
+            'INSERT OR REPLACE INTO products (url_hash, url, timestamp, updated_at, data) '
+            'VALUES (?, ?, ?, ?, ?)',
+            self._row_values(url_hash, entry)
+        )
+
+    def put_many(self, entries):
+        """Insert or replace several entries in one transaction"""
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO products (url_hash, url, timestamp, updated_at, data) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [self._row_values(url_hash, entry) for url_hash, entry in entries.items()]
+            )
+
+    def update(self, url_hash, **fields):
+        """
+        Atomically merge fields into an existing entry.
+
+        Returns:
+            dict: The updated entry, or None if url_hash isn't stored
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT data FROM products WHERE url_hash = ?', (url_hash,)
+            ).fetchone()
+            if row is None:
+                return None
+            entry = json.loads(row[0])
+            entry.update(fields)
+            conn.execute(
+                'UPDATE products SET url = ?, timestamp = ?, updated_at = ?, data = ? WHERE url_hash = ?',
+                self._row_values(url_hash, entry)[1:] + (url_hash,)
+            )
+            return entry
+
+    def delete(self, url_hash):
+        self._connect().execute('DELETE FROM products WHERE url_hash = ?', (url_hash,))
+
+    def all(self):
+        """Return every entry keyed by URL hash, newest timestamp first"""
+        rows = self._connect().execute(
+            'SELECT url_hash, data FROM products ORDER BY timestamp DESC'
+        ).fetchall()
+        return {url_hash: json.loads(data) for url_hash, data in rows}
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+    def version(self):
+        """Cheap change marker: (entry count, latest updated_at)"""
+        return self._connect().execute(
+            'SELECT COUNT(*), MAX(updated_at) FROM products'
+        ).fetchone()
+
+    def list_entries(self, limit=None, after=None, since=None):
+        """
+        Page through entries using the timestamp/updated_at indexes.
+
+        Without since, entries come newest timestamp first and after is the
+        (timestamp, url_hash) of the last entry on the previous page. With
+        since (epoch seconds), only entries written after it are returned,
+        oldest write first, and after is the previous page's
+        (updated_at, url_hash).
+
+        Returns:
+            list: (url_hash, entry, timestamp, updated_at) tuples
+        """
+        clauses = []
+        params = []
+        if since is not None:
+            clauses.append('updated_at > ?')
+            params.append(since)
+            if after:
+                clauses.append('(updated_at > ? OR (updated_at = ? AND url_hash > ?))')
+                params.extend([after[0], after[0], after[1]])
+            order = 'updated_at ASC, url_hash ASC'
+        else:
+            if after:
+                clauses.append('(timestamp < ? OR (timestamp = ? AND url_hash < ?))')
+                params.extend([after[0], after[0], after[1]])
+            order = 'timestamp DESC, url_hash DESC'
+
+        query = 'SELECT url_hash, data, timestamp, updated_at FROM products'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY ' + order
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+
+        rows = self._connect().execute(query, params).fetchall()
+        return [(url_hash, json.loads(data), timestamp, updated_at)
+                for url_hash, data, timestamp, updated_at in rows]
+
+
+class ExtractionStore(SQLiteStore):
+    """
+    LLM extraction results keyed by a hash of the normalized LLM request
+
+    Pages whose extraction context is identical (the same product under
+    another URL, or a re-scrape of an unchanged page) reuse the stored
+    products instead of paying for another completion. Products are stored
+    raw, before color IDs are assigned.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS extractions (
+            context_hash TEXT PRIMARY KEY,
+            products TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        );
+    """
+
+    def get(self, context_hash):
+        """Return the stored products for context_hash, or None"""
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT products FROM extractions WHERE context_hash = ?', (context_hash,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            'UPDATE extractions SET hits = hits + 1, last_used_at = ? WHERE context_hash = ?',
+            (time.time(), context_hash)
+        )
+        return json.loads(row[0])
+
+    def put(self, context_hash, products):
+        now = time.time()
+        self._connect().execute(
+            'INSERT OR REPLACE INTO extractions (context_hash, products, created_at, last_used_at) '
+            'VALUES (?, ?, ?, ?)',
+            (context_hash, json.dumps(products), now, now)
+        )
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM extractions').fetchone()[0]
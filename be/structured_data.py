@@ -0,0 +1,206 @@
+from urllib.parse import urlsplit, urlunsplit
+
+# Without these the structured result isn't usable at all
+REQUIRED_FIELDS = ['title', 'price', 'images']
+
+# Fields retailers rarely put in JSON-LD/OpenGraph; the LLM fills these in
+LLM_FILL_FIELDS = ['dimensions', 'material']
+
+CURRENCY_SYMBOLS = {'USD': '$', 'CAD': '$', 'EUR': '€', 'GBP': '£'}
+
+AVAILABILITY_LABELS = {
+    'instock': 'In stock',
+    'outofstock': 'Out of stock',
+    'limitedavailability': 'Limited availability',
+    'preorder': 'Pre-order',
+    'backorder': 'Backorder',
+    'instoreonly': 'In store only',
+    'onlineonly': 'Online only',
+    'discontinued': 'Discontinued',
+    'soldout': 'Sold out'
+}
+
+
+def _types(node):
+    node_type = node.get('@type', [])
+    return node_type if isinstance(node_type, list) else [node_type]
+
+
+def _find_product_nodes(data):
+    """Walk JSON-LD (lists, @graph, nested objects) for Product nodes"""
+    products = []
+    if isinstance(data, list):
+        for item in data:
+            products.extend(_find_product_nodes(item))
+    elif isinstance(data, dict):
+        if 'Product' in _types(data) or 'ProductGroup' in _types(data):
+            products.append(data)
+        else:
+            for value in data.values():
+                if isinstance(value, (dict, list)):
+                    products.extend(_find_product_nodes(value))
+    return products
+
+
+def _text(value):
+    """Flatten a JSON-LD value (string, Thing, list) into a string"""
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ', '.join(filter(None, (_text(item) for item in value)))
+    if isinstance(value, dict):
+        return _text(value.get('name') or value.get('value') or value.get('@id'))
+    return str(value).strip()
+
+
+def strip_url_params(url):
+    """Drop query string and fragment, as the LLM prompt asks for image URLs"""
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+
+
+def _image_urls(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [strip_url_params(value)]
+    if isinstance(value, dict):
+        return _image_urls(value.get('contentUrl') or value.get('url'))
+    urls = []
+    for item in value:
+        for url in _image_urls(item):
+            if url not in urls:
+                urls.append(url)
+    return urls
+
+
+def format_price(amount, currency=None):
+    """Format a numeric price the way the LLM does, e.g. "$349.00" """
+    if amount in (None, ''):
+        return ''
+    try:
+        amount = float(str(amount).replace(',', ''))
+    except ValueError:
+        return str(amount)
+    symbol = CURRENCY_SYMBOLS.get((currency or '').upper())
+    if symbol:
+        return f"{symbol}{amount:,.2f}"
+    return f"{amount:,.2f} {currency}".strip()
+
+
+def _offer_fields(offers):
+    """Price and availability from an Offer/AggregateOffer (or a list of them)"""
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+    if not isinstance(offers, dict):
+        return '', ''
+    amount = offers.get('price', offers.get('lowPrice'))
+    if amount is None and isinstance(offers.get('priceSpecification'), dict):
+        amount = offers['priceSpecification'].get('price')
+    price = format_price(amount, offers.get('priceCurrency'))
+    availability = _text(offers.get('availability')).rsplit('/', 1)[-1]
+    return price, AVAILABILITY_LABELS.get(availability.lower(), availability)
+
+
+def _dimension(label, value):
+    if not value:
+        return ''
+    if isinstance(value, dict):
+        unit = value.get('unitText') or value.get('unitCode') or ''
+        value = f"{value.get('value', '')} {unit}".strip()
+    return f"{label}: {value}"
+
+
+def product_from_json_ld(node):
+    """Map a schema.org Product node onto the analyze_products() dict shape"""
+    price, availability = _offer_fields(node.get('offers'))
+    dimensions = '; '.join(filter(None, [
+        _dimension('Width', node.get('width')),
+        _dimension('Height', node.get('height')),
+        _dimension('Depth', node.get('depth')),
+        _dimension('Weight', node.get('weight'))
+    ]))
+    features = '; '.join(
+        f"{_text(prop.get('name'))}: {_text(prop.get('value'))}"
+        for prop in node.get('additionalProperty', []) if isinstance(prop, dict)
+    ) if isinstance(node.get('additionalProperty'), list) else ''
+
+    return {
+        "title": _text(node.get('name')),
+        "description": _text(node.get('description')),
+        "price": price,
+        "dimensions": dimensions,
+        "images": _image_urls(node.get('image')),
+        "material": _text(node.get('material')),
+        "color": _text(node.get('color')),
+        "sku": _text(node.get('sku') or node.get('mpn') or node.get('productID')),
+        "availability": availability,
+        "features": features
+    }
+
+
+def product_from_open_graph(meta):
+    """Build a product from og:/product: meta tags"""
+    amount = meta.get('product:price:amount') or meta.get('og:price:amount')
+    currency = meta.get('product:price:currency') or meta.get('og:price:currency')
+    availability = meta.get('product:availability') or meta.get('og:availability') or ''
+    return {
+        "title": meta.get('og:title', ''),
+        "description": meta.get('og:description', ''),
+        "price": format_price(amount, currency),
+        "dimensions": '',
+        "images": _image_urls(meta.get('og:images', [])),
+        "material": meta.get('product:material', ''),
+        "color": meta.get('product:color', ''),
+        "sku": meta.get('product:retailer_item_id', ''),
+        "availability": AVAILABILITY_LABELS.get(availability.replace(' ', '').lower(), availability),
+        "features": ''
+    }
+
+
+def _merge_missing(product, fallback):
+    for key, value in fallback.items():
+        if value and not product.get(key):
+            product[key] = value
+    return product
+
+
+def missing_fields(product, fields):
+    return [field for field in fields if not product.get(field)]
+
+
+def extract_structured_products(structured_data):
+    """
+    Build products from a page's JSON-LD and OpenGraph data
+
+    Args:
+        structured_data (dict): parse_page()'s structured_data
+
+    Returns:
+        list: Products in the analyze_products() shape; empty if the page's
+            structured data lacks any of REQUIRED_FIELDS
+    """
+    if not structured_data:
+        return []
+
+    nodes = []
+    for block in structured_data.get('json_ld', []):
+        nodes.extend(_find_product_nodes(block))
+    og_product = product_from_open_graph(structured_data.get('meta', {}))
+
+    products = [product_from_json_ld(node) for node in nodes]
+    if products:
+        # OpenGraph describes the page's main product, i.e. the first node
+        _merge_missing(products[0], og_product)
+    elif og_product['title']:
+        products = [og_product]
+
+    # Drop duplicates (e.g. a Product repeated in @graph and standalone)
+    unique = []
+    for product in products:
+        if product['title'] and all(product['title'] != other['title'] for other in unique):
+            unique.append(product)
+
+    if not unique or any(missing_fields(product, REQUIRED_FIELDS) for product in unique):
+        return []
+    return unique
@@ -0,0 +1,433 @@
+import re
+import json
+import time
+import threading
+from urllib.parse import urlsplit
+from store import SQLiteStore
+from structured_data import strip_url_params
+from extraction import is_product_image
+
+# Text fields a template may learn a selector for
+TEMPLATE_FIELDS = ['title', 'price', 'dimensions', 'material', 'color', 'sku', 'description']
+
+# A template is only stored, and only trusted, if it yields all of these
+REQUIRED_FIELDS = ['title', 'price', 'images']
+
+# Fields whose selector match count is part of a page's shape: on a product
+# page they match once, on category and search pages once per product card
+SHAPE_FIELDS = ['title', 'price']
+
+# Fields whose value must appear verbatim on the page; the others only need
+# most of their words in one element (the LLM reformats long fields)
+EXACT_FIELDS = {'title', 'price', 'color', 'sku'}
+FUZZY_MATCH_RATIO = 0.7
+
+MAX_FIELD_CHARS = 2000
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+PRODUCT_FIELDS = [
+    'title', 'description', 'price', 'dimensions', 'images',
+    'material', 'color', 'sku', 'availability', 'features'
+]
+
+
+def get_domain(url):
+    host = urlsplit(url).netloc.lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def _tokens(text):
+    return WORD_PATTERN.findall(text.lower())
+
+
+def _element_text(element):
+    return ' '.join(element.text_content().split())
+
+
+def _xpath_literal(value):
+    if "'" not in value:
+        return f"'{value}'"
+    if '"' not in value:
+        return f'"{value}"'
+    return "concat('" + value.replace("'", "', \"'\", '") + "')"
+
+
+def _own_selector(element):
+    """Selectors identifying element by its class or id, most generic first"""
+    selectors = []
+    if element.get('class'):
+        selectors.append(f"//{element.tag}[@class={_xpath_literal(element.get('class'))}]")
+    if element.get('id'):
+        selectors.append(f"//{element.tag}[@id={_xpath_literal(element.get('id'))}]")
+    return selectors
+
+
+def _relative_path(ancestor, element):
+    steps = []
+    while element is not ancestor:
+        parent = element.getparent()
+        same_tag = [sibling for sibling in parent if sibling.tag == element.tag]
+        steps.append(f"{element.tag}[{same_tag.index(element) + 1}]")
+        element = parent
+    return '/'.join(reversed(steps))
+
+
+def _first_match(root, selector):
+    try:
+        matches = root.xpath(selector)
+    except Exception:
+        return None
+    return matches[0] if matches else None
+
+
+def build_selector(root, element):
+    """
+    XPath that finds element as its first match on this page
+
+    Tries the element's own class/id, then a path below the nearest
+    ancestor with a class/id, and finally the absolute path.
+    """
+    for selector in _own_selector(element):
+        if _first_match(root, selector) is element:
+            return selector
+
+    ancestor = element.getparent()
+    while ancestor is not None and ancestor.tag not in ('body', 'html'):
+        for anchor in _own_selector(ancestor):
+            if _first_match(root, anchor) is ancestor:
+                selector = f"{anchor}/{_relative_path(ancestor, element)}"
+                if _first_match(root, selector) is element:
+                    return selector
+        ancestor = ancestor.getparent()
+
+    return root.getroottree().getpath(element)
+
+
+class PageText:
+    """
+    Text of a page's elements, for matching field values against
+
+    text_content() of every element costs time proportional to its subtree,
+    which adds up to roughly quadratic on large pages. Lengths are instead
+    summed bottom-up in one pass, and text is only built (once) for the
+    elements short enough to be a field.
+    """
+
+    def __init__(self, body):
+        # Pre-order, so ties go to the element found first
+        self.elements = [element for element in body.iter() if isinstance(element.tag, str)]
+        self.lengths = {}
+        for element in reversed(self.elements):
+            length = len(element.text or '')
+            for child in element:
+                length += self.lengths.get(child, 0) + len(child.tail or '')
+            self.lengths[element] = length
+        self._text = {}
+
+    def candidates(self, max_length):
+        """(element, text, tokens) of every element with at most max_length characters"""
+        for element in self.elements:
+            if self.lengths[element] > max_length:
+                continue
+            cached = self._text.get(element)
+            if cached is None:
+                text = element.text_content()
+                cached = self._text[element] = (text, _tokens(text))
+            yield element, cached[0], cached[1]
+
+
+def find_field_element(page_text, value, exact):
+    """Smallest element of page_text (a PageText) whose text matches value"""
+    target = _tokens(value)
+    if not target:
+        return None
+    target_text = ' '.join(target)
+    target_set = set(target)
+    # An element much longer than the value is a container, not the field
+    max_length = max(4 * len(value), 200)
+
+    best = None
+    best_length = None
+    for element, text, tokens in page_text.candidates(max_length):
+        if best_length is not None and len(text) >= best_length:
+            continue
+        if exact:
+            matched = target_text in ' '.join(tokens)
+        else:
+            matched = len(target_set & set(tokens)) / len(target_set) >= FUZZY_MATCH_RATIO
+        if matched:
+            best = element
+            best_length = len(text)
+    return best
+
+
+def _common_ancestor(elements):
+    paths = []
+    for element in elements:
+        path = [element]
+        while path[-1].getparent() is not None:
+            path.append(path[-1].getparent())
+        paths.append(list(reversed(path)))
+    common = None
+    for nodes in zip(*paths):
+        if all(node is nodes[0] for node in nodes):
+            common = nodes[0]
+        else:
+            break
+    return common
+
+
+def _image_srcs(container):
+    srcs = []
+    for img in container.iter('img'):
+        src = img.get('src', '')
+        if is_product_image(src):
+            src = strip_url_params(src)
+            if src not in srcs:
+                srcs.append(src)
+    return srcs
+
+
+def derive_template(tree, product):
+    """
+    Learn selectors from a page and the product the LLM extracted from it
+
+    Returns:
+        dict: Template with per-field selectors, or None if the required
+            fields couldn't all be located on the page
+    """
+    body = tree.find('body')
+    body = body if body is not None else tree
+
+    page_text = PageText(body)
+    fields = {}
+    for field in TEMPLATE_FIELDS:
+        value = product.get(field)
+        if not isinstance(value, str) or not value.strip():
+            continue
+        element = find_field_element(page_text, value, exact=field in EXACT_FIELDS)
+        if element is not None:
+            fields[field] = build_selector(tree, element)
+
+    # The gallery is the smallest container holding the product's images
+    wanted = {strip_url_params(url) for url in product.get('images', [])}
+    matched = [img for img in body.iter('img') if strip_url_params(img.get('src', '')) in wanted]
+    images_selector = None
+    if matched:
+        container = matched[0].getparent() if len(matched) == 1 else _common_ancestor(matched)
+        # A container holding far more images than the product's is the page, not a gallery
+        if (container is not None and container.tag not in ('body', 'html')
+                and len(_image_srcs(container)) <= 3 * len(matched)):
+            images_selector = build_selector(tree, container)
+
+    if images_selector is None or any(field not in fields for field in REQUIRED_FIELDS if field != 'images'):
+        return None
+
+    template = {
+        "fields": fields,
+        "images": images_selector
+    }
+    template['shape'] = page_shape(template, tree)
+    return template
+
+
+def page_shape(template, tree):
+    """
+    What a page looks like to a template: whether its title and price
+    selectors match nothing, once or several times, and the page's og:type
+    """
+    matches = {}
+    for field in SHAPE_FIELDS:
+        try:
+            count = len(tree.xpath(template['fields'][field]))
+        except Exception:
+            count = 0
+        matches[field] = min(count, 2)
+    og_type = tree.xpath('string(//meta[@property="og:type"]/@content)').strip().lower()
+    return {"matches": matches, "og_type": og_type or None}
+
+
+def matches_shape(template, tree):
+    """
+    Whether tree looks like the page template was learned from
+
+    A template learned on a product page would otherwise turn a category
+    page of the same retailer into one product. Templates stored before
+    shapes were recorded never match, and are relearned on the next LLM
+    extraction.
+    """
+    shape = template.get('shape')
+    return shape is not None and page_shape(template, tree) == shape
+
+
+def apply_template(template, tree):
+    """
+    Extract a product with a template's selectors
+
+    Returns:
+        dict: Product in the analyze_products() shape, or None if a required
+            selector no longer matches (or yields implausible values)
+    """
+    product = {field: '' for field in PRODUCT_FIELDS}
+    product['images'] = []
+
+    for field, selector in template['fields'].items():
+        element = _first_match(tree, selector)
+        if element is None:
+            if field in REQUIRED_FIELDS:
+                return None
+            continue
+        product[field] = _element_text(element)[:MAX_FIELD_CHARS]
+
+    container = _first_match(tree, template['images'])
+    if container is not None:
+        product['images'] = _image_srcs(container)
+
+    # Guard against selectors that still match, but now match the wrong thing
+    if not product['title'] or len(product['title']) > 300:
+        return None
+    if not re.search(r'\d', product['price']) or len(product['price']) > 100:
+        return None
+    if not product['images']:
+        return None
+    return product
+
+
+class TemplateStore(SQLiteStore):
+    """Learned extraction templates, one per retailer domain"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS extraction_templates (
+            domain TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            learned_from TEXT,
+            updated_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            failures INTEGER NOT NULL DEFAULT 0
+        );
+    """
+
+    def get(self, domain):
+        row = self._connect().execute(
+            'SELECT data FROM extraction_templates WHERE domain = ?', (domain,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, domain, template, learned_from):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO extraction_templates (domain, data, learned_from, updated_at) '
+            'VALUES (?, ?, ?, ?)',
+            (domain, json.dumps(template), learned_from, time.time())
+        )
+
+    def record(self, domain, hit):
+        column = 'hits' if hit else 'failures'
+        self._connect().execute(
+            f'UPDATE extraction_templates SET {column} = {column} + 1 WHERE domain = ?', (domain,)
+        )
+
+    def summary(self):
+        rows = self._connect().execute(
+            'SELECT domain, learned_from, updated_at, hits, failures FROM extraction_templates ORDER BY domain'
+        ).fetchall()
+        return [
+            {"domain": domain, "learned_from": learned_from, "updated_at": updated_at,
+             "hits": hits, "failures": failures}
+            for domain, learned_from, updated_at, hits, failures in rows
+        ]
+
+
+class TemplateRegistry:
+    """
+    Per-domain extraction templates with hit/miss accounting
+
+    extract() is tried before the LLM, on pages shaped like the one the
+    domain's template was learned from; learn() is called after an LLM
+    extraction, both to learn a new domain and to revalidate a domain whose
+    template stopped matching.
+    """
+
+    def __init__(self, db_path):
+        self.store = TemplateStore(db_path)
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'failures': 0,
+            'shape_mismatches': 0,
+            'learned': 0,
+            'revalidated': 0,
+            'time_saved_seconds': 0.0
+        }
+        # Running average of LLM extraction time, to estimate time saved
+        self._llm_seconds = None
+
+    def extract(self, url, tree):
+        """Return the product extracted by url's domain template, or None"""
+        domain = get_domain(url)
+        template = self.store.get(domain)
+        if template is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+
+        if not matches_shape(template, tree):
+            # A different kind of page (e.g. a category); leave it to the LLM
+            with self._lock:
+                self._stats['shape_mismatches'] += 1
+            return None
+
+        start = time.perf_counter()
+        try:
+            product = apply_template(template, tree)
+        except Exception as e:
+            print(f"Error applying template for {domain}: {e}")
+            product = None
+        elapsed = time.perf_counter() - start
+
+        self.store.record(domain, product is not None)
+        with self._lock:
+            if product is None:
+                self._stats['failures'] += 1
+            else:
+                self._stats['hits'] += 1
+                if self._llm_seconds is not None:
+                    self._stats['time_saved_seconds'] += max(self._llm_seconds - elapsed, 0)
+        return product
+
+    def learn(self, url, tree, product):
+        """Derive and store url's domain template from an LLM-extracted product"""
+        domain = get_domain(url)
+        try:
+            template = derive_template(tree, product)
+        except Exception as e:
+            print(f"Error deriving template for {domain}: {e}")
+            return False
+        if template is None:
+            return False
+
+        existed = self.store.get(domain) is not None
+        self.store.put(domain, template, url)
+        with self._lock:
+            self._stats['revalidated' if existed else 'learned'] += 1
+        print(f"{'Revalidated' if existed else 'Learned'} extraction template for {domain}")
+        return True
+
+    def record_llm_duration(self, seconds):
+        with self._lock:
+            if self._llm_seconds is None:
+                self._llm_seconds = seconds
+            else:
+                self._llm_seconds = 0.8 * self._llm_seconds + 0.2 * seconds
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            llm_seconds = self._llm_seconds
+        lookups = stats['hits'] + stats['misses'] + stats['failures'] + stats['shape_mismatches']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+        stats['time_saved_seconds'] = round(stats['time_saved_seconds'], 2)
+        stats['avg_llm_seconds'] = round(llm_seconds, 2) if llm_seconds is not None else None
+        stats['domains'] = self.store.summary()
+        return stats
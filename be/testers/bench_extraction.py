@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark extraction.parse_page() on its lxml.html fast path and on the
+BeautifulSoup html.parser fallback
+
+Usage:
+    python testers/bench_extraction.py [page.html ...]
+
+With no arguments, every *.html page saved under sample/ is used. If there
+are none, a synthetic IKEA-sized product page is generated instead.
+
+Peak memory is the growth in the process's max RSS during one parse,
+measured in a fresh subprocess per case, since libxml2's allocations are
+invisible to tracemalloc.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extraction import parse_page
+
+SAMPLE_FOLDER = os.path.join(os.path.dirname(__file__), '..', '..', 'sample')
+RUNS = 5
+
+
+def synthetic_page():
+    """Roughly the shape of a retailer product page: heavy chrome, one product"""
+    nav = ''.join(f'<li><a href="/cat/{i}">Category {i}</a></li>' for i in range(400))
+    scripts = ''.join(f'<script>window.__DATA_{i} = {{"x": "{"y" * 2000}"}};</script>' for i in range(40))
+    gallery = ''.join(
+        f'<div class="media"><img src="https://www.ikea.com/ca/en/images/products/sofa_{i}.jpg" alt="Sofa view {i}"></div>'
+        for i in range(12)
+    )
+    related = ''.join(
+        f'<div class="card"><img src="https://www.ikea.com/images/rel_{i}.jpg" alt="Related {i}">'
+        f'<span>Related product {i}</span><span>$ {i}99.00</span></div>'
+        for i in range(150)
+    )
+    reviews = ''.join(f'<p>Review {i}: great sofa, very comfortable. ' * 5 + '</p>' for i in range(200))
+    return f"""<html><head><title>FINNALA Sofa, Gunnared beige - IKEA CA</title>{scripts}</head>
+    <body><header><nav><ul>{nav}</ul></nav></header>
+    <main><h1>FINNALA Sofa, Gunnared beige</h1><span class="price">$999.00</span>
+    <div class="gallery">{gallery}</div>
+    <div class="details">Width: 241 cm (94 7/8") Depth: 98 cm (38 5/8") Height: 85 cm (33 1/2")</div>
+    <section class="reviews">{reviews}</section><section class="related">{related}</section></main>
+    <footer><nav><ul>{nav}</ul></nav></footer></body></html>""".encode()
+
+
+def available_parsers():
+    parsers = ['html.parser']
+    try:
+        import lxml  # noqa: F401
+        parsers.insert(0, 'lxml')
+    except ImportError:
+        print("lxml not installed; only benchmarking html.parser")
+    return parsers
+
+
+def worker(path, parser):
+    """Run one case in this process and print its timing, peak memory and output size"""
+    with open(path, 'rb') as f:
+        html = f.read()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    page = parse_page(html, parser=parser)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        parse_page(html, parser=parser)
+    elapsed = (time.perf_counter() - start) / RUNS
+    print(json.dumps({
+        "ms": elapsed * 1000,
+        "peak_mb": peak_kb / 1024,
+        "text": len(page['content']),
+        "images": len(page['product_images'])
+    }))
+
+
+def run_case(path, parser):
+    output = subprocess.run(
+        [sys.executable, __file__, '--worker', path, parser],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == '--worker':
+        worker(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(SAMPLE_FOLDER, '*.html')))
+    parsers = available_parsers()
+    with tempfile.TemporaryDirectory() as folder:
+        if not paths:
+            print("No saved pages found in sample/, using a synthetic product page\n")
+            path = os.path.join(folder, 'synthetic.html')
+            with open(path, 'wb') as f:
+                f.write(synthetic_page())
+            paths = [path]
+
+        for path in paths:
+            print(f"{os.path.basename(path)} ({os.path.getsize(path) / 1024:.0f} KB)")
+            print("-" * 60)
+            for parser in parsers:
+                result = run_case(path, parser)
+                print(f"  {parser:12s} {result['ms']:8.1f} ms   peak {result['peak_mb']:6.1f} MB   "
+                      f"text {result['text']:7d} chars   images {result['images']}")
+            print()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark imaging.load_thumbnail() against the previous open + thumbnail(LANCZOS)
+
+Usage:
+    python testers/bench_imaging.py [image ...]
+
+With no arguments, every image under sample/ is used, plus a synthetic
+1920x1080 collage JPEG (the largest image save_canvas decodes). Each image
+is scaled to a collage cell (600px) and to a canvas overlay (300px).
+
+Peak memory is the growth in the process's max RSS while decoding and
+scaling, measured in a fresh subprocess per case, since Pillow's pixel
+buffers are invisible to tracemalloc.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from PIL import Image, ImageDraw
+from imaging import load_thumbnail
+
+SAMPLE_FOLDER = os.path.join(os.path.dirname(__file__), '..', '..', 'sample')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+BOXES = [(600, 600), (300, 300)]
+RUNS = 5
+
+
+def before(path, box):
+    img = Image.open(path)
+    img.thumbnail(box, Image.Resampling.LANCZOS)
+    return img
+
+
+def after(path, box):
+    return load_thumbnail(path, box)
+
+
+METHODS = {'before': before, 'after': after}
+
+
+def synthetic_collage(folder):
+    """A noisy 1920x1080 JPEG shaped like a generated collage"""
+    img = Image.effect_noise((1920, 1080), 64).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    for i in range(9):
+        x, y = (i % 3) * 640, 100 + (i // 3) * 326
+        draw.rectangle([x + 20, y + 20, x + 620, y + 306], fill=(40 * i, 120, 200 - 20 * i))
+    path = os.path.join(folder, 'synthetic_collage.jpg')
+    img.save(path, 'JPEG', quality=85)
+    return path
+
+
+def worker(method, path, box):
+    """Run one case in this process and print its timing and peak memory"""
+    fn = METHODS[method]
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    fn(path, box).load()
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        fn(path, box).load()
+    elapsed = (time.perf_counter() - start) / RUNS
+    print(json.dumps({"ms": elapsed * 1000, "peak_mb": peak_kb / 1024}))
+
+
+def run_case(method, path, box):
+    output = subprocess.run(
+        [sys.executable, __file__, '--worker', method, path, str(box[0]), str(box[1])],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == '--worker':
+        worker(sys.argv[2], sys.argv[3], (int(sys.argv[4]), int(sys.argv[5])))
+        sys.exit(0)
+
+    paths = sys.argv[1:] or sorted(
+        path for path in glob.glob(os.path.join(SAMPLE_FOLDER, '*'))
+        if path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    with tempfile.TemporaryDirectory() as folder:
+        if len(sys.argv) == 1:
+            paths.append(synthetic_collage(folder))
+
+        totals = {method: 0.0 for method in METHODS}
+        for path in paths:
+            with Image.open(path) as img:
+                print(f"{os.path.basename(path)} ({img.format} {img.width}x{img.height} {img.mode})")
+            print("-" * 60)
+            for box in BOXES:
+                results = {method: run_case(method, path, box) for method in METHODS}
+                for method, result in results.items():
+                    totals[method] += result['ms']
+                speedup = results['before']['ms'] / results['after']['ms']
+                print(f"  {box[0]:4d}px  before {results['before']['ms']:7.1f} ms  {results['before']['peak_mb']:6.1f} MB"
+                      f"   after {results['after']['ms']:7.1f} ms  {results['after']['peak_mb']:6.1f} MB"
+                      f"   {speedup:4.1f}x")
+            print()
+
+        print(f"Total: before {totals['before']:.0f} ms, after {totals['after']:.0f} ms "
+              f"({totals['before'] / totals['after']:.1f}x)")
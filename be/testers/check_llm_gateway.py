@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Check the LLM gateway's retries, hedging and slot accounting against the stub
+
+Usage:
+    python testers/check_llm_gateway.py
+
+Starts testers/llm_stub_server.py in-process on a free port and scripts its
+responses: a 503 and a 429 must each be retried, a 400 must not, and a
+request whose first token is slower than the hedge delay must be hedged
+and won by the hedge. While the losing original is still outstanding, both
+requests must hold an in-flight slot, and every slot must be free again
+once the loser has been closed. Exits non-zero if any check fails.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from llm_stub_server import StubHandler, parse_options
+from llm_gateway import LLMGateway, HEDGE_MIN_DELAY, HEDGE_MIN_SAMPLES
+
+MESSAGES = [{"role": "user", "content": "Page Title: Stub Sofa"}]
+# Slow enough that the hedge, sent after HEDGE_MIN_DELAY, always wins
+SLOW_FIRST_TOKEN = HEDGE_MIN_DELAY + 3
+
+failures = []
+
+
+def check(name, condition, detail=''):
+    print(f"  {'ok  ' if condition else 'FAIL'} {name}{f' ({detail})' if detail else ''}")
+    if not condition:
+        failures.append(name)
+
+
+def start_stub():
+    StubHandler.options = parse_options(['--first-token', '0.05', '--token-delay', '0.005'])
+    StubHandler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def complete(gateway):
+    return ''.join(gateway.stream_chat(messages=MESSAGES, model='stub'))
+
+
+def check_retry(gateway, status):
+    print(f"Retry on {status}")
+    StubHandler.script.append({"status": status})
+    retries = gateway.stats()['retries']
+    text = complete(gateway)
+    check("completion succeeded", bool(json.loads(text).get('products')))
+    check("one retry recorded", gateway.stats()['retries'] == retries + 1)
+    check("two attempts", gateway.stats()['recent_calls'][-1]['attempts'] == 2)
+
+
+def check_no_retry(gateway, status):
+    print(f"No retry on {status}")
+    StubHandler.script.append({"status": status})
+    retries = gateway.stats()['retries']
+    try:
+        complete(gateway)
+        check("error raised", False)
+    except Exception as e:
+        check("error raised", True, type(e).__name__)
+    check("no retry recorded", gateway.stats()['retries'] == retries)
+    check("no slot held", gateway.stats()['in_flight'] == 0)
+
+
+def check_hedge(gateway):
+    print("Hedging")
+    # Enough fast calls for a time-to-first-token p95
+    for _ in range(HEDGE_MIN_SAMPLES):
+        complete(gateway)
+
+    before = gateway.stats()
+    StubHandler.script.append({"first_token": SLOW_FIRST_TOKEN})
+    deltas = gateway.stream_chat(messages=MESSAGES, model='stub')
+    first = next(deltas)
+    stats = gateway.stats()
+    check("hedge sent", stats['hedged'] == before['hedged'] + 1)
+    check("hedge won", stats['hedge_wins'] == before['hedge_wins'] + 1)
+    check("winner and loser each hold a slot", stats['in_flight'] == 2, f"in_flight={stats['in_flight']}")
+
+    text = first + ''.join(deltas)
+    check("hedged completion is whole", bool(json.loads(text).get('products')))
+    stats = gateway.stats()
+    check("loser still holds its slot", stats['in_flight'] == 1, f"in_flight={stats['in_flight']}")
+
+    deadline = time.time() + SLOW_FIRST_TOKEN + 2
+    while gateway.stats()['in_flight'] and time.time() < deadline:
+        time.sleep(0.05)
+    check("every slot free once the loser is closed", gateway.stats()['in_flight'] == 0)
+
+
+if __name__ == "__main__":
+    server = start_stub()
+    gateway = LLMGateway(
+        api_key='stub', base_url=f"http://127.0.0.1:{server.server_address[1]}",
+        max_concurrency=2, max_retries=2, hedge=True
+    )
+    check_retry(gateway, 503)
+    check_retry(gateway, 429)
+    check_no_retry(gateway, 400)
+    check_hedge(gateway)
+    server.shutdown()
+
+    if failures:
+        print(f"\n{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("\nAll checks passed")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Check that consecutive /save_canvas calls for one room reuse scaled collages
+
+Usage:
+    python testers/check_overlay_cache.py [server URL]
+
+Saves the same room image twice with different annotations and the same
+collages, as the canvas does on each generate cycle, against a running
+server (default http://localhost:5000). The second save must report
+overlay_cache hits; with IMAGING_WORKERS > 1 that only happens if both
+saves were composited on the same worker.
+"""
+
+import os
+import io
+import sys
+import json
+import tempfile
+import requests
+from PIL import Image, ImageDraw
+
+DEFAULT_SERVER = "http://localhost:5000"
+
+
+def png_bytes(img):
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def save(server, room, annotated, collages):
+    response = requests.post(f"{server}/save_canvas", files={
+        'original_image': ('original.png', room, 'image/png'),
+        'annotated_image': ('annotated.png', annotated, 'image/png'),
+    }, data={'collages': json.dumps(collages)}, timeout=60)
+    response.raise_for_status()
+    return response.json()
+
+
+if __name__ == "__main__":
+    server = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SERVER
+    workers = requests.get(f"{server}/stats", timeout=10).json()['imaging_pool']['workers']
+    print(f"Imaging workers: {workers}")
+    if workers <= 1:
+        print("Warning: start the server with IMAGING_WORKERS > 1 for this check to mean anything")
+
+    room_img = Image.effect_noise((1280, 720), 40).convert('RGB')
+    room = png_bytes(room_img)
+    with tempfile.TemporaryDirectory() as folder:
+        # The server reads collages by path, so it must share this filesystem
+        collages = []
+        for i in range(3):
+            path = os.path.join(folder, f"collage_{i}.jpg")
+            Image.new('RGB', (1920, 1080), color=(60 * i, 120, 200)).save(path, 'JPEG')
+            collages.append({"path": path, "x": 200 + 400 * i, "y": 360})
+
+        results = []
+        for stroke in range(2):
+            annotated_img = room_img.copy()
+            ImageDraw.Draw(annotated_img).line([(0, 100 * stroke), (1280, 720)], fill='red', width=8)
+            results.append(save(server, room, png_bytes(annotated_img), collages))
+
+    for i, result in enumerate(results, 1):
+        print(f"Save {i}: {result.get('collages_appended')} collages, overlay cache {result.get('overlay_cache')}")
+
+    second = results[1].get('overlay_cache') or {}
+    if second.get('hits', 0) < len(collages) or second.get('misses', 0):
+        print("FAIL: the second save missed the overlay cache")
+        sys.exit(1)
+    print("OK: the second save composited from cached collages")
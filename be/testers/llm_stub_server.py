@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Cerebras chat completions API
+
+Answers POST /v1/chat/completions (streaming or not) with a canned products
+JSON built from the page title in the prompt, so scraping can be exercised
+without an API key or token spend. Latency and failures are configurable to
+test the LLM gateway's retries and hedging, either at random or, when
+imported (see check_llm_gateway.py), as a scripted sequence of responses.
+
+Usage:
+    python testers/llm_stub_server.py [--port 8090] [--first-token 0.3]
+        [--token-delay 0.01] [--fail-rate 0.1] [--slow-rate 0.05]
+
+Then start the backend with:
+    CEREBRAS_BASE_URL=http://127.0.0.1:8090 CEREBRAS_API_KEY=stub python main.py
+"""
+
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TITLE_PATTERN = re.compile(r'Page Title:\s*(.*)')
+IMAGE_PATTERN = re.compile(r'- Image: (\S+)')
+
+
+def canned_answer(messages):
+    """Products JSON echoing the page title and first images of the prompt"""
+    prompt = messages[-1].get('content', '') if messages else ''
+    match = TITLE_PATTERN.search(prompt)
+    title = match.group(1).strip() if match else 'Stub Product'
+    images = IMAGE_PATTERN.findall(prompt)[:4]
+    return json.dumps({
+        "products": [{
+            "title": title,
+            "description": f"Stub description for {title}",
+            "price": "$199.00",
+            "dimensions": "Width: 80 cm, Depth: 40 cm, Height: 90 cm",
+            "images": [image.split('?')[0] for image in images],
+            "material": "Solid pine",
+            "color": "Natural",
+            "sku": "000.000.00",
+            "availability": "In stock",
+            "features": ""
+        }]
+    }, indent=2)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    options = None
+    # Scripted responses, used in order before falling back to the random
+    # ones: {"status": 503} or {"first_token": 3.0} dicts
+    script = deque()
+    script_lock = threading.Lock()
+
+    @classmethod
+    def next_step(cls):
+        with cls.script_lock:
+            return cls.script.popleft() if cls.script else None
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"[stub] {format % args}\n")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+
+        options = self.options
+        step = self.next_step()
+        if step is None:
+            step = {}
+            if random.random() < options.fail_rate:
+                step['status'] = 503
+            if random.random() < options.slow_rate:
+                step['first_token'] = options.first_token * 10
+        if step.get('status', 200) != 200:
+            self._send_json(step['status'], {"error": {"message": f"stub: simulated {step['status']}"}})
+            return
+
+        time.sleep(step.get('first_token', options.first_token))
+
+        answer = canned_answer(request.get('messages', []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        usage = {
+            "prompt_tokens": sum(len(m.get('content', '')) for m in request.get('messages', [])) // 4,
+            "completion_tokens": len(answer) // 4,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not request.get('stream'):
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get('model'),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        def send(chunk):
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        try:
+            for i in range(0, len(answer), options.chunk_size):
+                send({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request.get('model'),
+                    "choices": [{"index": 0, "delta": {"content": answer[i:i + options.chunk_size]}, "finish_reason": None}]
+                })
+                time.sleep(options.token_delay)
+            send({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get('model'),
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client dropped the stream early, which is allowed
+            pass
+
+
+def parse_options(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--first-token', type=float, default=0.3, help='seconds before the first chunk')
+    parser.add_argument('--token-delay', type=float, default=0.01, help='seconds between chunks')
+    parser.add_argument('--chunk-size', type=int, default=16, help='characters per chunk')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of requests answered 503')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='share of requests 10x slower to start')
+    return parser.parse_args(args)
+
+
+def main():
+    StubHandler.options = parse_options()
+
+    server = ThreadingHTTPServer(('127.0.0.1', StubHandler.options.port), StubHandler)
+    print(f"LLM stub listening on http://127.0.0.1:{StubHandler.options.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,6 @@ Script to scrape multiple furniture URLs
 
 import requests
 import json
-import time
 
 # List of URLs to scrape
 urls = [
@@ -17,84 +16,80 @@ urls = [
 ]
 
 # API endpoint
-API_URL = "http://localhost:5000/scrape"
+API_URL = "http://localhost:5000/scrape/batch"
 
 print("Starting batch scraping...\n")
 print("=" * 60)
 
-results = []
+results = [None] * len(urls)
 successful = 0
 failed = 0
 
-for i, url in enumerate(urls, 1):
-    print(f"\n[{i}/{len(urls)}] Scraping: {url}")
-    print("-" * 40)
-    
-    try:
-        # Make the request
-        response = requests.get(API_URL, params={"url": url}, timeout=30)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Check if products were found
-            if data.get("products") and len(data["products"]) > 0:
-                product = data["products"][0]
-                color_id = product.get("id", "N/A")
-                title = product.get("title", "Unknown")
-                price = product.get("price", "N/A")
-                
-                print(f"✅ SUCCESS")
-                print(f"   Color ID: #{color_id.upper()}")
-                print(f"   Title: {title}")
-                print(f"   Price: {price}")
-                print(f"   Collage: {data.get('collage_path', 'N/A')}")
-                
-                results.append({
-                    "url": url,
-                    "success": True,
-                    "color_id": color_id,
-                    "title": title,
-                    "price": price
-                })
-                successful += 1
-            else:
-                print(f"⚠️  No products found")
-                results.append({
-                    "url": url,
-                    "success": False,
-                    "reason": "No products found"
-                })
-                failed += 1
+try:
+    # Results stream back one JSON line per URL as each finishes
+    response = requests.post(API_URL, json={"urls": urls}, stream=True, timeout=300)
+    response.raise_for_status()
+
+    for line in response.iter_lines():
+        if not line:
+            continue
+        item = json.loads(line)
+        if item.get("done"):
+            print(f"\nBatch finished in {item['duration']}s")
+            continue
+
+        url = item["url"]
+        data = item["result"]
+        print(f"\n[{item['index'] + 1}/{len(urls)}] {url}")
+        print("-" * 40)
+
+        if item["status_code"] != 200:
+            print(f"❌ FAILED - Status code: {item['status_code']} {data.get('error', '')}")
+            results[item["index"]] = {
+                "url": url,
+                "success": False,
+                "reason": f"HTTP {item['status_code']}"
+            }
+            failed += 1
+        elif data.get("products") and len(data["products"]) > 0:
+            product = data["products"][0]
+            color_id = product.get("id", "N/A")
+            title = product.get("title", "Unknown")
+            price = product.get("price", "N/A")
+
+            print(f"✅ SUCCESS{' (cached)' if data.get('from_cache') else ''}")
+            print(f"   Color ID: #{color_id.upper()}")
+            print(f"   Title: {title}")
+            print(f"   Price: {price}")
+            print(f"   Collage: {data.get('collage_path', 'N/A')}")
+
+            results[item["index"]] = {
+                "url": url,
+                "success": True,
+                "color_id": color_id,
+                "title": title,
+                "price": price
+            }
+            successful += 1
         else:
-            print(f"❌ FAILED - Status code: {response.status_code}")
-            results.append({
+            print(f"⚠️  No products found")
+            results[item["index"]] = {
                 "url": url,
                 "success": False,
-                "reason": f"HTTP {response.status_code}"
-            })
+                "reason": data.get("error", "No products found")
+            }
             failed += 1
-            
-    except requests.exceptions.Timeout:
-        print(f"❌ FAILED - Request timeout")
-        results.append({
-            "url": url,
-            "success": False,
-            "reason": "Timeout"
-        })
-        failed += 1
-    except Exception as e:
-        print(f"❌ FAILED - Error: {str(e)}")
-        results.append({
-            "url": url,
-            "success": False,
-            "reason": str(e)
-        })
+
+except requests.exceptions.Timeout:
+    print(f"❌ FAILED - Request timeout")
+except Exception as e:
+    print(f"❌ FAILED - Error: {str(e)}")
+
+# URLs the batch never reported on
+for i, result in enumerate(results):
+    if result is None:
+        results[i] = {"url": urls[i], "success": False, "reason": "No result"}
         failed += 1
-    
-    # Small delay between requests to be nice to the server
-    if i < len(urls):
-        time.sleep(1)
 
 # Print summary
 print("\n" + "=" * 60)
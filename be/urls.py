@@ -0,0 +1,51 @@
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters that only track where a visitor came from; they never
+# change which product a page shows
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'gclsrc', 'dclid', 'msclkid', 'yclid', 'igshid', 'twclid', 'ttclid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'srsltid', 'ref', 'ref_', 'referrer',
+    'cmpid', 'icid', 'itm_source', 'itm_medium', 'itm_campaign', 'spm'
+}
+TRACKING_PREFIXES = ('utm_', 'pk_', 'mtm_', 'hsa_')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize_url(url):
+    """
+    Normalize a product URL so equivalent links share one cache entry
+
+    Lowercases the scheme and host, drops default ports, the fragment,
+    tracking parameters and trailing slashes, and sorts the remaining query
+    parameters. Malformed URLs are returned stripped but otherwise as-is.
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.scheme or not parts.netloc:
+        return url
+
+    scheme = parts.scheme.lower()
+    userinfo, _, _ = parts.netloc.rpartition('@')
+    host = (parts.hostname or '').lower()
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    if userinfo:
+        host = f"{userinfo}@{host}"
+
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(name)
+    ))
+    return urlunsplit((scheme, host, path, query, ''))
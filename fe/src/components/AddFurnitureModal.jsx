@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react'
 import { X, Sofa, Loader2 } from 'lucide-react'
 
-export function AddFurnitureModal({ isOpen, onClose, onAdd }) {
+export function AddFurnitureModal({ isOpen, onClose, onAdd, onCollageReady }) {
   const [furnitureUrl, setFurnitureUrl] = useState('')
   const [isLoading, setIsLoading] = useState(false)
   const [error, setError] = useState('')
@@ -13,54 +13,66 @@ export function AddFurnitureModal({ isOpen, onClose, onAdd }) {
     }
   }, [isOpen])
 
-  const handleSubmit = async (e) => {
+  const handleSubmit = (e) => {
     e.preventDefault()
     if (!furnitureUrl.trim()) return
 
     setIsLoading(true)
     setError('')
 
-    try {
-      console.log('Sending URL to scrape:', furnitureUrl.trim())
-
-      // Encode the URL as a query parameter
-      const params = new URLSearchParams({ url: furnitureUrl.trim() })
-      const response = await fetch(`http://localhost:5000/scrape?${params}`, {
-        method: 'GET',
-        headers: {
-          'Accept': 'application/json',
-        },
-        mode: 'cors',
-      })
+    const url = furnitureUrl.trim()
+    console.log('Sending URL to scrape:', url)
 
-      if (!response.ok) {
-        const errorText = await response.text()
-        console.error('Scrape error:', errorText)
-        throw new Error(`Failed to scrape: ${response.status} ${response.statusText}`)
-      }
+    // Stream progress so the card can be added as soon as products are
+    // extracted, and its collage swapped in when it's ready
+    const params = new URLSearchParams({ url })
+    const events = new EventSource(`http://localhost:5000/scrape/stream?${params}`)
+    let added = false
 
-      const data = await response.json()
+    events.addEventListener('result', (event) => {
+      const data = JSON.parse(event.data)
       console.log('Received scraped data:', data)
 
+      if (data.error) {
+        setError(data.error)
+        setIsLoading(false)
+        events.close()
+        return
+      }
+
       // Pass the scraped data to the parent component
       onAdd({
-        url: furnitureUrl.trim(),
+        url,
         ...data
       })
-
+      added = true
+      setIsLoading(false)
       onClose()
-    } catch (err) {
-      console.error('Error adding furniture:', err)
+    })
 
-      // Check if it's a network/CORS error
-      if (err.message === 'Failed to fetch') {
-        setError('Cannot connect to server. Make sure the backend is running with CORS enabled on port 5000.')
-      } else {
-        setError(err.message || 'Failed to add furniture. Please try again.')
+    events.addEventListener('collage', (event) => {
+      const { collage_path } = JSON.parse(event.data)
+      if (collage_path) {
+        onCollageReady?.(url, collage_path)
       }
-    } finally {
+    })
+
+    events.addEventListener('done', () => events.close())
+
+    events.onerror = (err) => {
+      events.close()
+      if (added) return
+      console.error('Error adding furniture:', err)
+      setError('Cannot connect to server. Make sure the backend is running with CORS enabled on port 5000.')
       setIsLoading(false)
     }
+
+    // Server-side scrape failures arrive as a "scrape_error" event with a payload
+    events.addEventListener('scrape_error', (event) => {
+      events.close()
+      setError(JSON.parse(event.data).error || 'Failed to add furniture. Please try again.')
+      setIsLoading(false)
+    })
   }
 
   const handleBackdropClick = (e) => {
@@ -3,6 +3,25 @@ import { Upload, Image as ImageIcon, X } from 'lucide-react'
 import { cn } from '../lib/utils'
 import { useDrawing } from '../contexts/DrawingContext'
 
+const canvasToBlob = (canvas, type) => new Promise((resolve, reject) => {
+    canvas.toBlob(blob => blob ? resolve(blob) : reject(new Error('Failed to export canvas')), type)
+})
+
+// Upload canvas images as multipart binary parts instead of base64 JSON
+const saveCanvasImages = async (originalImage, annotatedBlob, collages = []) => {
+    // The original may be a data URL or a generated image URL; fetch() reads both
+    const originalBlob = await (await fetch(originalImage)).blob()
+    const form = new FormData()
+    form.append('original_image', originalBlob, 'original')
+    form.append('annotated_image', annotatedBlob, 'annotated')
+    form.append('collages', JSON.stringify(collages))
+    const response = await fetch('http://localhost:5000/save_canvas', {
+        method: 'POST',
+        body: form
+    })
+    return response.json()
+}
+
 export function Canvas({ onFurnitureClick, hasChanges, setHasChanges, uploadedImage, setUploadedImage, onGenerateRequest }) {
     const [isDragging, setIsDragging] = useState(false)
     const [isDrawing, setIsDrawing] = useState(false)
@@ -241,9 +260,8 @@ export function Canvas({ onFurnitureClick, hasChanges, setHasChanges, uploadedIm
                         })
                     }
 
-                    // Convert canvases to base64
-                    const originalImage = uploadedImage  // Already base64
-                    const annotatedImage = tempCanvas.toDataURL('image/png')
+                    // Export the annotated canvas as PNG bytes
+                    const annotatedImage = await canvasToBlob(tempCanvas, 'image/png')
 
                     // Collect collages with their center points
                     const collages = []
@@ -271,19 +289,7 @@ export function Canvas({ onFurnitureClick, hasChanges, setHasChanges, uploadedIm
                     console.log('Sending collages to backend:', collages)
 
                     // Send to backend
-                    const response = await fetch('http://localhost:5000/save_canvas', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({
-                            original_image: originalImage,
-                            annotated_image: annotatedImage,
-                            collages: collages  // Array of {path, x, y} objects
-                        })
-                    })
-
-                    const result = await response.json()
+                    const result = await saveCanvasImages(uploadedImage, annotatedImage, collages)
 
                     if (result.success) {
                         console.log('Images saved successfully:', result)
@@ -542,23 +548,11 @@ export function Canvas({ onFurnitureClick, hasChanges, setHasChanges, uploadedIm
                 })
             }
 
-            // Get the annotated image as base64 (without furniture pins)
-            const annotatedImage = tempCanvas.toDataURL('image/jpeg')
+            // Get the annotated image (without furniture pins)
+            const annotatedImage = await canvasToBlob(tempCanvas, 'image/jpeg')
 
             // Save the annotated image to backend
-            const saveResponse = await fetch('http://localhost:5000/save_canvas', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    original_image: uploadedImage,
-                    annotated_image: annotatedImage,
-                    furniture_pins: [] // No furniture pins for this use case
-                })
-            })
-
-            const result = await saveResponse.json()
+            const result = await saveCanvasImages(uploadedImage, annotatedImage)
 
             if (result.success) {
                 // Mark as saved (triggers navbar to show "No changes")
@@ -10,6 +10,47 @@ import {
 import { cn } from '../lib/utils'
 import { AddFurnitureModal } from './AddFurnitureModal'
 
+const CACHE_STORAGE_KEY = 'furnitureCache'
+
+// Convert cache object to array of furniture items, newest first
+function cacheToItems(cache) {
+  const items = []
+  for (const [hash, cacheItem] of Object.entries(cache)) {
+    if (cacheItem.products && cacheItem.products.length > 0) {
+      // Process each product from the cache
+      cacheItem.products.forEach((product, index) => {
+        const previewImage = product.images && product.images.length > 0
+          ? product.images[0]
+          : null
+        
+        items.push({
+          id: product.id || `${hash}_${index}`,
+          url: cacheItem.url,
+          title: product.title || 'Furniture Item',
+          name: product.title || 'Furniture Item',
+          price: product.price,
+          description: product.description,
+          dimensions: product.dimensions,
+          material: product.material,
+          color: product.color,
+          sku: product.sku,
+          availability: product.availability,
+          features: product.features,
+          previewImage,
+          images: product.images || [],
+          collage_path: cacheItem.collage_path,
+          source: new URL(cacheItem.url).hostname.replace('www.', ''),
+          timestamp: cacheItem.timestamp
+        })
+      })
+    }
+  }
+  
+  // Sort by timestamp (newest first)
+  items.sort((a, b) => (b.timestamp || '').localeCompare(a.timestamp || ''))
+  return items
+}
+
 export function Sidebar({ onFurnitureClick }) {
   const [isCollapsed, setIsCollapsed] = useState(false)
   const [searchQuery, setSearchQuery] = useState('')
@@ -18,51 +59,73 @@ export function Sidebar({ onFurnitureClick }) {
   
   // Load cached items on mount
   useEffect(() => {
+    const fetchCachePages = async (query, etag) => {
+      // Page through the cache so no single response carries the whole catalog
+      const cache = {}
+      let cursor = null
+      let nextSince = null
+      let total = null
+      let firstEtag = null
+      do {
+        const params = new URLSearchParams({ limit: '100', ...query })
+        if (cursor) params.set('cursor', cursor)
+        // Only the first page's query matches the stored ETag
+        const headers = !cursor && etag ? { 'If-None-Match': etag } : {}
+        const response = await fetch(`http://localhost:5000/cache?${params}`, { headers })
+        if (response.status === 304) return null
+        if (!response.ok) throw new Error(`Cache request failed: ${response.status}`)
+        const data = await response.json()
+        if (!data.success || !data.cache) throw new Error(data.error || 'Cache request failed')
+        if (!cursor) {
+          firstEtag = response.headers.get('ETag')
+          nextSince = data.next_since
+          total = data.total
+        }
+        Object.assign(cache, data.cache)
+        cursor = data.next_cursor
+      } while (cursor)
+      return { cache, nextSince, total, etag: firstEtag }
+    }
+
     const loadCachedItems = async () => {
       try {
-        const response = await fetch('http://localhost:5000/cache')
-        if (response.ok) {
-          const data = await response.json()
-          if (data.success && data.cache) {
-            // Convert cache object to array of furniture items
-            const items = []
-            for (const [hash, cacheItem] of Object.entries(data.cache)) {
-              if (cacheItem.products && cacheItem.products.length > 0) {
-                // Process each product from the cache
-                cacheItem.products.forEach((product, index) => {
-                  const previewImage = product.images && product.images.length > 0
-                    ? product.images[0]
-                    : null
-                  
-                  items.push({
-                    id: product.id || `${hash}_${index}`,
-                    url: cacheItem.url,
-                    title: product.title || 'Furniture Item',
-                    name: product.title || 'Furniture Item',
-                    price: product.price,
-                    description: product.description,
-                    dimensions: product.dimensions,
-                    material: product.material,
-                    color: product.color,
-                    sku: product.sku,
-                    availability: product.availability,
-                    features: product.features,
-                    previewImage,
-                    images: product.images || [],
-                    collage_path: cacheItem.collage_path,
-                    source: new URL(cacheItem.url).hostname.replace('www.', ''),
-                    timestamp: cacheItem.timestamp
-                  })
-                })
-              }
-            }
-            
-            // Sort by timestamp (newest first) and set items
-            items.sort((a, b) => (b.timestamp || '').localeCompare(a.timestamp || ''))
-            setFurnitureItems(items)
-            console.log(`Loaded ${items.length} cached furniture items`)
+        // Keep the catalog between visits and only ask for what changed since
+        let stored = null
+        try {
+          stored = JSON.parse(localStorage.getItem(CACHE_STORAGE_KEY))
+        } catch {
+          stored = null
+        }
+
+        let cache = stored?.cache || {}
+        let state = stored
+        if (stored?.nextSince != null) {
+          const delta = await fetchCachePages({ since: String(stored.nextSince) }, stored.etag)
+          if (delta) {
+            cache = { ...cache, ...delta.cache }
+            state = { cache, nextSince: delta.nextSince ?? stored.nextSince, etag: delta.etag }
+            // Deltas can't report removed entries; reload when some are gone
+            if (delta.total != null && delta.total < Object.keys(cache).length) state = null
           }
         }
+        if (!state || state.nextSince == null) {
+          const full = await fetchCachePages({}, null)
+          cache = full.cache
+          // The ETag belongs to the next delta query, not this one
+          state = { cache, nextSince: full.nextSince, etag: null }
+        }
+
+        try {
+          localStorage.setItem(CACHE_STORAGE_KEY, JSON.stringify(state))
+        } catch (error) {
+          console.warn('Could not store cached items:', error)
+        }
+
+        if (Object.keys(cache).length > 0) {
+          const items = cacheToItems(cache)
+          setFurnitureItems(items)
+          console.log(`Loaded ${items.length} cached furniture items`)
+        }
       } catch (error) {
         console.error('Failed to load cached items:', error)
       }
@@ -119,6 +182,12 @@ export function Sidebar({ onFurnitureClick }) {
     }
   }
 
+  const handleCollageReady = (url, collagePath) => {
+    setFurnitureItems(items => items.map(item =>
+      item.url === url ? { ...item, collage_path: collagePath } : item
+    ))
+  }
+
   const filteredItems = furnitureItems.filter(item =>
     item.name.toLowerCase().includes(searchQuery.toLowerCase()) ||
     item.source.toLowerCase().includes(searchQuery.toLowerCase()) ||
@@ -267,6 +336,7 @@ export function Sidebar({ onFurnitureClick }) {
         isOpen={isModalOpen}
         onClose={() => setIsModalOpen(false)}
         onAdd={handleAddFurniture}
+        onCollageReady={handleCollageReady}
       />
     </>
   )